@@ -3,3 +3,15 @@ from django.apps import AppConfig
 
 class AuthenticationConfig(AppConfig):
     name = 'authentication'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_delete, post_save
+
+        from .backends import forget_user
+
+        def user_changed(sender, instance, **kwargs):
+            forget_user(instance.pk)
+
+        post_save.connect(user_changed, sender=User, weak=False, dispatch_uid='authentication.forget_user')
+        post_delete.connect(user_changed, sender=User, weak=False, dispatch_uid='authentication.forget_user')
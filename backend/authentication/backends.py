@@ -0,0 +1,112 @@
+"""
+JWT authentication that keeps recently seen users in memory.
+
+simplejwt loads the user's row on every authenticated request, although
+views only read a handful of its fields. JWTAuthentication here keeps those
+fields, per process, in a small LRU cache (AUTH_USER_CACHE_SIZE entries,
+AUTH_USER_CACHE_TTL seconds) and rebuilds request.user from them as a User
+whose other fields are deferred: reading one of them (the password, say)
+loads it on demand, and save() only writes the cached fields.
+
+Saving or deleting a user drops its entry in the process that did it (see
+apps.py) and, once committed, replaces the user's version in the shared
+cache, as the response cache does (posts/cache.py). Entries remember the
+version they were read under, so other processes drop theirs on the next
+request instead of waiting for AUTH_USER_CACHE_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication as BaseJWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from posts.cache import bump_version, get_version
+from posts.profiling import span
+
+CACHED_FIELDS = {'id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser'}
+
+
+def user_scope(user_id):
+    return ('user', str(user_id))
+
+
+class UserCache:
+    """LRU of cached field values by user id (a string, as tokens carry it)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id, version):
+        """A User with the cached fields loaded, or None if there's no entry for `version`."""
+        key = str(user_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_version, values = entry
+            if expires <= time.monotonic() or entry_version != version:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return User.from_db(DEFAULT_DB_ALIAS, _field_names(), values)
+
+    def put(self, user_id, user, version):
+        if settings.AUTH_USER_CACHE_SIZE <= 0:
+            return
+        key = str(user_id)
+        values = tuple(getattr(user, name) for name in _field_names())
+        with self.lock:
+            self.entries[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, version, values)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _field_names():
+    # Model.from_db() expects the loaded fields in model order
+    return [field.attname for field in User._meta.concrete_fields if field.attname in CACHED_FIELDS]
+
+
+user_cache = UserCache()
+
+
+def forget_user(user_id):
+    """Drop `user_id`'s entries: in this process now, in the others once the change commits."""
+    user_cache.discard(user_id)
+    transaction.on_commit(lambda: bump_version(user_scope(user_id)))
+
+
+class JWTAuthentication(BaseJWTAuthentication):
+    """simplejwt's authentication with cached users, timed as 'auth' by the request profiler."""
+
+    def authenticate(self, request):
+        with span('auth'):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        # Revocation checks compare against the password hash, which isn't cached
+        if user_id is None or api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        # Read before the user is, so a change committed meanwhile isn't cached under it
+        version = get_version(user_scope(user_id))
+        user = user_cache.get(user_id, version)
+        if user is None:
+            # Raises for unknown and inactive users, so only active ones are cached
+            user = super().get_user(validated_token)
+            user_cache.put(user_id, user, version)
+        return user
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from authentication.revocation import prune_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tokens deleted per transaction',
+        )
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=0,
+            help='Keep running and prune again every this many seconds (default: prune once and exit)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            outstanding, blacklisted = prune_expired(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Removed {outstanding} expired tokens ({blacklisted} of them blacklisted)'
+            ))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,155 @@
+"""
+Revoked refresh tokens, checked without a database query in the common case.
+
+Logging out and rotating a refresh token blacklist it (simplejwt's
+OutstandingToken and BlacklistedToken tables), and every refresh checks the
+presented token against that list. Each process keeps a bloom filter of the
+jtis of revoked tokens that have not expired yet, so a token that was never
+revoked - nearly every token presented - is let through from memory; only
+tokens the filter might contain (revoked ones, plus roughly a
+REVOCATION_FILTER_ERROR_RATE share of the others) are looked up.
+
+Processes keep their filters current through a version in the shared cache,
+as the response cache does (posts/cache.py): each revocation replaces it
+once committed, and a process that sees a new version reads the rows added
+since its last sync before answering. The version is only a shortcut: a
+process also reads new rows once REVOCATION_FILTER_SYNC_INTERVAL seconds
+have passed since its last sync, so a cache that isn't shared between
+workers (or loses the key) delays a revocation by that long. A sync only
+reads ids past the last one seen (less RESYNC_OVERLAP), so a revocation
+whose transaction commits long after later ids could still be missed; the
+filter is therefore also rebuilt from every row each
+REVOCATION_FILTER_REBUILD_INTERVAL seconds, which bounds how long any
+revocation can go unseen. Expired tokens are left out of the filter, since
+they fail validation anyway, and it is rebuilt once it holds more than its
+capacity.
+
+`manage.py prune_tokens` deletes expired outstanding and blacklisted tokens in
+batches, so neither table grows without bound.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from posts.cache import bump_version, get_version
+
+# Rows below the last one read that are read again on every sync, so a
+# revocation committed after a later one (ids are handed out before commit)
+# isn't skipped
+RESYNC_OVERLAP = 100
+
+
+def revocation_scope():
+    return ('revocations',)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * second) % self.size for n in range(self.hashes)]
+
+    def add(self, item):
+        if item in self:
+            return
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+        self.last_id = 0
+        self.synced_at = 0
+        self.rebuilt_at = 0
+
+    def might_contain(self, jti):
+        version = get_version(revocation_scope())
+        with self.lock:
+            if (self.bloom is None or self.bloom.count > self.bloom.capacity
+                    or time.monotonic() - self.rebuilt_at >= settings.REVOCATION_FILTER_REBUILD_INTERVAL):
+                self._rebuild(version)
+            elif (version != self.version
+                  or time.monotonic() - self.synced_at >= settings.REVOCATION_FILTER_SYNC_INTERVAL):
+                self._sync(version)
+            return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+    def _rebuild(self, version):
+        live = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        self.synced_at = self.rebuilt_at = time.monotonic()
+        capacity = max(settings.REVOCATION_FILTER_CAPACITY, 2 * live.count())
+        self.bloom = BloomFilter(capacity, settings.REVOCATION_FILTER_ERROR_RATE)
+        self.last_id = 0
+        self._read(live.order_by('id').values_list('id', 'token__jti').iterator(chunk_size=10000))
+        self.version = version
+
+    def _sync(self, version):
+        # The version is read before the rows, so a revocation committed meanwhile changes it again
+        self.synced_at = time.monotonic()
+        rows = BlacklistedToken.objects.filter(id__gt=self.last_id - RESYNC_OVERLAP).values_list('id', 'token__jti')
+        self._read(rows)
+        self.version = version
+
+    def _read(self, rows):
+        for pk, jti in rows:
+            self.bloom.add(jti)
+            self.last_id = max(self.last_id, pk)
+
+
+revocations = RevocationFilter()
+
+
+def is_revoked(jti):
+    if not revocations.might_contain(jti):
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def record_revocation(jti):
+    """Note a token just blacklisted: in this process now, in the others once it commits."""
+    revocations.add(jti)
+    transaction.on_commit(lambda: bump_version(revocation_scope()))
+
+
+def prune_expired(batch_size=1000):
+    """Delete expired outstanding tokens and their blacklist entries; returns (outstanding, blacklisted) removed."""
+    now = timezone.now()
+    outstanding = blacklisted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now).order_by().values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return outstanding, blacklisted
+        with transaction.atomic():
+            blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
@@ -1,3 +1,159 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from posts.cache import bump_version
+from posts.models import Post
+
+from . import revocation
+from .backends import user_cache, user_scope
+from .revocation import BloomFilter, is_revoked, revocations
+
+
+class CachedUserAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(username='writer', email='writer@example.com', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.client.get('/blog/api/auth/me/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/blog/api/auth/me/')
+        self.assertEqual(response.json(), {'id': self.user.pk, 'username': 'writer', 'email': 'writer@example.com'})
+
+    def test_cached_user_can_author_posts(self):
+        self.client.get('/blog/api/auth/me/')
+        response = self.client.post('/blog/api/posts/', {'title': 'Cached author', 'blocks': []}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.objects.get(slug=response.json()['slug']).author, self.user)
+
+    def test_deactivating_the_user_drops_the_cache_entry(self):
+        self.assertEqual(self.client.get('/blog/api/auth/me/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/blog/api/auth/me/').status_code, 401)
+
+    def test_changes_made_by_other_processes_drop_the_cache_entry(self):
+        self.assertEqual(self.client.get('/blog/api/auth/me/').status_code, 200)
+        # What another worker's save does here: no local discard, just the shared version
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        bump_version(user_scope(self.user.pk))
+        self.assertEqual(self.client.get('/blog/api/auth/me/').status_code, 401)
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_entries_expire(self):
+        self.client.get('/blog/api/auth/me/')
+        with self.assertNumQueries(1):
+            self.client.get('/blog/api/auth/me/')
+
+    @override_settings(AUTH_USER_CACHE_SIZE=1)
+    def test_cache_is_bounded(self):
+        other = User.objects.create_user(username='other', password='password')
+        self.client.get('/blog/api/auth/me/')
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        other_client.get('/blog/api/auth/me/')
+        self.assertEqual(list(user_cache.entries), [str(other.pk)])
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        revocations.reset()
+        self.addCleanup(revocations.reset)
+        self.user = User.objects.create_user(username='writer', password='password')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/blog/api/auth/refresh/', {'refresh': token}, format='json')
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        first = str(RefreshToken.for_user(self.user))
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(first).status_code, 401)
+
+        second = response.json()['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.json()["access"]}')
+        self.client.post('/blog/api/auth/logout/', {'refresh': second}, format='json')
+        self.assertEqual(self.refresh(second).status_code, 401)
+
+    def test_unrevoked_tokens_are_checked_without_queries(self):
+        is_revoked('warm-up')
+        with self.assertNumQueries(0):
+            self.assertFalse(is_revoked('never-revoked'))
+
+    def test_revocations_by_other_processes_are_picked_up(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertFalse(is_revoked(token['jti']))
+
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        bump_version(revocation.revocation_scope())
+        self.assertTrue(is_revoked(token['jti']))
+
+    @override_settings(REVOCATION_FILTER_SYNC_INTERVAL=5)
+    def test_revocations_are_picked_up_without_a_shared_cache(self):
+        token = RefreshToken.for_user(self.user)
+        # Two workers whose caches never see each other's versions
+        first, second = revocation.RevocationFilter(), revocation.RevocationFilter()
+        clock = mock.patch.object(revocation.time, 'monotonic', return_value=1000.0)
+        with mock.patch.object(revocation, 'get_version', return_value='unshared'), clock as now:
+            self.assertFalse(second.might_contain(token['jti']))
+
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+            first.add(token['jti'])
+            self.assertTrue(first.might_contain(token['jti']))
+
+            now.return_value = 1005.0
+            self.assertTrue(second.might_contain(token['jti']))
+
+    @override_settings(REVOCATION_FILTER_SYNC_INTERVAL=5, REVOCATION_FILTER_REBUILD_INTERVAL=300)
+    def test_revocations_skipped_by_syncs_are_picked_up_by_the_rebuild(self):
+        token = RefreshToken.for_user(self.user)
+        worker = revocation.RevocationFilter()
+        clock = mock.patch.object(revocation.time, 'monotonic', return_value=1000.0)
+        with mock.patch.object(revocation, 'get_version', return_value='unshared'), clock as now:
+            self.assertFalse(worker.might_contain(token['jti']))
+
+            # Committed after rows far past it had already been read
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+            worker.last_id += 10 * revocation.RESYNC_OVERLAP
+            now.return_value = 1005.0
+            self.assertFalse(worker.might_contain(token['jti']))
+
+            now.return_value = 1300.0
+            self.assertTrue(worker.might_contain(token['jti']))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        items = [f'token-{n}' for n in range(1000)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+        false_positives = sum(f'other-{n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_prune_tokens_removes_expired_tokens_in_batches(self):
+        live = RefreshToken.for_user(self.user)
+        now = timezone.now()
+        expired = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=self.user, jti=f'expired-{n}', token='', expires_at=now - timedelta(minutes=1))
+            for n in range(5)
+        ])
+        BlacklistedToken.objects.create(token=expired[0])
+
+        out = StringIO()
+        call_command('prune_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('Removed 5 expired tokens (1 of them blacklisted)', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
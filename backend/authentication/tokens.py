@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .revocation import is_revoked, record_revocation
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    simplejwt's refresh token, with revocation checked through the bloom
+    filter in revocation.py. Blacklisting and outstanding a token don't load
+    the user again, which simplejwt does for each.
+    """
+
+    def check_blacklist(self):
+        if is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        token = OutstandingToken.objects.filter(jti=jti).first()
+        if token is None:
+            # Issued before the blacklist app was installed
+            blacklisted = super().blacklist()
+        else:
+            blacklisted = BlacklistedToken.objects.get_or_create(token=token)
+        record_revocation(jti)
+        return blacklisted
+
+    def outstand(self):
+        # Called after rotation gave the token a new jti, so there's nothing to get
+        return OutstandingToken.objects.create(
+            user_id=self.payload.get(api_settings.USER_ID_CLAIM),
+            jti=self.payload[api_settings.JTI_CLAIM],
+            token=str(self),
+            created_at=self.current_time,
+            expires_at=datetime_from_epoch(self.payload['exp']),
+        ), True
@@ -2,10 +2,11 @@ import os
 from rest_framework import status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 
+from .tokens import RefreshToken
+
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
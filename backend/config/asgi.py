@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Serve public post reads with the async views (posts/async_views.py)
+os.environ.setdefault('ASYNC_READS', 'True')
 
 application = get_asgi_application()
@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.metrics.MetricsMiddleware',
+    'posts.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -71,6 +73,25 @@ if os.getenv('USE_POSTGRES', 'False') == 'True':
             'PORT': os.getenv('DB_PORT', '5432'),
         }
     }
+    # Each process keeps a pool of connections (psycopg 3), opened on its first
+    # query - after gunicorn forks, so workers never share one. Keep
+    # WEB_WORKERS * DB_POOL_MAX_SIZE (plus the media worker's pool) below the
+    # server's max_connections. Connections are checked before being handed out
+    # and replaced after DB_POOL_MAX_LIFETIME seconds. With DB_POOL=False each
+    # thread keeps one connection for DB_CONN_MAX_AGE seconds instead.
+    if os.getenv('DB_POOL', 'True') == 'True':
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+                'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
 else:
     DATABASES = {
         'default': {
@@ -79,6 +100,59 @@ else:
         }
     }
 
+# Cache
+# Local memory is per process; set CACHE_DIR to share a file cache between
+# gunicorn workers so invalidations are seen by all of them. Responses are
+# cached per URL, page and format, so keep CACHE_MAX_ENTRIES well above the
+# number of public pages; past it, 1/CACHE_CULL_FREQUENCY of the entries are
+# dropped on the next write.
+CACHE_OPTIONS = {
+    'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '50000')),
+    'CULL_FREQUENCY': int(os.getenv('CACHE_CULL_FREQUENCY', '3')),
+}
+if os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'blog',
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+
+# Seconds a rendered public post response stays cached (posts/cache.py)
+POSTS_CACHE_TIMEOUT = int(os.getenv('POSTS_CACHE_TIMEOUT', '86400'))
+
+# Prometheus metrics at /blog/api/metrics (posts/metrics.py). Workers share
+# counters through files in METRICS_DIR (empty keeps them in process memory);
+# clear a host's files when its server starts. Scrapes send
+# `Authorization: Bearer <METRICS_TOKEN>`; with no token set the endpoint is
+# only served when DEBUG is on.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Request profiling (posts/profiling.py): the share of requests (0-1) that get
+# a Server-Timing header, and the duration above which they are logged with
+# their most expensive SQL. 0 takes the middleware out of the stack.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SLOW_MS = int(os.getenv('PROFILING_SLOW_MS', '500'))
+PROFILING_TOP_QUERIES = int(os.getenv('PROFILING_TOP_QUERIES', '5'))
+
+# Static pre-rendered copies of the public reads, served by nginx before
+# Django (posts/prerender.py). Empty disables it. PRERENDER_BASE_URL is the
+# public origin that absolute URLs in the files are built from; its host must
+# be in ALLOWED_HOSTS.
+PRERENDER_ROOT = os.getenv('PRERENDER_ROOT', '')
+PRERENDER_BASE_URL = os.getenv('PRERENDER_BASE_URL', 'http://localhost')
+PRERENDER_HTML = os.getenv('PRERENDER_HTML', 'False') == 'True'
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -98,6 +172,30 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/blog/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# How /blog/media/ is delivered (posts/serving.py):
+#   'django'   - stream from the worker, with Range support (development)
+#   'nginx'    - X-Accel-Redirect to the internal MEDIA_ACCEL_PREFIX location
+#   'sendfile' - X-Sendfile with the absolute path (Apache/lighttpd)
+MEDIA_SERVE_MODE = os.getenv('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Background media jobs (posts/jobs.py), processed by `manage.py run_media_jobs`.
+# MEDIA_JOBS_EAGER runs them inside the request instead, for setups without a worker.
+MEDIA_JOBS_EAGER = os.getenv('MEDIA_JOBS_EAGER', 'False') == 'True'
+MEDIA_JOBS_MAX_ATTEMPTS = int(os.getenv('MEDIA_JOBS_MAX_ATTEMPTS', '5'))
+MEDIA_JOBS_STALE_AFTER = int(os.getenv('MEDIA_JOBS_STALE_AFTER', '600'))
+
+# Responsive image derivatives, built on first request (posts/images.py).
+# Formats are listed in order of preference.
+IMAGE_DERIVATIVE_WIDTHS = [int(w) for w in os.getenv('IMAGE_DERIVATIVE_WIDTHS', '320,640,1024,1600').split(',')]
+IMAGE_DERIVATIVE_FORMATS = [f.strip() for f in os.getenv('IMAGE_DERIVATIVE_FORMATS', 'avif,webp').split(',')]
+
+# Media audits for list_media / clean_orphaned_media (posts/audit.py). The
+# manifest lets later runs skip unchanged directories; keep it outside
+# MEDIA_ROOT so it is never served.
+MEDIA_AUDIT_MANIFEST = os.getenv('MEDIA_AUDIT_MANIFEST') or str(BASE_DIR / 'media_audit_manifest.json')
+MEDIA_AUDIT_WORKERS = int(os.getenv('MEDIA_AUDIT_WORKERS', '8'))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS
@@ -108,18 +206,56 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.backends.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 }
 
+# Answer anonymous post reads with async views (posts/async_views.py); on by
+# default when serving through config/asgi.py, off under WSGI where each
+# async view would need its own event loop
+ASYNC_READS = os.getenv('ASYNC_READS', 'False') == 'True'
+
+# Post feeds use keyset pagination (posts/pagination.py)
+POSTS_PAGE_SIZE = int(os.getenv('POSTS_PAGE_SIZE', '20'))
+POSTS_MAX_PAGE_SIZE = int(os.getenv('POSTS_MAX_PAGE_SIZE', '100'))
+
+# Posts in each RSS/Atom/JSON feed (posts/feeds.py)
+POSTS_FEED_SIZE = int(os.getenv('POSTS_FEED_SIZE', '20'))
+
+# Posts per sitemap file (posts/sitemaps.py); the sitemap protocol allows up to 50000
+SITEMAP_SHARD_SIZE = int(os.getenv('SITEMAP_SHARD_SIZE', '10000'))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'authentication.serializers.TokenRefreshSerializer',
 }
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
\ No newline at end of file
+# Bloom filter of revoked refresh tokens (authentication/revocation.py). It
+# grows past the capacity when more unexpired tokens are revoked; the error
+# rate is the share of valid tokens that still need a database lookup. Each
+# process also reads new revocations at least every SYNC_INTERVAL seconds
+# when the cache isn't shared (no CACHE_DIR), and rebuilds its filter every
+# REBUILD_INTERVAL seconds, which bounds how long any revocation can go unseen.
+REVOCATION_FILTER_CAPACITY = int(os.getenv('REVOCATION_FILTER_CAPACITY', '100000'))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv('REVOCATION_FILTER_ERROR_RATE', '0.001'))
+REVOCATION_FILTER_SYNC_INTERVAL = float(os.getenv('REVOCATION_FILTER_SYNC_INTERVAL', '5'))
+REVOCATION_FILTER_REBUILD_INTERVAL = float(os.getenv('REVOCATION_FILTER_REBUILD_INTERVAL', '300'))
+
+# Per-process cache of authenticated users (authentication/backends.py). Other
+# processes see a deactivated account within AUTH_USER_CACHE_TTL seconds; a
+# size of 0 loads the user on every request.
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', '1024'))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '30'))
+
+FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Chunked uploads (posts/uploads.py)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(4 * 1024 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 60 * 60)))
\ No newline at end of file
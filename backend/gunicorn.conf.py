@@ -0,0 +1,26 @@
+"""
+Gunicorn settings, read from the working directory by the Docker entrypoint.
+
+SERVER_PROFILE picks the worker type:
+
+    wsgi  sync workers on config.wsgi (the default); each request holds a
+          worker until it is done
+    asgi  uvicorn workers on config.asgi; anonymous post reads are served by
+          the async views (posts/async_views.py), so a worker keeps answering
+          other readers while one waits on the database
+
+WEB_WORKERS sets the number of worker processes for either profile.
+"""
+import os
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', '1'))
+# Load Django in each worker rather than in the master, so every worker opens
+# its own database pool (config/settings.py) instead of inheriting sockets
+preload_app = False
+
+if os.getenv('SERVER_PROFILE', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    wsgi_app = 'config.asgi:application'
+else:
+    wsgi_app = 'config.wsgi:application'
@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import Post, Media
+from .models import Post, Media, MediaJob
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'status', 'created_at', 'published_at']
-    list_filter = ['status', 'created_at', 'author']
+    list_display = ['title', 'author', 'status', 'media_status', 'created_at', 'published_at']
+    list_filter = ['status', 'media_status', 'created_at', 'author']
     search_fields = ['title', 'description']
     prepopulated_fields = {'slug': ('title',)}
     readonly_fields = ['created_at', 'updated_at']
@@ -17,3 +17,10 @@ class MediaAdmin(admin.ModelAdmin):
     list_filter = ['media_type', 'created_at']
     search_fields = ['filename', 'alt_text']
     readonly_fields = ['file_size', 'created_at']
+
+
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ['post', 'kind', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['created_at', 'updated_at']
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, profiling
+
+        connection_created.connect(metrics.install_query_counter, dispatch_uid='posts.metrics.count_queries')
+        connection_created.connect(profiling.install_query_recorder, dispatch_uid='posts.profiling.record_queries')
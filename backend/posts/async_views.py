@@ -0,0 +1,109 @@
+"""
+Async versions of the public post reads, for ASGI deployments.
+
+With ASYNC_READS on, anonymous JSON reads of the post list, a post, and an
+author's posts or post are answered here instead of by the DRF views. They
+query through Django's async ORM and read the response cache through the
+async cache API, so one ASGI worker keeps serving other readers while a
+request waits on the database. Responses, ETags and cache entries are the
+same as the sync views produce.
+
+Everything else on those routes - writes, signed-in readers (who may see
+their own drafts), the browsable API and explicit formats - goes to the
+sync view as before.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import URLPattern
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .cache import acached_response, feed_scope, newest_update, post_scope
+from .models import Post
+from .pagination import PublishedPostPagination
+from .serializers import PostDetailSerializer, PostListSerializer
+
+
+def is_public_read(request, kwargs):
+    return (
+        request.method in ('GET', 'HEAD')
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and 'text/html' not in request.headers.get('Accept', '')
+        and 'format' not in request.GET
+        and 'format' not in kwargs
+    )
+
+
+def async_read_patterns(urls):
+    """`urls` with the public reads of the post routes answered by the views below."""
+    reads = {
+        'post-list': post_list,
+        'post-detail': post_detail,
+        'user-posts': user_posts,
+        'user-post-detail': user_posts,
+    }
+    return [with_async_reads(url, reads[url.name]) if url.name in reads else url for url in urls]
+
+
+def with_async_reads(pattern, read):
+    """A copy of URL `pattern` whose public reads are answered by the coroutine `read`."""
+    sync_view = sync_to_async(pattern.callback)
+
+    async def view(request, *args, **kwargs):
+        if not is_public_read(request, kwargs):
+            return await sync_view(request, *args, **kwargs)
+        try:
+            return await read(Request(request), *args, **kwargs)
+        except Http404 as e:
+            # The body DRF gives a NotFound
+            return HttpResponse(JSONRenderer().render({'detail': str(e)}), status=404,
+                                content_type=JSONRenderer.media_type)
+
+    view.__name__ = pattern.callback.__name__
+    # DRF's views are CSRF exempt (JWT writes carry no cookie); the wrapper has to be too
+    view.csrf_exempt = getattr(pattern.callback, 'csrf_exempt', False)
+    # For callers outside a request, like the pre-renderer, that need a plain response
+    view.sync_view = pattern.callback
+    return URLPattern(pattern.pattern, view, pattern.default_args, pattern.name)
+
+
+def _published():
+    return Post.objects.filter(status=Post.Status.PUBLISHED).select_related('author')
+
+
+async def post_list(request):
+    async def render():
+        paginator = PublishedPostPagination()
+        page = await paginator.apaginate_queryset(_published(), request)
+        serializer = PostListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data).data, newest_update(page)
+
+    return await acached_response(request, feed_scope(), render)
+
+
+async def post_detail(request, slug):
+    async def render():
+        post = await aget_object_or_404(_published().prefetch_related('media'), slug=slug)
+        return PostDetailSerializer(post, context={'request': request}).data, post.updated_at
+
+    return await acached_response(request, post_scope(slug), render)
+
+
+async def user_posts(request, username, slug=None):
+    async def render_post():
+        user = await aget_object_or_404(User, username=username)
+        post = await aget_object_or_404(_published().prefetch_related('media'), author=user, slug=slug)
+        return PostDetailSerializer(post, context={'request': request}).data, post.updated_at
+
+    async def render_feed():
+        user = await aget_object_or_404(User, username=username)
+        paginator = PublishedPostPagination()
+        page = await paginator.apaginate_queryset(_published().filter(author=user), request)
+        serializer = PostListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data).data, newest_update(page)
+
+    if slug:
+        return await acached_response(request, post_scope(slug), render_post)
+    return await acached_response(request, feed_scope(username), render_feed)
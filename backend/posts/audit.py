@@ -0,0 +1,247 @@
+"""
+Media audit engine behind `list_media` and `clean_orphaned_media`.
+
+Scanning MEDIA_ROOT runs os.scandir over directories in a thread pool
+(scandir releases the GIL, so directory reads overlap). The listing of every
+directory is saved to a manifest (MEDIA_AUDIT_MANIFEST) together with the
+directory's mtime. A directory's mtime changes whenever an entry is added,
+removed or renamed, so on the next run unchanged directories are taken from
+the manifest after a single stat instead of being listed again. Media
+files are write-once, so sizes read from the manifest stay correct.
+
+Media rows are streamed with .iterator() as plain tuples and matched
+against the scan, so neither side is ever loaded as model instances.
+
+The blob store (posts/blobs.py) is checked separately: a blob whose hash no
+Media row carries and whose only other links are orphaned files is orphaned
+too, since deleting those files would leave it unreachable.
+"""
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .blobs import BLOB_DIR
+from .images import source_name
+from .models import Media
+
+MANIFEST_VERSION = 1
+MEDIA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.mp4', '.webm', '.mov')
+
+# Blob store, chunked-upload temp files and the legacy covers folder aren't per-post media
+SKIP_DIRS = {BLOB_DIR, '.chunked', 'covers'}
+
+# A directory modified this close to the scan may still change within the
+# same mtime tick; don't trust its manifest entry next time
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class Scan:
+    """Result of scanning MEDIA_ROOT: media files by relative name, plus how much work it took."""
+
+    def __init__(self, files, dirs_scanned, dirs_reused):
+        self.files = files
+        self.dirs_scanned = dirs_scanned
+        self.dirs_reused = dirs_reused
+
+
+def scan_media(workers=None, use_manifest=True):
+    """Map every media file under MEDIA_ROOT to (size, mtime_ns)."""
+    media_root = str(settings.MEDIA_ROOT)
+    workers = workers or settings.MEDIA_AUDIT_WORKERS
+    previous = _load_manifest(media_root) if use_manifest else {}
+    started_ns = time.time_ns()
+
+    listings = {}
+    dirs_scanned = dirs_reused = 0
+    if os.path.isdir(media_root):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(_list_dir, media_root, '', previous.get(''))}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir, listing, rescanned = future.result()
+                    if listing is None:
+                        # Removed while we were scanning
+                        continue
+                    listings[rel_dir] = listing
+                    if rescanned:
+                        dirs_scanned += 1
+                    else:
+                        dirs_reused += 1
+                    for name in listing['dirs']:
+                        child = f'{rel_dir}/{name}' if rel_dir else name
+                        pending.add(pool.submit(_list_dir, media_root, child, previous.get(child)))
+
+    if use_manifest:
+        _save_manifest(media_root, listings, started_ns)
+
+    files = {}
+    for rel_dir, listing in listings.items():
+        for name, (size, mtime_ns) in listing['files'].items():
+            if name.lower().endswith(MEDIA_EXTENSIONS):
+                files[f'{rel_dir}/{name}' if rel_dir else name] = (size, mtime_ns)
+    return Scan(files, dirs_scanned, dirs_reused)
+
+
+def media_rows(scan):
+    """
+    Stream every Media row, newest first, as a dict with an `exists` flag
+    taken from `scan` instead of a per-row stat.
+    """
+    rows = (
+        Media.objects.order_by('-created_at')
+        .values_list('id', 'filename', 'file', 'file_size', 'post__slug', 'created_at')
+        .iterator(chunk_size=2000)
+    )
+    for pk, filename, name, file_size, post_slug, created_at in rows:
+        yield {
+            'id': str(pk),
+            'filename': filename,
+            'path': name,
+            'size': file_size or 0,
+            'post': post_slug,
+            'uploaded': created_at.isoformat(),
+            'exists': bool(name) and name in scan.files,
+        }
+
+
+def find_orphans(scan):
+    """Media files on disk that no Media row points at, as sorted (name, size) pairs."""
+    referenced = set()
+    names = Media.objects.exclude(file='').values_list('file', flat=True).iterator(chunk_size=2000)
+    for name in names:
+        if name in scan.files:
+            referenced.add(name)
+
+    orphans = []
+    for name, (size, _) in scan.files.items():
+        if name in referenced:
+            continue
+        # Image derivatives belong to their original; they are only orphaned with it
+        if source_name(name) in referenced:
+            continue
+        orphans.append((name, size))
+    return sorted(orphans)
+
+
+def find_orphaned_blobs(orphans=()):
+    """
+    Blobs that no Media row references and that nothing links to apart from
+    the orphaned files in `orphans`, as sorted (digest, size) pairs.
+    """
+    media_root = str(settings.MEDIA_ROOT)
+    stats = {}
+    blob_root = os.path.join(media_root, BLOB_DIR)
+    for first in _subdirs(blob_root):
+        for second in _subdirs(first):
+            with os.scandir(second) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        stats[entry.name] = entry.stat(follow_symlinks=False)
+
+    digests = list(stats)
+    for start in range(0, len(digests), 2000):
+        batch = digests[start:start + 2000]
+        for digest in Media.objects.filter(content_hash__in=batch).values_list('content_hash', flat=True):
+            stats.pop(digest, None)
+
+    # Links that go away when the orphaned files are deleted
+    orphan_links = Counter()
+    for name, _ in orphans:
+        try:
+            stat = os.stat(os.path.join(media_root, name))
+        except FileNotFoundError:
+            continue
+        orphan_links[stat.st_dev, stat.st_ino] += 1
+
+    return sorted(
+        (digest, stat.st_size) for digest, stat in stats.items()
+        if stat.st_nlink - orphan_links[stat.st_dev, stat.st_ino] <= 1
+    )
+
+
+def add_scan_arguments(parser):
+    """Command-line options shared by the commands built on this module."""
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print a machine-readable JSON report instead of text',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Directories scanned in parallel (default: MEDIA_AUDIT_WORKERS)',
+    )
+    parser.add_argument(
+        '--full-scan',
+        action='store_true',
+        help='Ignore the manifest and list every directory again',
+    )
+
+
+def _subdirs(path):
+    # The blob store is two levels of two-character folders; skip its tmp folder
+    try:
+        with os.scandir(path) as entries:
+            return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False) and len(entry.name) == 2]
+    except FileNotFoundError:
+        return []
+
+
+def _list_dir(media_root, rel_dir, cached):
+    path = os.path.join(media_root, rel_dir)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if cached and cached.get('mtime_ns') == mtime_ns:
+            return rel_dir, cached, False
+
+        files, dirs = {}, []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        dirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        return rel_dir, None, True
+    return rel_dir, {'mtime_ns': mtime_ns, 'files': files, 'dirs': dirs}, True
+
+
+def _load_manifest(media_root):
+    try:
+        with open(settings.MEDIA_AUDIT_MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('media_root') != media_root:
+        return {}
+    return manifest.get('dirs', {})
+
+
+def _save_manifest(media_root, listings, started_ns):
+    dirs = {}
+    for rel_dir, listing in listings.items():
+        if started_ns - listing['mtime_ns'] < RACY_WINDOW_NS:
+            listing = {**listing, 'mtime_ns': None}
+        dirs[rel_dir] = listing
+    manifest = {'version': MANIFEST_VERSION, 'media_root': media_root, 'dirs': dirs}
+
+    path = settings.MEDIA_AUDIT_MANIFEST
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
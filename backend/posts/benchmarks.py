@@ -0,0 +1,621 @@
+"""
+Benchmark scenarios run by `python manage.py benchmark <scenario>`.
+
+Each scenario seeds the data it needs inside a transaction that is rolled
+back afterwards (files go to a temporary media root), so it is safe to run
+against a development database.
+Scenarios are generators that yield one result row (a dict) per measurement.
+"""
+import http.client
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, reset_queries, transaction
+from django.db.models import Q
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.views.static import serve
+
+from . import search
+from .models import Media, Post
+from .pagination import PublishedPostPagination
+from .serving import serve_media
+
+SCENARIOS = {}
+
+
+def scenario(name, help=''):
+    """Register a benchmark scenario under `name`."""
+    def register(func):
+        func.help = help
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction and discard everything it wrote."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def api_client():
+    """A test client that is allowed to talk to the local URLconf."""
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        yield Client()
+
+
+def measure(func, repeat):
+    """Call func `repeat` times and return the median wall time in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def percentiles(timings):
+    """The p50, p95 and p99 of `timings`."""
+    if len(timings) < 2:
+        return timings[0], timings[0], timings[0]
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def time_requests(send, repeat):
+    """
+    Call send() `repeat` times; returns the latency percentiles in
+    milliseconds and the median number of queries per request.
+    """
+    timings, query_counts = [], []
+    for _ in range(repeat):
+        # The request resets the query log, so start counting from an empty one
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = send()
+            timings.append((time.perf_counter() - start) * 1000)
+        query_counts.append(len(queries))
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code} from {response.request["PATH_INFO"]}: {response.content[:200]}')
+    p50, p95, p99 = percentiles(timings)
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'queries': int(statistics.median(query_counts))}
+
+
+def seed_posts(author, count, status=Post.Status.PUBLISHED, blocks=None):
+    """Bulk insert `count` posts for `author`, newest first, one minute apart."""
+    now = timezone.now()
+    posts = []
+    for i in range(count):
+        stamp = now - timedelta(minutes=i)
+        posts.append(Post(
+            author=author,
+            title=f'Benchmark post {i}',
+            slug=f'bench-{uuid.uuid4().hex[:12]}',
+            description='Seeded by the benchmark command',
+            blocks=blocks if blocks is not None else [],
+            status=status,
+            published_at=stamp if status == Post.Status.PUBLISHED else None,
+        ))
+    return Post.objects.bulk_create(posts, batch_size=500)
+
+
+def seed_user(prefix='bench'):
+    return User.objects.create_user(username=f'{prefix}-{uuid.uuid4().hex[:8]}', password='benchmark')
+
+
+@scenario('pagination', help='Author feed latency for the first and a deep page as the post count grows')
+def bench_pagination(sizes, repeat):
+    for size in sizes:
+        with rolled_back(), api_client() as client:
+            author = seed_user()
+            seed_posts(author, size)
+            url = f'/blog/api/users/{author.username}/posts/'
+
+            # Cursor pointing one page before the oldest post: the deepest page a reader can reach
+            page_size = PublishedPostPagination().page_size
+            ordered = Post.objects.filter(author=author).order_by('published_at', 'id')
+            anchor = ordered[min(page_size, size - 1)]
+            deep_cursor = PublishedPostPagination.encode_cursor(anchor.published_at, anchor.pk)
+
+            # What the same page would cost with OFFSET/LIMIT, for comparison
+            offset = max(size - page_size, 0)
+            feed = Post.objects.filter(author=author).order_by('-published_at', '-id')
+
+            yield {
+                'posts': size,
+                'first_page_ms': measure(lambda: client.get(url), repeat),
+                'deep_page_ms': measure(lambda: client.get(url, {'cursor': deep_cursor}), repeat),
+                'offset_deep_page_ms': measure(lambda: list(feed[offset:offset + page_size]), repeat),
+            }
+
+
+def _drain(response):
+    """Consume a response body the way a WSGI server would."""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+
+
+@scenario('media', help='Worker time per media request: static.serve vs serve_media modes (sizes in KB)')
+def bench_media(sizes, repeat):
+    factory = RequestFactory()
+    media_root = tempfile.mkdtemp(prefix='blog-bench-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            for size_kb in sizes:
+                name = f'bench-{size_kb}kb.mp4'
+                with open(os.path.join(media_root, name), 'wb') as f:
+                    f.write(os.urandom(size_kb * 1024))
+
+                url = f'/blog/media/{name}'
+                plain = factory.get(url)
+                ranged = factory.get(url, HTTP_RANGE='bytes=0-1048575')
+                row = {
+                    'size_kb': size_kb,
+                    'static_serve_ms': measure(lambda: _drain(serve(plain, name, document_root=media_root)), repeat),
+                    'static_serve_range_ms': measure(lambda: _drain(serve(ranged, name, document_root=media_root)), repeat),
+                }
+                for mode in ['django', 'nginx', 'sendfile']:
+                    with override_settings(MEDIA_SERVE_MODE=mode):
+                        row[f'{mode}_ms'] = measure(lambda: _drain(serve_media(plain, name)), repeat)
+                        if mode == 'django':
+                            row['django_range_ms'] = measure(lambda: _drain(serve_media(ranged, name)), repeat)
+
+                # Requests per second one worker could sustain in each mode
+                row['static_serve_rps'] = 1000 / row['static_serve_ms']
+                row['nginx_rps'] = 1000 / row['nginx_ms']
+                yield row
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def _seed_upload_post(author, images):
+    """A post whose blocks reference `images` freshly uploaded files, a third of them in image rows."""
+    uploads = []
+    for i in range(images):
+        name = f'{author.username}/uploads/photo-{i}.png'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + i.to_bytes(4, 'big'))
+        uploads.append(Media(
+            uploaded_by=author, file=name, media_type=Media.MediaType.IMAGE,
+            filename=os.path.basename(name), file_size=12,
+        ))
+    Media.objects.bulk_create(uploads, batch_size=500)
+
+    urls = [f'/blog/media/{media.file.name}' for media in uploads]
+    row_count = len(urls) // 3
+    blocks = [{'id': str(i), 'type': 'image', 'src': url} for i, url in enumerate(urls[row_count:])]
+    for i in range(0, row_count, 3):
+        blocks.append({'id': f'row-{i}', 'type': 'image-row',
+                       'images': [{'src': url} for url in urls[i:i + 3]]})
+    return seed_posts(author, 1, blocks=blocks)[0]
+
+
+@scenario('organize', help='organize_media time and query count for one post with N uploaded image blocks')
+def bench_organize(sizes, repeat):
+    media_root = tempfile.mkdtemp(prefix='blog-bench-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            for size in sizes:
+                timings = []
+                for _ in range(repeat):
+                    with rolled_back():
+                        post = _seed_upload_post(seed_user(), size)
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            post.organize_media()
+                            timings.append((time.perf_counter() - start) * 1000)
+                yield {
+                    'images': size,
+                    'organize_ms': statistics.median(timings),
+                    'per_image_ms': statistics.median(timings) / max(size, 1),
+                    'queries': len(queries),
+                }
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+# One topic word per post, so each of these matches about 1 in 36 posts
+SEARCH_TOPICS = (
+    'glacier fjord harbour lantern meadow orchard quarry ridge summit tundra valley willow '
+    'compiler database kernel latency migration parser queue runtime scheduler thread cache '
+    'bread coffee garden journal letter market recipe season travel update weekly winter'
+).split()
+SYLLABLES = 'ka lo mi ne ru sa ti vo be da fe gi ho ju'.split()
+
+
+def seed_search_corpus(author, count):
+    """
+    Published posts with a topic word plus filler prose in a text block,
+    indexed for search. Filler words follow a Zipf-like distribution so the
+    index has realistic posting list lengths.
+    """
+    rng = random.Random(count)
+    vocabulary = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    posts = []
+    for batch_start in range(0, count, 5000):
+        batch = seed_posts(author, min(5000, count - batch_start))
+        for post in batch:
+            topic, other = rng.sample(SEARCH_TOPICS, 2)
+            words = rng.choices(vocabulary, weights, k=80) + [topic]
+            rng.shuffle(words)
+            post.title = f'{topic.capitalize()} {rng.choice(vocabulary)} {other}'
+            post.blocks = [{'id': '1', 'type': 'text', 'content': '<p>' + ' '.join(words) + '</p>'}]
+            post.search_document = search.build_search_document(post)
+        Post.objects.bulk_update(batch, ['title', 'blocks', 'search_document'], batch_size=500)
+        search.index_posts(batch)
+        posts.extend(batch)
+    return posts
+
+
+@scenario('search', help='Ranked search page latency vs an icontains scan as the corpus grows')
+def bench_search(sizes, repeat):
+    for size in sizes:
+        with rolled_back(), api_client() as client:
+            seed_search_corpus(seed_user(), size)
+            url = '/blog/api/posts/search/'
+
+            def icontains(term):
+                return list(Post.objects.filter(
+                    Q(title__icontains=term) | Q(description__icontains=term) | Q(blocks__icontains=term),
+                    status=Post.Status.PUBLISHED,
+                ).order_by('-published_at')[:20])
+
+            # A unique parameter per request keeps the response cache out of the measurement.
+            # The request resets the query log, so start counting from an empty one
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url, {'q': 'glacier', 'v': uuid.uuid4().hex})
+            query_count = len(queries)
+            yield {
+                'posts': size,
+                'topic_ms': measure(lambda: search.search_post_ids('glacier', 21), repeat),
+                'two_topics_ms': measure(lambda: search.search_post_ids('glacier harbour', 21), repeat),
+                'api_page_ms': measure(lambda: client.get(url, {'q': 'glacier', 'v': uuid.uuid4().hex}), repeat),
+                'page_10_ms': measure(lambda: search.search_post_ids('glacier', 21, offset=200), repeat),
+                'icontains_topic_ms': measure(lambda: icontains('glacier'), repeat),
+                'icontains_two_topics_ms': measure(lambda: icontains('glacier harbour'), repeat),
+                'queries': query_count,
+            }
+
+
+def _api_requests(client, author, password, posts):
+    """(name, send) for each endpoint measured by the 'api' scenario."""
+    tokens = client.post(
+        '/blog/api/auth/login/', {'username': author.username, 'password': password}, content_type='application/json',
+    ).json()
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {tokens["access"]}'}
+    published = [post for post in posts if post.status == Post.Status.PUBLISHED]
+    own = next(post for post in posts if post.author_id == author.pk)
+    blocks = own.blocks
+
+    def fresh():
+        # A unique parameter per request keeps the response cache out of the measurement
+        return {'v': uuid.uuid4().hex}
+
+    def refresh():
+        # Refresh tokens rotate, so every refresh spends the one the previous call returned
+        response = client.post('/blog/api/auth/refresh/', {'refresh': tokens['refresh']}, content_type='application/json')
+        tokens['refresh'] = response.json().get('refresh', tokens['refresh'])
+        return response
+
+    return [
+        ('list', lambda: client.get('/blog/api/posts/', fresh())),
+        ('list_cached', lambda: client.get('/blog/api/posts/')),
+        ('detail', lambda: client.get(f'/blog/api/posts/{random.choice(published).slug}/', fresh())),
+        ('author_feed', lambda: client.get(f'/blog/api/users/{author.username}/posts/', fresh())),
+        ('create', lambda: client.post(
+            '/blog/api/posts/', {'title': 'Benchmark post', 'blocks': blocks, 'status': 'published'},
+            content_type='application/json', **auth,
+        )),
+        ('update', lambda: client.patch(
+            f'/blog/api/posts/{own.slug}/', {'title': f'Benchmark {uuid.uuid4().hex[:6]}'},
+            content_type='application/json', **auth,
+        )),
+        ('upload', lambda: client.post(
+            '/blog/api/media/', {'file': _upload_image(), 'post_slug': own.slug}, **auth,
+        )),
+        ('login', lambda: client.post(
+            '/blog/api/auth/login/', {'username': author.username, 'password': password},
+            content_type='application/json',
+        )),
+        ('refresh', refresh),
+    ]
+
+
+def _upload_image():
+    return SimpleUploadedFile(f'{uuid.uuid4().hex[:8]}.png', os.urandom(64), content_type='image/png')
+
+
+@scenario('api', help='p50/p95/p99 latency and queries per request for the main endpoints over seed_blog data')
+def bench_api(sizes, repeat):
+    from .seeding import seed_blog
+
+    media_root = tempfile.mkdtemp(prefix='blog-bench-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            for size in sizes:
+                with rolled_back(), api_client() as client:
+                    users = max(1, size // 50)
+                    result = seed_blog(users=users, posts_per_user=max(1, size // users), media_per_post=1,
+                                       password='benchmark', prefix='bench')
+                    posts = list(Post.objects.filter(author__username__in=result.usernames).select_related('author'))
+                    author = posts[0].author
+                    for name, send in _api_requests(client, author, 'benchmark', posts):
+                        yield {'posts': result.posts, 'endpoint': name, **time_requests(send, repeat)}
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+@scenario('auth', help='Authenticated PostViewSet requests per second with the JWT user cache off and on')
+def bench_auth(sizes, repeat):
+    from authentication.backends import user_cache
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    for size in sizes:
+        with rolled_back(), api_client() as client:
+            author = seed_user()
+            posts = seed_posts(author, size, status=Post.Status.DRAFT)
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(author).access_token}'}
+            own = posts[0]
+            requests = [
+                ('drafts', lambda: client.get('/blog/api/posts/drafts/', **auth)),
+                ('retrieve', lambda: client.get(f'/blog/api/posts/{own.slug}/', **auth)),
+                ('update', lambda: client.patch(
+                    f'/blog/api/posts/{own.slug}/', {'title': f'Benchmark {uuid.uuid4().hex[:6]}'},
+                    content_type='application/json', **auth,
+                )),
+                ('me', lambda: client.get('/blog/api/auth/me/', **auth)),
+            ]
+            for name, send in requests:
+                row = {'posts': size, 'endpoint': name}
+                for label, cache_size in (('uncached', 0), ('cached', settings.AUTH_USER_CACHE_SIZE or 1024)):
+                    user_cache.clear()
+                    with override_settings(AUTH_USER_CACHE_SIZE=cache_size):
+                        send()
+                        rate, queries = _request_rate(send, repeat)
+                    row[f'{label}_per_s'] = rate
+                    row[f'{label}_queries'] = queries
+                yield row
+
+
+def _request_rate(send, repeat):
+    """Requests per second over `repeat` calls of send(), and the queries the last one ran."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code} from {response.request["PATH_INFO"]}: {response.content[:200]}')
+    return repeat / (time.perf_counter() - start), len(queries)
+
+
+def seed_tokens(user, count):
+    """`count` historical refresh tokens for `user`: half expired, and every other one blacklisted."""
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    now = timezone.now()
+    for start in range(0, count, 10000):
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(
+                user=user, jti=uuid.uuid4().hex, token='', created_at=now - timedelta(days=8),
+                expires_at=now + (timedelta(days=1) if n % 4 < 2 else -timedelta(days=1)),
+            )
+            for n in range(start, min(start + 10000, count))
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens[::2]])
+
+
+@scenario('refresh', help='Token refresh latency over N historical tokens, bloom filter vs simplejwt, and prune time')
+def bench_refresh(sizes, repeat):
+    from authentication.revocation import prune_expired, revocations
+    from authentication.tokens import RefreshToken
+    from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+    from rest_framework_simplejwt.views import TokenRefreshView
+
+    stock_view = TokenRefreshView.as_view(serializer_class=TokenRefreshSerializer)
+    factory = RequestFactory()
+
+    for size in sizes:
+        with rolled_back(), api_client() as client:
+            user = seed_user()
+            seed_tokens(user, size)
+            tokens = {'filtered': str(RefreshToken.for_user(user)), 'simplejwt': str(RefreshToken.for_user(user))}
+
+            def refresh():
+                # Outside this transaction every rotation bumps the revocation version once it commits,
+                # so the next check syncs the filter; forget the version to pay for that here too
+                revocations.version = None
+                # Refresh tokens rotate, so every refresh spends the one the previous call returned
+                response = client.post('/blog/api/auth/refresh/', {'refresh': tokens['filtered']},
+                                       content_type='application/json')
+                tokens['filtered'] = response.json()['refresh']
+                return response
+
+            def stock_refresh():
+                request = factory.post('/blog/api/auth/refresh/', {'refresh': tokens['simplejwt']},
+                                       content_type='application/json')
+                response = stock_view(request)
+                tokens['simplejwt'] = response.data['refresh']
+                return response
+
+            revocations.reset()
+            start = time.perf_counter()
+            refresh()
+            first_refresh_ms = (time.perf_counter() - start) * 1000
+            filtered, stock = time_requests(refresh, repeat), time_requests(stock_refresh, repeat)
+
+            start = time.perf_counter()
+            pruned, _ = prune_expired()
+            yield {
+                'tokens': size,
+                'first_refresh_ms': first_refresh_ms,
+                'refresh_p50_ms': filtered['p50_ms'],
+                'refresh_p99_ms': filtered['p99_ms'],
+                'refresh_queries': filtered['queries'],
+                'simplejwt_p50_ms': stock['p50_ms'],
+                'simplejwt_p99_ms': stock['p99_ms'],
+                'simplejwt_queries': stock['queries'],
+                'prune_s': time.perf_counter() - start,
+                'pruned': pruned,
+            }
+            revocations.reset()
+
+
+@contextmanager
+def gunicorn_server(profile, workers, **environ):
+    """
+    Run gunicorn.conf.py with SERVER_PROFILE=`profile` and any extra
+    environment variables on a free local port; yields (port, master pid).
+    """
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = {
+        **os.environ, 'SERVER_PROFILE': profile, 'WEB_WORKERS': str(workers), 'WEB_BIND': f'127.0.0.1:{port}',
+        'ALLOWED_HOSTS': '127.0.0.1', 'PROFILING_SAMPLE_RATE': '0', 'METRICS_DIR': '', **environ,
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn'], cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/blog/api/posts/')
+                connection.getresponse().read()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'gunicorn ({profile}) did not start; is it installed?')
+                time.sleep(0.2)
+        yield port, server.pid
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _rss_mb(pid):
+    """Resident memory of a process and its children in MB (Linux only, else None)."""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids = [pid, *map(int, f.read().split())]
+        total = 0
+        for each in pids:
+            with open(f'/proc/{each}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        return total / 1024
+    except OSError:
+        return None
+
+
+def _read_concurrently(port, paths, readers, repeat):
+    """`readers` threads each GET `repeat` of `paths` over one keep-alive connection."""
+    timings, failures = [], []
+
+    def read():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        for _ in range(repeat):
+            # A unique parameter per request keeps the response cache out of the measurement
+            path = f'{random.choice(paths)}?v={uuid.uuid4().hex}'
+            start = time.perf_counter()
+            connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status != 200:
+                failures.append(f'{response.status} from {path}')
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(failures[0])
+    p50, _, p99 = percentiles(timings)
+    return {'requests_per_s': len(timings) / elapsed, 'p50_ms': p50, 'p99_ms': p99}
+
+
+def _published_paths():
+    posts = list(
+        Post.objects.filter(status=Post.Status.PUBLISHED).order_by('?').values_list('slug', 'author__username')[:200]
+    )
+    if not posts:
+        raise RuntimeError('No published posts to read; run `python manage.py seed_blog` first')
+    paths = ['/blog/api/posts/']
+    for slug, username in posts:
+        paths += [f'/blog/api/posts/{slug}/', f'/blog/api/users/{username}/posts/']
+    return paths
+
+
+@scenario('readers', help='Anonymous read throughput for N concurrent readers, WSGI vs ASGI gunicorn (WEB_WORKERS each)')
+def bench_readers(sizes, repeat):
+    """
+    Unlike the other scenarios this one reads the posts already in the
+    database (run seed_blog first) through real gunicorn servers, one per
+    profile in gunicorn.conf.py with the same number of workers; the
+    rss_mb column shows what each used.
+    """
+    paths = _published_paths()
+    workers = int(os.getenv('WEB_WORKERS', '2'))
+    for profile in ('wsgi', 'asgi'):
+        with gunicorn_server(profile, workers) as (port, pid):
+            for readers in sizes:
+                row = _read_concurrently(port, paths, readers, repeat)
+                yield {'profile': profile, 'workers': workers, 'readers': readers, **row, 'rss_mb': _rss_mb(pid)}
+
+
+# Database connection handling compared by the 'connections' scenario (config/settings.py)
+CONNECTION_MODES = {
+    'per_request': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'True'},
+}
+
+
+@scenario('connections', help='Short API read latency on PostgreSQL: a connection per request vs persistent vs pooled')
+def bench_connections(sizes, repeat):
+    """
+    Like 'readers', reads the posts already in the database through a real
+    gunicorn server (Django's test client never closes connections), once
+    per connection mode, with N concurrent readers.
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Connection pooling needs PostgreSQL; run with USE_POSTGRES=True')
+    paths = _published_paths()
+    workers = int(os.getenv('WEB_WORKERS', '1'))
+    for mode, environ in CONNECTION_MODES.items():
+        with gunicorn_server('wsgi', workers, **environ) as (port, _):
+            for readers in sizes:
+                yield {'mode': mode, 'workers': workers, 'readers': readers,
+                       **_read_concurrently(port, paths, readers, repeat)}
@@ -0,0 +1,138 @@
+"""
+Content-addressed storage for media files.
+
+Every unique file is stored once under MEDIA_ROOT/.blobs/ab/cd/<sha256>.
+The per-post paths that Media.file points at are hard links to that blob,
+so URLs, organize_media moves and derivatives work unchanged while
+identical uploads share one copy on disk.
+
+Because the per-post paths are links, deleting them (Post.delete's rmtree,
+FieldFile.delete) never destroys data another post still uses. The blob
+itself is dropped by release_blobs() once no Media row references its hash
+and no other link to it remains.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from .profiling import span
+
+BLOB_DIR = '.blobs'
+READ_SIZE = 1024 * 1024
+
+
+def blob_path(digest):
+    return os.path.join(settings.MEDIA_ROOT, BLOB_DIR, digest[:2], digest[2:4], digest)
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def store_upload(uploaded_file, name):
+    """
+    Write an uploaded file to the blob store, hashing it as it streams, and
+    link it in at `name` (or the next free variant of it). Returns (name, digest).
+    """
+    tmp_dir = os.path.join(settings.MEDIA_ROOT, BLOB_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    sha = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with span('files'), UPLOAD_DURATION.time(kind='media'):
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in uploaded_file.chunks():
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            UPLOAD_BYTES.inc(uploaded_file.size, kind='media')
+            return place(tmp_path, digest, name), digest
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def place(source_path, digest, name):
+    """
+    Make sure the blob for `digest` exists (taking `source_path` as its
+    content if it doesn't) and hard-link it at a free variant of `name`.
+    `source_path` is left in place for the caller to remove.
+    """
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    for _ in range(3):
+        try:
+            os.link(source_path, blob)
+        except FileExistsError:
+            pass
+        try:
+            return _link_free_name(blob, name)
+        except FileNotFoundError:
+            # The blob was released between the two links; store it again
+            continue
+    raise OSError(f'Could not store blob {digest}')
+
+
+def adopt(name):
+    """
+    Move an existing file under MEDIA_ROOT into the blob store in place,
+    replacing it with a link to the shared copy. Returns its digest.
+    """
+    path = default_storage.path(name)
+    digest = hash_file(path)
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        os.link(path, blob)
+    except FileExistsError:
+        if not os.path.samefile(path, blob):
+            # Same content is already stored: swap our copy for a link to it
+            tmp_path = f'{path}.{digest[:8]}.tmp'
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, path)
+    return digest
+
+
+def release_blobs(digests):
+    """Delete blobs that no Media row and no per-post link refer to any more."""
+    from .models import Media
+
+    digests = {digest for digest in digests if digest}
+    if not digests:
+        return
+    in_use = set(Media.objects.filter(content_hash__in=digests).values_list('content_hash', flat=True))
+    for digest in digests - in_use:
+        blob = blob_path(digest)
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.unlink(blob)
+        except FileNotFoundError:
+            pass
+
+
+def _link_free_name(blob, name):
+    while True:
+        name = default_storage.get_available_name(name)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(blob, path)
+            return name
+        except FileExistsError:
+            # Someone took the name between the check and the link; pick another
+            continue
+        except OSError as e:
+            if isinstance(e, FileNotFoundError):
+                raise
+            # Filesystems without hard links still get a working (if duplicated) file
+            shutil.copyfile(blob, path)
+            return name
@@ -0,0 +1,176 @@
+"""
+Versioned response cache for public post reads.
+
+Every cacheable read belongs to a scope - a single post (by slug), one
+author's feed, or the site-wide feed - and each scope has a version token
+stored in the cache. Cached responses are keyed by scope version plus the
+request URL, so invalidating a scope is just replacing its token: stale
+entries are never read again and simply expire.
+
+The ETag is derived from the same key, so a conditional GET whose
+If-None-Match still matches is answered with 304 from two cache lookups,
+without a database query or serializer call. Works with any Django cache
+backend (local memory, file based, ...).
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .metrics import RESPONSE_CACHE
+
+# Usernames can't contain '*', so this never collides with an author's feed
+ALL_AUTHORS = '*'
+
+
+def _version_key(scope):
+    return 'posts:version:' + ':'.join(scope)
+
+
+def post_scope(slug):
+    return ('post', slug)
+
+
+def feed_scope(username=ALL_AUTHORS):
+    return ('feed', username)
+
+
+def get_version(scope):
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope):
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(scope):
+    cache.set(_version_key(scope), uuid.uuid4().hex, None)
+
+
+def invalidate_post(post):
+    """Drop every cached read that can include `post` and refresh its pre-rendered copies."""
+    bump_version(post_scope(post.slug))
+    bump_version(feed_scope(post.author.username))
+    bump_version(feed_scope())
+    # Drafts have no public files, so only posts that are or were published are exported
+    was_public = post.Status.PUBLISHED in (post.status, post.loaded_value('status'))
+    if settings.PRERENDER_ROOT and was_public:
+        from .prerender import schedule_post_export
+        schedule_post_export(post)
+
+
+def _response_key(request, scope, version, fmt=None):
+    if fmt is None:
+        renderer = getattr(request, 'accepted_renderer', None)
+        fmt = renderer.format if renderer else ''
+    url = request.build_absolute_uri()
+    digest = hashlib.sha256(f'{url}|{fmt}'.encode()).hexdigest()[:32]
+    return f'posts:response:{":".join(scope)}:{version}:{digest}'
+
+
+def cached_response(request, scope, render, content_type=None):
+    """
+    Serve a read of `scope` from the cache.
+
+    render() is only called on a miss; it returns (data, last_modified) where
+    last_modified is a datetime or None. Exceptions (e.g. Http404) propagate
+    and nothing is cached. With a content_type, data is the response body
+    itself rather than data for a DRF Response.
+    """
+    key = _response_key(request, scope, get_version(scope))
+    etag = _etag(key)
+
+    # Fast path: the client already has this version
+    not_modified = _not_modified(request, scope, etag)
+    if not_modified is not None:
+        return not_modified
+
+    entry = cache.get(key)
+    RESPONSE_CACHE.inc(scope=scope[0], result='miss' if entry is None else 'hit')
+    if entry is None:
+        entry = _entry(*render())
+        cache.set(key, entry, settings.POSTS_CACHE_TIMEOUT)
+
+    if content_type:
+        return _respond(request, etag, entry, lambda data: HttpResponse(data, content_type=content_type))
+    return _respond(request, etag, entry, Response)
+
+
+async def acached_response(request, scope, render):
+    """
+    cached_response() for async views, with the same entries and ETags as
+    JSON reads through DRF. render is a coroutine function and the response
+    is always JSON.
+    """
+    key = _response_key(request, scope, await aget_version(scope), fmt=JSONRenderer.format)
+    etag = _etag(key)
+
+    not_modified = _not_modified(request, scope, etag)
+    if not_modified is not None:
+        return not_modified
+
+    entry = await cache.aget(key)
+    RESPONSE_CACHE.inc(scope=scope[0], result='miss' if entry is None else 'hit')
+    if entry is None:
+        entry = _entry(*await render())
+        await cache.aset(key, entry, settings.POSTS_CACHE_TIMEOUT)
+
+    return _respond(request, etag, entry, lambda data: HttpResponse(
+        JSONRenderer().render(data), content_type=JSONRenderer.media_type,
+    ))
+
+
+def _etag(key):
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def _not_modified(request, scope, etag):
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            RESPONSE_CACHE.inc(scope=scope[0], result='not_modified')
+            return _finalize(not_modified, etag, None)
+    return None
+
+
+def _entry(data, last_modified):
+    return {
+        'data': data,
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+    }
+
+
+def _respond(request, etag, entry, make_response):
+    not_modified = get_conditional_response(request, etag=etag, last_modified=entry['last_modified'])
+    if not_modified is not None:
+        return _finalize(not_modified, etag, entry['last_modified'])
+    return _finalize(make_response(entry['data']), etag, entry['last_modified'])
+
+
+def _finalize(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Let clients keep a copy but always revalidate it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def newest_update(posts):
+    return max((post.updated_at for post in posts), default=None)
@@ -0,0 +1,123 @@
+"""
+RSS, Atom and JSON Feed syndication of published posts.
+
+A feed holds the POSTS_FEED_SIZE most recently published posts, site-wide or
+for one author, with each post's stored rendering (posts/rendering.py) as its
+content. Feeds are cached in the same scopes as the API feeds
+(posts/cache.py), so they are rebuilt only after one of the author's posts
+changes, and a reader polling with If-None-Match gets a 304 straight from the
+cache.
+"""
+import json
+import re
+
+from django.conf import settings
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from .models import Post
+
+SITE_TITLE = 'sys32blog'
+
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+XML_FEEDS = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+}
+
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+# Root-relative src/href attributes in rendered posts, made absolute for feed readers
+RELATIVE_URL_RE = re.compile(r'(\s(?:src|href)=")/')
+
+
+def recent_posts(author=None):
+    posts = Post.objects.filter(status=Post.Status.PUBLISHED)
+    if author is not None:
+        posts = posts.filter(author=author)
+    return list(
+        posts.select_related('author')
+        .defer('blocks', 'search_document', 'plain_text')
+        .order_by('-published_at')[:settings.POSTS_FEED_SIZE]
+    )
+
+
+def render_feed(request, fmt, author=None):
+    """Render the feed in `fmt` as (text, last_modified)."""
+    posts = recent_posts(author)
+    origin = request.build_absolute_uri('/').rstrip('/')
+    meta = {
+        'title': f'{author.username} - {SITE_TITLE}' if author else SITE_TITLE,
+        'link': origin + (f'/blog/{author.username}' if author else '/blog/'),
+        'description': f'Posts by {author.username}' if author else f'Latest posts on {SITE_TITLE}',
+        'feed_url': request.build_absolute_uri(),
+    }
+    items = [
+        {
+            'id': str(post.id),
+            'title': post.title,
+            'link': f'{origin}/blog/{post.author.username}/post/{post.slug}',
+            'summary': post.description,
+            'content': RELATIVE_URL_RE.sub(rf'\1{origin}/', post.rendered_html),
+            'author': post.author.username,
+            'published': post.published_at,
+            'updated': post.updated_at,
+        }
+        for post in posts
+    ]
+
+    if fmt == 'json':
+        text = json_feed(meta, items)
+    else:
+        text = xml_feed(XML_FEEDS[fmt], meta, items)
+    return text, max((post.updated_at for post in posts), default=None)
+
+
+def xml_feed(feed_class, meta, items):
+    feed = feed_class(
+        title=meta['title'],
+        link=meta['link'],
+        description=meta['description'],
+        feed_url=meta['feed_url'],
+        language=settings.LANGUAGE_CODE,
+    )
+    for item in items:
+        feed.add_item(
+            title=item['title'],
+            link=item['link'],
+            description=item['content'] or item['summary'],
+            unique_id=item['id'],
+            unique_id_is_permalink=False,
+            author_name=item['author'],
+            pubdate=item['published'],
+            updateddate=item['updated'],
+        )
+    return feed.writeString('utf-8')
+
+
+def json_feed(meta, items):
+    return json.dumps({
+        'version': JSON_FEED_VERSION,
+        'title': meta['title'],
+        'home_page_url': meta['link'],
+        'feed_url': meta['feed_url'],
+        'description': meta['description'],
+        'language': settings.LANGUAGE_CODE,
+        'items': [
+            {
+                'id': item['id'],
+                'url': item['link'],
+                'title': item['title'],
+                'content_html': item['content'],
+                'summary': item['summary'],
+                'date_published': item['published'].isoformat(),
+                'date_modified': item['updated'].isoformat(),
+                'authors': [{'name': item['author']}],
+            }
+            for item in items
+        ],
+    })
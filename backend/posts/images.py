@@ -0,0 +1,125 @@
+"""
+Responsive image derivatives.
+
+Uploads are stored untouched. Width-bucketed copies in modern formats live
+in a `_sizes/` folder next to the original:
+
+    {username}/posts/{slug}/photo.jpg
+    {username}/posts/{slug}/_sizes/photo.jpg.w640.webp
+
+Serializers only advertise derivative URLs; nothing is encoded at upload
+time. The first request for a missing derivative builds it (see
+posts.serving.serve_media) and every later request is a plain file hit.
+"""
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+SIZES_DIR = '_sizes'
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+DERIVATIVE_RE = re.compile(
+    rf'^(?P<folder>(?:.+/)?){SIZES_DIR}/(?P<source>[^/]+)\.w(?P<width>\d+)\.(?P<format>[a-z0-9]+)$'
+)
+
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 60, 'speed': 8},
+}
+
+
+def derivative_formats():
+    """Configured output formats that this Pillow build can actually encode."""
+    return [fmt for fmt in settings.IMAGE_DERIVATIVE_FORMATS if fmt in SAVE_OPTIONS and features.check(fmt)]
+
+
+def derivative_name(name, width, fmt):
+    folder, filename = os.path.split(name)
+    return '/'.join(part for part in [folder, SIZES_DIR, f'{filename}.w{width}.{fmt}'] if part)
+
+
+def srcset(name):
+    """
+    Map of format -> {width: url} for the image stored at `name`, or None if
+    the file is not something we derive (videos, GIFs, ...).
+    """
+    if not name or not name.lower().endswith(SOURCE_EXTENSIONS):
+        return None
+    return {
+        fmt: {str(width): default_storage.url(derivative_name(name, width, fmt))
+              for width in settings.IMAGE_DERIVATIVE_WIDTHS}
+        for fmt in derivative_formats()
+    }
+
+
+def build_derivative(name):
+    """
+    Build the derivative stored at `name` (relative to MEDIA_ROOT) from its
+    original. Returns False when `name` is not a valid derivative path or the
+    original is missing, so callers can answer 404.
+    """
+    match = DERIVATIVE_RE.match(name)
+    if not match:
+        return False
+
+    width = int(match['width'])
+    fmt = match['format']
+    source = match['folder'] + match['source']
+    if (width not in settings.IMAGE_DERIVATIVE_WIDTHS or fmt not in derivative_formats()
+            or not source.lower().endswith(SOURCE_EXTENSIONS)):
+        return False
+
+    source_path = os.path.join(settings.MEDIA_ROOT, source)
+    if not os.path.isfile(source_path):
+        return False
+
+    target_path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+    try:
+        _encode(source_path, target_path, width, fmt)
+    except (OSError, Image.DecompressionBombError):
+        # Unreadable or hostile source image: treat it like a missing file
+        return False
+    return True
+
+
+def _encode(source_path, target_path, width, fmt):
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        # Never upscale: buckets wider than the original get the original size
+        image.thumbnail((width, width * 10), Image.Resampling.LANCZOS)
+
+        # Write to a temp file and rename so concurrent requests never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def delete_derivatives(name):
+    """Remove every derivative built from the original stored at `name`."""
+    folder, filename = os.path.split(name)
+    sizes_dir = os.path.join(settings.MEDIA_ROOT, folder, SIZES_DIR)
+    if not os.path.isdir(sizes_dir):
+        return
+    prefix = f'{filename}.w'
+    for entry in os.scandir(sizes_dir):
+        if entry.name.startswith(prefix):
+            os.remove(entry.path)
+
+
+def source_name(name):
+    """The original a derivative was built from, or None if `name` isn't a derivative."""
+    match = DERIVATIVE_RE.match(name)
+    return match['folder'] + match['source'] if match else None
@@ -0,0 +1,113 @@
+"""
+Database-backed queue for media work that shouldn't run inside a request.
+
+Post.save enqueues an organize job and returns; `manage.py run_media_jobs`
+claims jobs with a conditional UPDATE (so several workers can run side by
+side without a broker), runs them and retries failures with exponential
+backoff. Post.media_status tells the API whether a post is still settling.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_post
+from .models import MediaJob, Post
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = [MediaJob.Status.PENDING, MediaJob.Status.RUNNING]
+
+
+def enqueue_organize_media(post):
+    """Queue an organize job for `post` unless one is already waiting."""
+    if settings.MEDIA_JOBS_EAGER:
+        post.organize_media()
+        Post.objects.filter(pk=post.pk).update(media_status=Post.MediaStatus.SETTLED)
+        post.media_status = Post.MediaStatus.SETTLED
+        return None
+
+    try:
+        with transaction.atomic():
+            job, _ = MediaJob.objects.get_or_create(
+                post=post, kind=MediaJob.Kind.ORGANIZE_MEDIA, status=MediaJob.Status.PENDING,
+            )
+    except IntegrityError:
+        # Another request queued it between our lookup and insert
+        job = None
+    return job
+
+
+def claim_next_job():
+    """Atomically move the oldest due job to RUNNING and return it, or None."""
+    now = timezone.now()
+    candidates = MediaJob.objects.filter(status=MediaJob.Status.PENDING, run_after__lte=now)
+    for job in candidates.order_by('run_after')[:10]:
+        claimed = MediaJob.objects.filter(pk=job.pk, status=MediaJob.Status.PENDING).update(
+            status=MediaJob.Status.RUNNING, attempts=F('attempts') + 1, updated_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job):
+    try:
+        post = Post.objects.select_related('author').get(pk=job.post_id)
+    except Post.DoesNotExist:
+        job.delete()
+        return
+
+    try:
+        post.organize_media()
+    except Exception:
+        _record_failure(job, post, traceback.format_exc())
+        return
+
+    job.delete()
+    _settle(post)
+
+
+def requeue_stale_jobs():
+    """Put RUNNING jobs whose worker died back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.MEDIA_JOBS_STALE_AFTER)
+    for job in MediaJob.objects.filter(status=MediaJob.Status.RUNNING, updated_at__lt=cutoff):
+        _retry_later(job, 'Worker stopped before finishing the job')
+
+
+def _record_failure(job, post, error):
+    logger.warning('Media job %s for post %s failed (attempt %s): %s', job.pk, post.pk, job.attempts, error)
+    if job.attempts >= settings.MEDIA_JOBS_MAX_ATTEMPTS:
+        MediaJob.objects.filter(pk=job.pk).update(status=MediaJob.Status.FAILED, last_error=error)
+        Post.objects.filter(pk=post.pk).update(media_status=Post.MediaStatus.FAILED)
+        invalidate_post(post)
+    else:
+        _retry_later(job, error)
+
+
+def _retry_later(job, error):
+    delay = timedelta(seconds=2 ** job.attempts)
+    try:
+        with transaction.atomic():
+            MediaJob.objects.filter(pk=job.pk).update(
+                status=MediaJob.Status.PENDING, run_after=timezone.now() + delay, last_error=error,
+            )
+    except IntegrityError:
+        # A newer save already queued a job for this post; that one redoes the work
+        job.delete()
+
+
+def _settle(post):
+    # Leave the post 'settling' if a newer save queued more work meanwhile
+    settled = (
+        Post.objects.filter(pk=post.pk)
+        .exclude(media_jobs__status__in=ACTIVE)
+        .update(media_status=Post.MediaStatus.SETTLED)
+    )
+    if settled:
+        invalidate_post(post)
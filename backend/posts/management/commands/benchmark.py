@@ -0,0 +1,96 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from posts.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway, rolled-back data set'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenario',
+            nargs='?',
+            help='Scenario to run (omit to list the available scenarios)',
+        )
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma-separated data set sizes to run the scenario at',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of timed runs per measurement',
+        )
+        parser.add_argument(
+            '--save',
+            metavar='PATH',
+            help='Write the results to a JSON file, to --compare later runs against',
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='PATH',
+            help='Show the change of every timing against results saved with --save',
+        )
+
+    def handle(self, *args, **options):
+        name = options['scenario']
+        if not name:
+            self.stdout.write(self.style.SUCCESS('Available scenarios:'))
+            for key, func in sorted(SCENARIOS.items()):
+                self.stdout.write(f'  - {key}: {func.help}')
+            return
+
+        if name not in SCENARIOS:
+            raise CommandError(f'Unknown scenario "{name}". Run without arguments to list scenarios.')
+
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+
+        baseline = self.load_baseline(options['compare'], name) if options['compare'] else None
+
+        self.stdout.write(self.style.SUCCESS(f'\nRunning "{name}" ({options["repeat"]} runs per measurement):\n'))
+        rows = []
+        for row in SCENARIOS[name](sizes=sizes, repeat=options['repeat']):
+            previous = baseline[len(rows)] if baseline and len(rows) < len(baseline) else None
+            rows.append(row)
+            self.stdout.write('  ' + '  '.join(self.format_value(key, value, previous) for key, value in row.items()))
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({
+                    'scenario': name,
+                    'sizes': sizes,
+                    'repeat': options['repeat'],
+                    'database': connection.vendor,
+                    'created_at': timezone.now().isoformat(),
+                    'results': rows,
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nSaved results to {options["save"]}'))
+
+    def load_baseline(self, path, name):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        if saved.get('scenario') != name:
+            raise CommandError(f'{path} holds results for "{saved.get("scenario")}", not "{name}"')
+        return saved['results']
+
+    def format_value(self, key, value, previous):
+        if not isinstance(value, float):
+            return f'{key}={value}'
+        text = f'{key}={value:.2f}'
+        # Rows are matched by position, so only compare rows describing the same measurement
+        same_row = previous and all(
+            previous.get(k) == v for k, v in previous.items() if not isinstance(v, float) and k != 'queries'
+        )
+        if same_row and previous.get(key):
+            text += f' ({(value - previous[key]) / previous[key]:+.0%})'
+        return text
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from posts.models import SitemapShard
+from posts.sitemaps import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every sitemap shard from the published posts'
+
+    def handle(self, *args, **options):
+        rebuild()
+
+        shards = SitemapShard.objects.filter(last_modified__isnull=False)
+        posts = sum(len(entries) for entries in shards.values_list('entries', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'\nBuilt {shards.count()} sitemap shards with {posts} posts'))
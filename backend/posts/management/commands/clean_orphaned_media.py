@@ -1,11 +1,13 @@
+import json
 import os
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from posts.models import Media, Post
+from posts.audit import add_scan_arguments, find_orphaned_blobs, find_orphans, scan_media
+from posts.blobs import blob_path, release_blobs
 
 
 class Command(BaseCommand):
-    help = 'List and optionally delete orphaned media files (files not in database)'
+    help = 'List and optionally delete orphaned media files and blobs (files not in database)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -13,60 +15,90 @@ class Command(BaseCommand):
             action='store_true',
             help='Delete orphaned files',
         )
+        parser.add_argument(
+            '--no-input', '--noinput',
+            action='store_false',
+            dest='interactive',
+            help='Delete without asking for confirmation',
+        )
+        add_scan_arguments(parser)
 
     def handle(self, *args, **options):
         media_root = settings.MEDIA_ROOT
         delete_files = options['delete']
+        if options['json'] and delete_files and options['interactive']:
+            raise CommandError('--json with --delete needs --no-input (the prompt would corrupt the output)')
 
-        # Get all file paths from database
-        db_files = set()
-        for media in Media.objects.all():
-            if media.file:
-                db_files.add(os.path.join(media_root, media.file.name))
+        scan = scan_media(workers=options['workers'], use_manifest=not options['full_scan'])
+        orphaned_files = find_orphans(scan)
+        orphaned_blobs = find_orphaned_blobs(orphaned_files)
+        total_size = sum(size for _, size in orphaned_files)
 
-        # Find all physical files
-        physical_files = set()
-        for root, dirs, files in os.walk(media_root):
-            # Skip covers directory
-            if 'covers' in root:
-                continue
-            for file in files:
-                if file.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.webm', '.mov')):
-                    physical_files.add(os.path.join(root, file))
+        deleted = []
+        deleted_blobs = []
+        if delete_files and (orphaned_files or orphaned_blobs):
+            confirmed = True
+            if options['interactive']:
+                self.report(orphaned_files, orphaned_blobs, total_size)
+                confirm = input('\nAre you sure you want to delete these files? (yes/no): ')
+                confirmed = confirm.lower() == 'yes'
+                if not confirmed:
+                    self.stdout.write(self.style.WARNING('Deletion cancelled'))
+            if confirmed:
+                deleted = self.delete(media_root, orphaned_files, quiet=options['json'])
+                deleted_blobs = self.delete_blobs(orphaned_blobs, quiet=options['json'])
 
-        # Find orphaned files (in filesystem but not in database)
-        orphaned_files = physical_files - db_files
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'orphans': [{'path': name, 'size': size} for name, size in orphaned_files],
+                'total_size': total_size,
+                'deleted': deleted,
+                'orphaned_blobs': [{'hash': digest, 'size': size} for digest, size in orphaned_blobs],
+                'deleted_blobs': deleted_blobs,
+                'scan': {'dirs_scanned': scan.dirs_scanned, 'dirs_reused': scan.dirs_reused},
+            }, indent=2))
+            return
 
-        if not orphaned_files:
+        if not orphaned_files and not orphaned_blobs:
             self.stdout.write(self.style.SUCCESS('No orphaned files found!'))
             return
 
-        self.stdout.write(self.style.WARNING(f'\nFound {len(orphaned_files)} orphaned files:'))
-
-        total_size = 0
-        for file_path in sorted(orphaned_files):
-            size = os.path.getsize(file_path)
-            total_size += size
-            size_mb = size / (1024 * 1024)
-            rel_path = os.path.relpath(file_path, media_root)
-            self.stdout.write(f'  - {rel_path} ({size_mb:.2f} MB)')
+        if not delete_files:
+            self.report(orphaned_files, orphaned_blobs, total_size)
+            self.stdout.write(self.style.WARNING('\nRun with --delete to remove these files'))
+        elif deleted or deleted_blobs:
+            self.stdout.write(self.style.SUCCESS(f'\nDeleted {len(deleted)} files and {len(deleted_blobs)} blobs'))
 
+    def report(self, orphaned_files, orphaned_blobs, total_size):
+        self.stdout.write(self.style.WARNING(f'\nFound {len(orphaned_files)} orphaned files:'))
+        for name, size in orphaned_files:
+            self.stdout.write(f'  - {name} ({size / (1024 * 1024):.2f} MB)')
         self.stdout.write(self.style.WARNING(f'\nTotal size: {total_size / (1024 * 1024):.2f} MB'))
+        if orphaned_blobs:
+            self.stdout.write(self.style.WARNING(f'\nFound {len(orphaned_blobs)} unreferenced blobs:'))
+            for digest, size in orphaned_blobs:
+                self.stdout.write(f'  - {digest} ({size / (1024 * 1024):.2f} MB)')
 
-        if delete_files:
-            confirm = input('\nAre you sure you want to delete these files? (yes/no): ')
-            if confirm.lower() == 'yes':
-                deleted_count = 0
-                for file_path in orphaned_files:
-                    try:
-                        os.remove(file_path)
-                        deleted_count += 1
-                        self.stdout.write(self.style.SUCCESS(f'Deleted: {os.path.relpath(file_path, media_root)}'))
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'Error deleting {file_path}: {str(e)}'))
+    def delete(self, media_root, orphaned_files, quiet):
+        deleted = []
+        for name, _ in orphaned_files:
+            try:
+                os.remove(os.path.join(media_root, name))
+                deleted.append(name)
+                if not quiet:
+                    self.stdout.write(self.style.SUCCESS(f'Deleted: {name}'))
+            except Exception as e:
+                if not quiet:
+                    self.stdout.write(self.style.ERROR(f'Error deleting {name}: {str(e)}'))
+        return deleted
 
-                self.stdout.write(self.style.SUCCESS(f'\nDeleted {deleted_count} files'))
-            else:
-                self.stdout.write(self.style.WARNING('Deletion cancelled'))
-        else:
-            self.stdout.write(self.style.WARNING('\nRun with --delete to remove these files'))
+    def delete_blobs(self, orphaned_blobs, quiet):
+        # release_blobs checks the Media rows and link count again, so a blob
+        # that was reused since the scan is kept
+        digests = [digest for digest, _ in orphaned_blobs]
+        release_blobs(digests)
+        deleted = [digest for digest in digests if not os.path.exists(blob_path(digest))]
+        if not quiet:
+            for digest in deleted:
+                self.stdout.write(self.style.SUCCESS(f'Deleted blob: {digest}'))
+        return deleted
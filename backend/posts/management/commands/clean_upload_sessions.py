@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from posts.uploads import clean_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked upload sessions and their partial files'
+
+    def handle(self, *args, **options):
+        removed = clean_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned uploads'))
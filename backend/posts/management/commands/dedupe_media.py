@@ -0,0 +1,31 @@
+import os
+from django.core.management.base import BaseCommand
+from posts import blobs
+from posts.models import Media
+
+
+class Command(BaseCommand):
+    help = 'Move existing media into the content-addressed blob store, sharing identical files'
+
+    def handle(self, *args, **options):
+        adopted = 0
+        missing = 0
+        saved_bytes = 0
+
+        for media in Media.objects.filter(content_hash='').iterator():
+            if not media.file or not os.path.exists(media.file.path):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'File not found: {media.file.name}'))
+                continue
+
+            content_hash = blobs.adopt(media.file.name)
+            if os.stat(blobs.blob_path(content_hash)).st_nlink > 2:
+                # The blob already had another link, so this copy's bytes were freed
+                saved_bytes += media.file_size
+            Media.objects.filter(pk=media.pk).update(content_hash=content_hash)
+            adopted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'\nAdopted {adopted} files into the blob store'))
+        self.stdout.write(f'  - Space reclaimed: {saved_bytes / (1024 * 1024):.2f} MB')
+        if missing:
+            self.stdout.write(self.style.WARNING(f'  - {missing} files missing on disk'))
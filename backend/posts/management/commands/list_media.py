@@ -1,46 +1,64 @@
-import os
+import json
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from posts.models import Media
+from posts.audit import add_scan_arguments, media_rows, scan_media
 
 
 class Command(BaseCommand):
     help = 'List all media files and their status'
 
-    def handle(self, *args, **options):
-        media_items = Media.objects.all().order_by('-created_at')
+    def add_arguments(self, parser):
+        add_scan_arguments(parser)
 
-        if not media_items:
-            self.stdout.write(self.style.WARNING('No media found in database'))
-            return
+    def handle(self, *args, **options):
+        scan = scan_media(workers=options['workers'], use_manifest=not options['full_scan'])
 
-        self.stdout.write(self.style.SUCCESS(f'\nFound {media_items.count()} media items:\n'))
+        stats = {'count': 0, 'missing': 0, 'total_size': 0, 'with_post': 0, 'without_post': 0, 'in_uploads': 0}
+        items = [] if options['json'] else None
 
-        total_size = 0
-        for media in media_items:
-            file_exists = os.path.exists(media.file.path) if media.file else False
-            size_mb = media.file_size / (1024 * 1024) if media.file_size else 0
-            total_size += media.file_size if media.file_size else 0
+        for row in media_rows(scan):
+            stats['count'] += 1
+            stats['missing'] += not row['exists']
+            stats['total_size'] += row['size']
+            stats['with_post' if row['post'] else 'without_post'] += 1
+            stats['in_uploads'] += '/uploads/' in row['path']
 
-            status = '✓' if file_exists else '✗ MISSING'
-            post_info = f'Post: {media.post.slug}' if media.post else 'No post assigned'
+            if items is not None:
+                items.append(row)
+                continue
 
+            if stats['count'] == 1:
+                self.stdout.write(self.style.SUCCESS('\nMedia items:\n'))
+            status = '✓' if row['exists'] else '✗ MISSING'
+            post_info = f'Post: {row["post"]}' if row['post'] else 'No post assigned'
             self.stdout.write(
-                f'{status} {media.filename}\n'
-                f'   Path: {media.file.name}\n'
-                f'   Size: {size_mb:.2f} MB\n'
+                f'{status} {row["filename"]}\n'
+                f'   Path: {row["path"]}\n'
+                f'   Size: {row["size"] / (1024 * 1024):.2f} MB\n'
                 f'   {post_info}\n'
-                f'   Uploaded: {media.created_at.strftime("%Y-%m-%d %H:%M")}\n'
+                f'   Uploaded: {row["uploaded"][:16].replace("T", " ")}\n'
             )
 
-        self.stdout.write(self.style.SUCCESS(f'\nTotal size: {total_size / (1024 * 1024):.2f} MB'))
+        if items is not None:
+            self.stdout.write(json.dumps({
+                'media': items,
+                'stats': stats,
+                'scan': {'dirs_scanned': scan.dirs_scanned, 'dirs_reused': scan.dirs_reused},
+            }, indent=2))
+            return
+
+        if not stats['count']:
+            self.stdout.write(self.style.WARNING('No media found in database'))
+            return
 
-        # Show statistics
-        with_post = Media.objects.filter(post__isnull=False).count()
-        without_post = Media.objects.filter(post__isnull=True).count()
-        in_uploads = Media.objects.filter(file__startswith='uploads/').count()
+        self.stdout.write(self.style.SUCCESS(f'\nFound {stats["count"]} media items'))
+        self.stdout.write(self.style.SUCCESS(f'Total size: {stats["total_size"] / (1024 * 1024):.2f} MB'))
 
+        # Show statistics
         self.stdout.write(self.style.WARNING(f'\nStatistics:'))
-        self.stdout.write(f'  - With post: {with_post}')
-        self.stdout.write(f'  - Without post: {without_post}')
-        self.stdout.write(f'  - In uploads/: {in_uploads}')
+        self.stdout.write(f'  - With post: {stats["with_post"]}')
+        self.stdout.write(f'  - Without post: {stats["without_post"]}')
+        self.stdout.write(f'  - In uploads/: {stats["in_uploads"]}')
+        self.stdout.write(f'  - Missing on disk: {stats["missing"]}')
+        self.stdout.write(
+            f'  - Directories scanned: {scan.dirs_scanned} (unchanged since last run: {scan.dirs_reused})'
+        )
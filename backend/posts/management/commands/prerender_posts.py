@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from posts.prerender import export_all
+
+
+class Command(BaseCommand):
+    help = 'Write static copies of the public post reads to PRERENDER_ROOT for nginx to serve'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--html',
+            action='store_true',
+            default=settings.PRERENDER_HTML,
+            help='Also write a standalone HTML page per post (default: PRERENDER_HTML)',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.PRERENDER_ROOT:
+            raise CommandError('PRERENDER_ROOT is not set')
+
+        written, removed = export_all(html=options['html'])
+
+        self.stdout.write(self.style.SUCCESS(f'\nWrote {len(written)} files to {settings.PRERENDER_ROOT}'))
+        if removed:
+            self.stdout.write(f'  - Removed {removed} stale files')
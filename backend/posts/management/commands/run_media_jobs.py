@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from posts.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued media jobs (moving uploads into post folders)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Media job worker started'))
+        processed = 0
+
+        while True:
+            requeue_stale_jobs()
+
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            run_job(job)
+            processed += 1
+            self.stdout.write(f'Ran job {job.pk} for post {job.post_id}')
+
+        self.stdout.write(self.style.SUCCESS(f'\nProcessed {processed} jobs'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from posts.seeding import seed_blog
+
+
+class Command(BaseCommand):
+    help = 'Create sample authors, posts with every block type and image files, for development and load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Number of authors to create')
+        parser.add_argument('--posts-per-user', type=int, default=50, help='Posts per author')
+        parser.add_argument('--media-per-post', type=int, default=2, help='Image files per post')
+        parser.add_argument('--draft-ratio', type=float, default=0.2, help='Share of posts left as drafts (0-1)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable content')
+        parser.add_argument('--password', default='password', help='Password for every created author')
+        parser.add_argument('--prefix', default='writer', help='Username prefix')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['draft_ratio'] <= 1:
+            raise CommandError('--draft-ratio must be between 0 and 1')
+
+        result = seed_blog(
+            users=options['users'],
+            posts_per_user=options['posts_per_user'],
+            media_per_post=options['media_per_post'],
+            draft_ratio=options['draft_ratio'],
+            seed=options['seed'],
+            password=options['password'],
+            prefix=options['prefix'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'\nCreated {result.users} authors and {result.posts} posts'))
+        self.stdout.write(f'  - Drafts: {result.drafts}')
+        self.stdout.write(f'  - Media files: {result.media} ({result.media_bytes / (1024 * 1024):.2f} MB)')
+        if result.usernames:
+            self.stdout.write(f'  - Sign in as e.g. {result.usernames[0]} / {options["password"]}')
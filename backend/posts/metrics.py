@@ -0,0 +1,328 @@
+"""
+Prometheus metrics shared by every worker process.
+
+Each process keeps its counters in its own memory-mapped file under
+METRICS_DIR (metrics-<host>-<pid>.db), so recording a value is a dict lookup
+and an in-place float add with no locking across processes and no system
+call. GET /blog/api/metrics reads every file in the directory and sums
+them, so one scrape covers all gunicorn workers, and the media worker too
+when its container shares the directory (the host name keeps processes of
+different containers apart). Files of exited workers are kept and still
+counted, which keeps counters monotonic across worker restarts; clear a
+host's files when its server starts (the Docker entrypoint does).
+Without METRICS_DIR values stay in process memory, which is enough for the
+development server.
+
+Only counters and histograms are kept, since both aggregate across processes
+by summing; ratios such as the response cache hit rate are left to
+PromQL, e.g. rate(blog_response_cache_total{result="hit"}[5m]) divided by
+rate(blog_response_cache_total[5m]).
+"""
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = {}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class MmapValues:
+    """
+    Float values by key in a file that only this process writes:
+
+        used bytes (uint32), then entries of
+        key length (uint32), key (utf-8, padded to 8 bytes), value (float64)
+    """
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = struct.unpack_from('I', self.map, 0)[0] or 8
+        self.offsets = {key: offset for key, offset, _ in _entries(self.map, self.used)}
+
+    def inc(self, key, amount):
+        with self.lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self._add(key)
+            struct.pack_into('d', self.map, offset, struct.unpack_from('d', self.map, offset)[0] + amount)
+
+    def _add(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(len(encoded) + 4) % 8)
+        size = 4 + padded + 8
+        if self.used + size > len(self.map):
+            new_size = max(len(self.map) * 2, self.used + size)
+            self.map.close()
+            self.file.truncate(new_size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        struct.pack_into(f'I{padded}sd', self.map, self.used, len(encoded), encoded, 0.0)
+        offset = self.used + 4 + padded
+        self.used += size
+        # Written last, so a reader never sees an entry before its value is zeroed
+        struct.pack_into('I', self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+
+class MemoryValues:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, key, amount):
+        with self.lock:
+            self.values[key] += amount
+
+
+def _entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('I', data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        offset = position + 4 + length + (-(length + 4) % 8)
+        yield key, offset, struct.unpack_from('d', data, offset)[0]
+        position = offset + 8
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def _values():
+    """This process's value store, opened on first use (and again in a forked child)."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                if settings.METRICS_DIR:
+                    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                    name = f'metrics-{socket.gethostname()}-{pid}.db'
+                    _store = MmapValues(os.path.join(settings.METRICS_DIR, name))
+                else:
+                    _store = MemoryValues()
+                _store_pid = pid
+    return _store
+
+
+def reset():
+    """Forget this process's values (tests)."""
+    global _store_pid
+    _store_pid = None
+
+
+def _key(name, labels):
+    return json.dumps([name, labels], sort_keys=True, separators=(',', ':'))
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return {name: str(value) for name, value in labels.items()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _values().inc(_key(self.name, self._labels(labels)), amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        bound = next((bound for bound in self.buckets if value <= bound), '+Inf')
+        # Buckets are stored per range and made cumulative when exported
+        values = _values()
+        values.inc(_key(f'{self.name}_bucket', {**labels, 'le': str(bound)}), 1)
+        values.inc(_key(f'{self.name}_sum', labels), value)
+        values.inc(_key(f'{self.name}_count', labels), 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+REQUEST_DURATION = Histogram(
+    'blog_http_request_duration_seconds', 'Time to answer a request, by URL name', ['route', 'method'],
+)
+REQUESTS = Counter('blog_http_requests_total', 'Requests answered, by URL name and status', ['route', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'blog_http_request_queries', 'Database queries run per request, by URL name', ['route'], buckets=QUERY_BUCKETS,
+)
+UPLOAD_BYTES = Counter('blog_upload_bytes_total', 'Bytes received in uploads', ['kind'])
+UPLOAD_DURATION = Histogram('blog_upload_duration_seconds', 'Time to store an upload or upload part', ['kind'])
+ORGANIZE_MOVES = Counter(
+    'blog_organize_media_moves_total', 'Uploads organize_media moved into post folders, or left in place', ['result'],
+)
+ORGANIZE_DURATION = Histogram('blog_organize_media_duration_seconds', 'Time organize_media took for one post')
+RESPONSE_CACHE = Counter(
+    'blog_response_cache_total', 'Cached reads by outcome (hit, miss, not_modified)', ['scope', 'result'],
+)
+
+
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Count queries on every connection (connection_created, see apps.py); async views query from other threads."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+class MetricsMiddleware:
+    """Record latency, status and query count for every request, labelled by URL name."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, start = _request_queries.set([0]), time.perf_counter()
+        queries = _request_queries.get()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        token, start = _request_queries.set([0]), time.perf_counter()
+        queries = _request_queries.get()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        if route != 'metrics':
+            REQUEST_DURATION.observe(elapsed, route=route, method=request.method)
+            REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+            REQUEST_QUERIES.observe(queries, route=route)
+
+
+def collect():
+    """Sum the values written by every process, by key."""
+    totals = defaultdict(float)
+    if settings.METRICS_DIR:
+        # Make sure this process's file exists, so a fresh worker still exports every metric
+        _values()
+        for name in os.listdir(settings.METRICS_DIR):
+            if name.startswith('metrics-') and name.endswith('.db'):
+                with open(os.path.join(settings.METRICS_DIR, name), 'rb') as f:
+                    data = f.read()
+                used = struct.unpack_from('I', data, 0)[0] if len(data) >= 4 else 0
+                for key, _, value in _entries(data, used):
+                    totals[key] += value
+    else:
+        with _values().lock:
+            totals.update(_values().values)
+    return totals
+
+
+def exposition():
+    """Every registered metric in the Prometheus text format."""
+    samples = defaultdict(list)
+    for key, value in collect().items():
+        name, labels = json.loads(key)
+        samples[name].append((labels, value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'histogram':
+            lines.extend(_histogram_lines(metric, samples))
+        else:
+            lines.extend(_sample_line(metric.name, labels, value) for labels, value in sorted(
+                samples[metric.name], key=lambda sample: sorted(sample[0].items())
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, samples):
+    buckets = defaultdict(lambda: defaultdict(float))
+    for labels, value in samples[f'{metric.name}_bucket']:
+        bound = labels.pop('le')
+        buckets[_label_key(labels)][bound] += value
+
+    sums = {_label_key(labels): value for labels, value in samples[f'{metric.name}_sum']}
+    for labels, count in sorted(samples[f'{metric.name}_count'], key=lambda sample: sorted(sample[0].items())):
+        key = _label_key(labels)
+        cumulative = 0.0
+        for bound in [*map(str, metric.buckets), '+Inf']:
+            cumulative += buckets[key].get(bound, 0)
+            yield _sample_line(f'{metric.name}_bucket', {**labels, 'le': bound}, cumulative)
+        yield _sample_line(f'{metric.name}_sum', labels, sums.get(key, 0.0))
+        yield _sample_line(f'{metric.name}_count', labels, count)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        rendered = ','.join(f'{label}="{_escape(text)}"' for label, text in sorted(labels.items()))
+        name = f'{name}{{{rendered}}}'
+    return f'{name} {int(value) if value.is_integer() else repr(value)}'
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -0,0 +1,18 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_published_at(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.filter(status='published', published_at__isnull=True).update(published_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_remove_post_custom_css'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_published_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+import django.db.models.deletion
+import django.utils.timezone
+import posts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_backfill_published_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='media_status',
+            field=models.CharField(choices=[('settled', 'Settled'), ('settling', 'Settling'), ('failed', 'Failed')], default='settled', help_text='Whether uploaded images referenced in blocks still need to be moved into the post folder', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, upload_to=posts.models.cover_image_path),
+        ),
+        migrations.CreateModel(
+            name='MediaJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('organize', 'Organize media')], default='organize', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_jobs', to='posts.post')),
+            ],
+            options={
+                'ordering': ['run_after'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='posts_media_status_40cdb1_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('post', 'kind'), name='unique_pending_media_job')],
+            },
+        ),
+    ]
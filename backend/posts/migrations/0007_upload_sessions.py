@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 09:40
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_media_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='media',
+            name='file_size',
+            field=models.PositiveBigIntegerField(help_text='File size in bytes'),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('media_type', models.CharField(choices=[('image', 'Image'), ('video', 'Video')], max_length=10)),
+                ('alt_text', models.CharField(blank=True, max_length=255)),
+                ('total_size', models.PositiveBigIntegerField(help_text='Size of the complete file in bytes')),
+                ('chunk_size', models.PositiveIntegerField(help_text='Size of every part except the last')),
+                ('received_parts', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='posts.post')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
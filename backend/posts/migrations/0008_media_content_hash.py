@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='media',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file; the file is a link to the shared blob with this hash', max_length=64),
+        ),
+    ]
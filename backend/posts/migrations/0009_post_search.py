@@ -0,0 +1,88 @@
+# Generated by Django 6.0 on 2026-10-18 05:16
+
+import html
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# Frozen copies of posts/search.py as of this migration, so later changes
+# there don't change what it does
+FTS_TABLE = 'posts_post_search'
+SEARCHABLE_BLOCKS = ('text', 'heading', 'code', 'code-display')
+
+
+def build_search_document(post):
+    parts = [post.description]
+    for block in post.blocks:
+        if block.get('type') in SEARCHABLE_BLOCKS and block.get('content'):
+            content = block['content']
+            if block['type'] == 'text':
+                content = html.unescape(strip_tags(content)).strip()
+            parts.append(content)
+    return '\n'.join(part for part in parts if part)
+
+
+def fts_rowid(pk):
+    return pk.int >> 65
+
+
+def backfill_search_documents(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = list(Post.objects.only('id', 'description', 'blocks'))
+    for post in posts:
+        post.search_document = build_search_document(post)
+    Post.objects.bulk_update(posts, ['search_document'], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("""
+            ALTER TABLE posts_post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(search_document, '')), 'B')
+            ) STORED
+        """)
+        schema_editor.execute('CREATE INDEX posts_post_search_vector_idx ON posts_post USING gin (search_vector)')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                post_id UNINDEXED, title, search_document, tokenize='porter unicode61'
+            )
+        """)
+        Post = apps.get_model('posts', 'Post')
+        id_field = Post._meta.pk
+        rows = [
+            (fts_rowid(pk), id_field.get_db_prep_value(pk, connection), title, document)
+            for pk, title, document in Post.objects.values_list('id', 'title', 'search_document').iterator()
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, post_id, title, search_document) VALUES (%s, %s, %s, %s)', rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS posts_post_search_vector_idx')
+        schema_editor.execute('ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_media_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, help_text='Description and block text indexed for search (posts/search.py)'),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 6.0 on 2026-10-18 05:24
+
+import hashlib
+import html
+import json
+import math
+
+from django.db import migrations, models
+from django.utils.html import escape, format_html, strip_tags
+from django.utils.safestring import mark_safe
+
+# A frozen copy of posts/rendering.py (RENDER_VERSION 1) as of this
+# migration, without its block cache, so later changes there don't change
+# what it does and migrating doesn't write to the cache. The hashes match
+# what Post.save computes for version 1, so saves skip re-rendering until
+# the markup changes.
+RENDER_VERSION = '1'
+WORDS_PER_MINUTE = 200
+PAGE_CODE_LANGUAGES = ('css', 'javascript', 'html')
+
+
+def blocks_hash(blocks):
+    canonical = json.dumps(blocks, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{RENDER_VERSION}:{canonical}'.encode()).hexdigest()
+
+
+def html_to_text(markup):
+    return html.unescape(strip_tags(markup)).strip()
+
+
+def figure(image):
+    caption = image.get('caption') or ''
+    markup = format_html('<img src="{}" alt="{}" loading="lazy">', image.get('src', ''), caption)
+    if caption:
+        markup += format_html('<figcaption>{}</figcaption>', caption)
+    return markup, caption
+
+
+def render_block(block):
+    kind = block.get('type')
+    if kind == 'text':
+        content = block.get('content', '')
+        return format_html('<div class="block-text">{}</div>', mark_safe(content)), html_to_text(content)
+    if kind == 'heading':
+        try:
+            level = min(max(int(block.get('level') or 2), 1), 6)
+        except (TypeError, ValueError):
+            level = 2
+        content = block.get('content', '')
+        return f'<h{level}>{escape(content)}</h{level}>', content
+    if kind == 'image':
+        classes = f"block-image position-{block.get('position') or 'center'} size-{block.get('size') or 'medium'}"
+        markup, caption = figure(block)
+        return format_html('<figure class="{}">{}</figure>', classes, mark_safe(markup)), caption
+    if kind == 'image-row':
+        figures, captions = [], []
+        for image in block.get('images') or []:
+            markup, caption = figure(image)
+            figures.append(format_html('<figure class="image-row-item">{}</figure>', mark_safe(markup)))
+            captions.append(caption)
+        markup = format_html(
+            '<div class="block-image-row columns-{}">{}</div>', block.get('columns') or 2, mark_safe(''.join(figures)),
+        )
+        return markup, '\n'.join(caption for caption in captions if caption)
+    if kind == 'video':
+        return format_html('<div class="block-video"><video src="{}" controls></video></div>', block.get('src', '')), ''
+    if kind in ('code', 'code-display'):
+        if kind == 'code' and block.get('language') in PAGE_CODE_LANGUAGES:
+            return '', ''
+        content = block.get('content', '')
+        language = block.get('language') or 'javascript'
+        markup = format_html(
+            '<div class="collapsible-code-block"><pre><code class="language-{}">{}</code></pre></div>', language, content,
+        )
+        return markup, content
+    return '', ''
+
+
+def render_existing_posts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = list(Post.objects.only('id', 'blocks'))
+    for post in posts:
+        fragments = [(str(markup), text) for markup, text in map(render_block, post.blocks)]
+        post.rendered_html = '<div class="blocks">{}</div>'.format(''.join(markup for markup, _ in fragments))
+        post.plain_text = '\n\n'.join(text for _, text in fragments if text)
+        post.word_count = len(post.plain_text.split())
+        post.reading_time = math.ceil(post.word_count / WORDS_PER_MINUTE)
+        post.render_hash = blocks_hash(post.blocks)
+    Post.objects.bulk_update(
+        posts, ['rendered_html', 'plain_text', 'word_count', 'reading_time', 'render_hash'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='plain_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Minutes'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='render_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False, help_text='Blocks rendered to HTML (posts/rendering.py)'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-18 05:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A frozen copy of posts/sitemaps.build_shards as of this migration, so
+# later changes there don't change what it does
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        if len(chunk) >= size and row[0] != chunk[-1][0]:
+            yield chunk
+            chunk = []
+        chunk.append(row)
+    if chunk:
+        yield chunk
+
+
+def build_sitemap(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    SitemapShard = apps.get_model('posts', 'SitemapShard')
+    rows = (
+        Post.objects.filter(status='published')
+        .order_by('published_at', 'id')
+        .values_list('published_at', 'author__username', 'slug', 'updated_at')
+        .iterator(chunk_size=2000)
+    )
+    size = getattr(settings, 'SITEMAP_SHARD_SIZE', 10000)
+    SitemapShard.objects.bulk_create([
+        SitemapShard(
+            number=number,
+            starts_at=chunk[0][0] if number else None,
+            entries=[[f'/blog/{username}/post/{slug}', updated_at.isoformat()] for _, username, slug, updated_at in chunk],
+            last_modified=max(row[3] for row in chunk),
+        )
+        for number, chunk in enumerate(chunks(rows, size))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_rendered_blocks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitemapShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(unique=True)),
+                ('starts_at', models.DateTimeField(blank=True, help_text='Earliest publication time in the shard; empty for the first shard', null=True)),
+                ('entries', models.JSONField(default=list)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+        migrations.RunPython(build_sitemap, migrations.RunPython.noop),
+    ]
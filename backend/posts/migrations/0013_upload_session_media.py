@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='media_id',
+            field=models.UUIDField(blank=True, editable=False, help_text='Media created on completion', null=True),
+        ),
+    ]
@@ -1,11 +1,23 @@
 import uuid
 import os
+import random
+import re
 import shutil
-from django.db import models
+from collections import defaultdict
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
 
+from . import blobs, rendering, search, sitemaps
+from .metrics import ORGANIZE_DURATION, ORGANIZE_MOVES
+from .profiling import span
+from .cache import invalidate_post
+from .tracking import ChangeTrackingMixin
+
 
 def post_media_path(instance, filename):
     """Upload media to media/{username}/posts/{post_slug}/{filename}"""
@@ -17,6 +29,10 @@ def post_media_path(instance, filename):
     return f'{username}/uploads/{filename}'
 
 
+# Matches both /media/{username}/uploads/{file} and /blog/media/{username}/uploads/{file}
+UPLOAD_URL_RE = re.compile(r'/(?:blog/)?media/([^/]+)/uploads/([^/]+)$')
+
+
 def cover_image_path(instance, filename):
     """Upload cover images to media/{username}/posts/{slug}/{filename}"""
     username = instance.author.username
@@ -24,7 +40,7 @@ def cover_image_path(instance, filename):
     return f'{username}/posts/{slug}/{filename}'
 
 
-class Post(models.Model):
+class Post(ChangeTrackingMixin, models.Model):
     """
     Blog post with flexible block-based content.
     """
@@ -32,6 +48,11 @@ class Post(models.Model):
         DRAFT = 'draft', 'Draft'
         PUBLISHED = 'published', 'Published'
 
+    class MediaStatus(models.TextChoices):
+        SETTLED = 'settled', 'Settled'
+        SETTLING = 'settling', 'Settling'
+        FAILED = 'failed', 'Failed'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     title = models.CharField(max_length=200)
@@ -43,35 +64,82 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(blank=True, null=True)
+    media_status = models.CharField(
+        max_length=10, choices=MediaStatus.choices, default=MediaStatus.SETTLED,
+        help_text="Whether uploaded images referenced in blocks still need to be moved into the post folder"
+    )
+    rendered_html = models.TextField(blank=True, editable=False, help_text="Blocks rendered to HTML (posts/rendering.py)")
+    plain_text = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False, help_text="Minutes")
+    render_hash = models.CharField(max_length=64, blank=True, editable=False)
+    search_document = models.TextField(
+        blank=True, editable=False,
+        help_text="Description and block text indexed for search (posts/search.py)"
+    )
 
     class Meta:
         ordering = ['-created_at']
+        # One partial index per feed, in the order its keyset pagination seeks
+        # (posts/pagination.py), so each page is a range scan with no sort
+        indexes = [
+            models.Index(
+                fields=['published_at', 'id'],
+                condition=models.Q(status='published'),
+                name='post_published_idx',
+            ),
+            models.Index(
+                fields=['author', 'published_at', 'id'],
+                condition=models.Q(status='published'),
+                name='post_author_published_idx',
+            ),
+            models.Index(
+                fields=['author', 'created_at', 'id'],
+                condition=models.Q(status='draft'),
+                name='post_author_draft_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    # Attempts at inserting with a freshly allocated slug before giving up
+    SLUG_RETRIES = 8
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title) or 'untitled'
-            original_slug = self.slug
-            counter = 1
-            while Post.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
-
-        # Track if cover image changed
-        cover_image_changed = False
-        if self.pk:
-            try:
-                old_instance = Post.objects.get(pk=self.pk)
-                if old_instance.cover_image != self.cover_image:
-                    cover_image_changed = True
-            except Post.DoesNotExist:
-                cover_image_changed = True
-        elif self.cover_image:
-            cover_image_changed = True
+        allocated_slug = not self.slug
+        if allocated_slug:
+            self.slug = self.allocate_slug()
+
+        # Feeds paginate on published_at, so a published post must always have one
+        if self.status == self.Status.PUBLISHED and not self.published_at:
+            self.published_at = timezone.now()
+
+        # Compared against the values loaded from the database, so no re-read is needed
+        changed = self.changed_fields()
+
+        # Moving uploads into the post folder happens in the media job worker
+        needs_organize = 'blocks' in changed and self.has_unsettled_media()
+        if needs_organize:
+            self.media_status = self.MediaStatus.SETTLING
+
+        cover_image_changed = 'cover_image' in changed
 
-        super().save(*args, **kwargs)
+        if 'blocks' in changed:
+            self.render_blocks()
+
+        search_changed = bool(changed & {'title', 'description', 'blocks'})
+        if search_changed:
+            self.search_document = search.build_search_document(self)
+
+        kwargs = self.update_fields_kwargs(kwargs)
+        if allocated_slug:
+            self._save_with_free_slug(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+        if search_changed:
+            search.index_posts([self])
 
         # Create Media object for cover image if it was just uploaded
         if cover_image_changed and self.cover_image:
@@ -82,14 +150,20 @@ class Post(models.Model):
                 else:
                     file_size = os.path.getsize(self.cover_image.path)
 
-                # Check if Media object already exists for this file
-                existing_media = Media.objects.filter(file=self.cover_image.name).first()
+                # Share storage with identical files already uploaded
+                content_hash = blobs.adopt(self.cover_image.name)
+
+                # Check if Media object already exists for this file (or this content in this post)
+                existing_media = Media.objects.filter(
+                    models.Q(file=self.cover_image.name) | models.Q(post=self, content_hash=content_hash)
+                ).first()
                 if not existing_media:
                     print(f"Creating Media object for cover image: {self.cover_image.name}")
                     media = Media.objects.create(
                         post=self,
                         uploaded_by=self.author,
                         file=self.cover_image.name,
+                        content_hash=content_hash,
                         media_type=Media.MediaType.IMAGE,
                         filename=os.path.basename(self.cover_image.name),
                         file_size=file_size,
@@ -104,82 +178,199 @@ class Post(models.Model):
                 print(f"Failed to create Media object for cover image: {e}")
                 traceback.print_exc()
 
-        self.organize_media()
-
-    def organize_media(self):
-        """Move uploaded images to post folder based on URLs in blocks"""
-        username = self.author.username
-        post_folder = os.path.join(settings.MEDIA_ROOT, username, 'posts', self.slug)
-        os.makedirs(post_folder, exist_ok=True)
-
-        updated = False
+        if needs_organize:
+            from .jobs import enqueue_organize_media
+            enqueue_organize_media(self)
+
+        # Published posts are listed in the sitemap shard for their publication time
+        if 'status' in changed or self.status == self.Status.PUBLISHED:
+            sitemaps.schedule_update([self.loaded_value('published_at'), self.published_at])
+
+        # Before the snapshot, so it can tell what the status was
+        invalidate_post(self)
+        self.take_snapshot()
+
+    def allocate_slug(self, spread=1):
+        """
+        First free slug for the title: `base`, then `base-1`, `base-2`, ...
+
+        Every candidate shares the base as a prefix, so one indexed
+        `LIKE 'base%'` query finds all the taken ones. With `spread` > 1 a
+        random pick among that many free suffixes is returned instead, so
+        writers that just collided don't all chase the same next slug.
+        """
+        # Leave room for a numeric suffix within the column's max_length
+        base = slugify(self.title)[:self._meta.get_field('slug').max_length - 8].strip('-') or 'untitled'
+        suffix_re = re.compile(rf'^{re.escape(base)}(?:-(\d+))?$')
+        taken = set()
+        for slug in Post.objects.filter(slug__startswith=base).exclude(pk=self.pk).values_list('slug', flat=True):
+            match = suffix_re.match(slug)
+            if match:
+                taken.add(int(match[1] or 0))
+        free = [n for n in range(len(taken) + spread) if n not in taken][:spread]
+        counter = random.choice(free)
+        return f'{base}-{counter}' if counter else base
+
+    def _save_with_free_slug(self, *args, **kwargs):
+        # Two creates with the same title can allocate the same slug; the
+        # unique constraint catches the loser, which allocates again
+        for attempt in range(1, self.SLUG_RETRIES + 1):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                slug_taken = Post.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                if not slug_taken or attempt == self.SLUG_RETRIES:
+                    raise
+                self.slug = self.allocate_slug(spread=2 ** attempt)
+
+    def render_blocks(self):
+        """Store the rendered form of the blocks, unless they are unchanged since the last render."""
+        if self.render_hash == rendering.blocks_hash(self.blocks):
+            return
+        rendered = rendering.render_blocks(self.blocks)
+        self.rendered_html = rendered.html
+        self.plain_text = rendered.text
+        self.word_count = rendered.word_count
+        self.reading_time = rendered.reading_time
+        self.render_hash = rendered.render_hash
+
+    def image_sources(self):
+        """Yield (dict, key) for every image URL in the blocks."""
         for block in self.blocks:
             if block.get('type') == 'image' and block.get('src'):
-                if self._move_media_file(block, 'src', post_folder, username):
-                    updated = True
+                yield block, 'src'
             elif block.get('type') == 'image-row' and block.get('images'):
                 for image in block['images']:
                     if image.get('src'):
-                        if self._move_media_file(image, 'src', post_folder, username):
-                            updated = True
+                        yield image, 'src'
 
-        # Save updated URLs to database without triggering organize_media again
-        if updated:
-            Post.objects.filter(pk=self.pk).update(blocks=self.blocks)
+    def has_unsettled_media(self):
+        """True if any image block still points at a file in an uploads/ folder."""
+        return any(UPLOAD_URL_RE.search(data[key]) for data, key in self.image_sources())
 
-    def _move_media_file(self, block_data, key, post_folder, username):
-        """Move a single media file to the post folder and update the URL"""
-        import re
+    def organize_media(self):
+        """
+        Move uploaded images referenced in blocks into the post folder and
+        point the blocks and Media rows at their new location in one pass:
+        one move per file, then a single write for the blocks and one
+        UPDATE for the Media rows of each uploader.
+        """
+        with ORGANIZE_DURATION.time():
+            self._organize_media()
+
+    def _organize_media(self):
+        # The blocks being rewritten, as stored; see the write at the end
+        rendered_from = self.render_hash
+        references = []
+        for data, key in self.image_sources():
+            match = UPLOAD_URL_RE.search(data[key])
+            if match:
+                references.append((data, key, match.group(1), match.group(2)))
+        if not references:
+            return
 
-        url = block_data.get(key, '')
-        if not url:
-            return False
+        username = self.author.username
+        post_folder = os.path.join(settings.MEDIA_ROOT, username, 'posts', self.slug)
+        os.makedirs(post_folder, exist_ok=True)
 
-        # Match both /media/{username}/uploads/ and /blog/media/{username}/uploads/
-        match = re.search(r'/(?:blog/)?media/([^/]+)/uploads/([^/]+)$', url)
-        if not match:
+        # Upload name ({user}/uploads/{file}) -> whether it now lives in the post folder
+        settled = {}
+        with span('files'):
+            for _, _, url_username, filename in references:
+                upload_name = f'{url_username}/uploads/{filename}'
+                if upload_name not in settled:
+                    settled[upload_name] = self._move_upload(upload_name, os.path.join(post_folder, filename))
+        moved_count = sum(settled.values())
+        ORGANIZE_MOVES.inc(moved_count, result='moved')
+        ORGANIZE_MOVES.inc(len(settled) - moved_count, result='skipped')
+
+        for data, key, url_username, filename in references:
+            if settled[f'{url_username}/uploads/{filename}']:
+                # Rewrite the URL in block data - handle both URL formats
+                prefix = '/blog/media/' if '/blog/media/' in data[key] else '/media/'
+                data[key] = data[key].replace(
+                    f'{prefix}{url_username}/uploads/{filename}',
+                    f'{prefix}{username}/posts/{self.slug}/{filename}',
+                )
+
+        # Repoint the Media rows with one UPDATE per uploader instead of a save per image
+        moved_by_uploader = defaultdict(list)
+        for upload_name, moved in settled.items():
+            if moved:
+                moved_by_uploader[upload_name.split('/', 1)[0]].append(upload_name)
+        if not moved_by_uploader:
+            return
+        for url_username, upload_names in moved_by_uploader.items():
+            Media.objects.filter(file__in=upload_names).update(
+                post=self,
+                file=Concat(
+                    Value(f'{username}/posts/{self.slug}/'),
+                    Substr('file', len(f'{url_username}/uploads/') + 1),
+                    output_field=models.CharField(),
+                ),
+            )
+
+        # Save updated URLs (and the HTML showing them) without triggering organize_media again.
+        # Only over the blocks read above: an author save that landed meanwhile wins, and
+        # if its blocks still point at uploads it queued a job that rewrites them.
+        self.render_blocks()
+        rendered_fields = ['blocks', 'rendered_html', 'plain_text', 'word_count', 'reading_time', 'render_hash']
+        written = Post.objects.filter(pk=self.pk, render_hash=rendered_from).update(
+            **{field: getattr(self, field) for field in rendered_fields}
+        )
+        if written:
+            self.take_snapshot(rendered_fields)
+
+    def _move_upload(self, upload_name, new_path):
+        """
+        Move one uploaded file to `new_path`. Returns True if the file is now
+        only in the post folder - including when an earlier job already moved
+        it (e.g. an editor that saved again before reloading the settled blocks).
+        """
+        old_path = os.path.join(settings.MEDIA_ROOT, upload_name)
+        try:
+            # Uploads are links into the blob store, so moving is relinking:
+            # one syscall that fails if either side is not as expected
+            os.link(old_path, new_path)
+        except FileNotFoundError:
+            return os.path.exists(new_path)
+        except FileExistsError:
+            # Both copies exist; leave the reference alone
             return False
-
-        url_username = match.group(1)
-        filename = match.group(2)
-        old_path = os.path.join(settings.MEDIA_ROOT, url_username, 'uploads', filename)
-        new_path = os.path.join(post_folder, filename)
-
-        if os.path.exists(old_path) and not os.path.exists(new_path):
+        except OSError:
+            # Filesystems without hard links
+            if os.path.exists(new_path):
+                return False
             shutil.move(old_path, new_path)
-
-            # Update the URL in block data - handle both URL formats
-            if '/blog/media/' in url:
-                new_url = url.replace(f'/blog/media/{url_username}/uploads/{filename}', f'/blog/media/{username}/posts/{self.slug}/{filename}')
-            else:
-                new_url = url.replace(f'/media/{url_username}/uploads/{filename}', f'/media/{username}/posts/{self.slug}/{filename}')
-            block_data[key] = new_url
-
-            # Update Media model if exists
-            media = Media.objects.filter(file=f'{url_username}/uploads/{filename}').first()
-            if media:
-                media.file.name = f'{username}/posts/{self.slug}/{filename}'
-                media.post = self
-                media.save()
-
             return True
-
-        return False
+        os.unlink(old_path)
+        return True
 
     def delete(self, *args, **kwargs):
-        # Delete the post's media folder
+        # Delete the post's media folder. Its files are links into the blob
+        # store, so content shared with other posts survives.
         username = self.author.username
         post_folder = os.path.join(settings.MEDIA_ROOT, username, 'posts', self.slug)
         if os.path.exists(post_folder):
-            shutil.rmtree(post_folder)
+            with span('files'):
+                shutil.rmtree(post_folder)
 
         # Delete associated media records
+        content_hashes = list(self.media.values_list('content_hash', flat=True))
         self.media.all().delete()
 
-        super().delete(*args, **kwargs)
+        search.unindex_post(self)
+        result = super().delete(*args, **kwargs)
+        blobs.release_blobs(content_hashes)
+        if self.status == self.Status.PUBLISHED:
+            sitemaps.schedule_update([self.published_at])
+        invalidate_post(self)
+        return result
 
 
-class Media(models.Model):
+class Media(ChangeTrackingMixin, models.Model):
     """Uploaded media files (images, videos)."""
     class MediaType(models.TextChoices):
         IMAGE = 'image', 'Image'
@@ -191,7 +382,11 @@ class Media(models.Model):
     file = models.FileField(upload_to=post_media_path)
     media_type = models.CharField(max_length=10, choices=MediaType.choices)
     filename = models.CharField(max_length=255)
-    file_size = models.PositiveIntegerField(help_text="File size in bytes")
+    file_size = models.PositiveBigIntegerField(help_text="File size in bytes")
+    content_hash = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        help_text="SHA-256 of the file; the file is a link to the shared blob with this hash"
+    )
     alt_text = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -204,22 +399,13 @@ class Media(models.Model):
 
     def save(self, *args, **kwargs):
         """Move file to correct location if post is assigned"""
-        is_new = self.pk is None
-        old_post = None
-
-        # Check if post assignment changed
-        if not is_new:
-            try:
-                old_instance = Media.objects.get(pk=self.pk)
-                old_post = old_instance.post
-            except Media.DoesNotExist:
-                pass
+        post_changed = 'post' in self.changed_fields()
 
         # Save the instance first
-        super().save(*args, **kwargs)
+        super().save(*args, **self.update_fields_kwargs(kwargs))
 
         # Move file if post was assigned/changed
-        if self.post and (is_new or old_post != self.post):
+        if self.post and post_changed:
             current_name = self.file.name
             username = self.post.author.username
             expected_path = f'{username}/posts/{self.post.slug}/{os.path.basename(current_name)}'
@@ -238,4 +424,120 @@ class Media(models.Model):
                     shutil.move(old_file_path, new_file_path)
 
                     # Update database with new path (without triggering save recursion)
-                    Media.objects.filter(pk=self.pk).update(file=self.file.name)
\ No newline at end of file
+                    Media.objects.filter(pk=self.pk).update(file=self.file.name)
+
+        self.take_snapshot()
+        if self.post:
+            invalidate_post(self.post)
+
+    def delete(self, *args, **kwargs):
+        post = self.post
+        result = super().delete(*args, **kwargs)
+        blobs.release_blobs([self.content_hash])
+        if post:
+            invalidate_post(post)
+        return result
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload sent in fixed-size parts (see posts/uploads.py).
+
+    Parts are written straight into a temp file under MEDIA_ROOT, so
+    completing the upload is a rename into the post folder, not a copy.
+    A completed session keeps a link to its Media until it expires, so a
+    retried complete returns the same row instead of creating another.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    media_type = models.CharField(max_length=10, choices=Media.MediaType.choices)
+    alt_text = models.CharField(max_length=255, blank=True)
+    total_size = models.PositiveBigIntegerField(help_text="Size of the complete file in bytes")
+    chunk_size = models.PositiveIntegerField(help_text="Size of every part except the last")
+    received_parts = models.JSONField(default=list)
+    # A plain id rather than a foreign key, so deleting media doesn't have to
+    # cascade through this table
+    media_id = models.UUIDField(null=True, blank=True, editable=False, help_text="Media created on completion")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.filename} ({len(self.received_parts)}/{self.part_count} parts)'
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def part_size(self, number):
+        if number == self.part_count - 1:
+            return self.total_size - number * self.chunk_size
+        return self.chunk_size
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.MEDIA_ROOT, '.chunked', f'{self.pk}.part')
+
+
+class MediaJob(models.Model):
+    """
+    Deferred media work for a post, run by `python manage.py run_media_jobs`.
+
+    At most one pending job exists per post and kind: saving again while a
+    job is queued reuses it, and the job reads the post's latest blocks when
+    it runs, so it's safe to run any job more than once.
+    """
+    class Kind(models.TextChoices):
+        ORGANIZE_MEDIA = 'organize', 'Organize media'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='media_jobs')
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.ORGANIZE_MEDIA)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'kind'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_media_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} for {self.post_id} ({self.status})'
+
+
+class SitemapShard(models.Model):
+    """
+    One file of the sitemap (see posts/sitemaps.py): the published posts from
+    `starts_at` up to the next shard's start, stored as (path, lastmod) pairs.
+    """
+    number = models.PositiveIntegerField(unique=True)
+    starts_at = models.DateTimeField(
+        null=True, blank=True, help_text="Earliest publication time in the shard; empty for the first shard",
+    )
+    entries = models.JSONField(default=list)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['number']
+
+    def __str__(self):
+        return f'Sitemap {self.number} ({len(self.entries)} posts)'
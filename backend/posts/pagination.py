@@ -0,0 +1,182 @@
+import base64
+import json
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .search import search_post_ids
+
+
+class PostPageSizeMixin:
+    """Page size from settings, overridable per request up to a maximum."""
+    page_size_query_param = 'page_size'
+
+    @property
+    def page_size(self):
+        return settings.POSTS_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.POSTS_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+
+class KeysetPagination(PostPageSizeMixin, BasePagination):
+    """
+    Cursor pagination that seeks on a (timestamp, id) pair instead of an offset.
+
+    Every page is a single indexed range scan, so fetching page 500 costs the
+    same as page 1, and posts published while a reader is paging only ever
+    appear ahead of their cursor - they never shift or duplicate later pages.
+    """
+    ordering_field = 'created_at'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views."""
+        return self._set_page([row async for row in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        field = self.ordering_field
+
+        queryset = queryset.order_by(f'-{field}', '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+            )
+
+        # Fetch one extra row to find out whether there is a next page
+        return queryset[:self.limit + 1]
+
+    def _set_page(self, results):
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(getattr(last, self.ordering_field), last.pk)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        payload = json.dumps([value.isoformat(), str(pk)], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            timestamp = parse_datetime(value)
+            pk = uuid.UUID(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk
+
+
+class PublishedPostPagination(KeysetPagination):
+    """Public feeds, newest publication first."""
+    ordering_field = 'published_at'
+
+
+class DraftPostPagination(KeysetPagination):
+    """An author's drafts, newest first."""
+    ordering_field = 'created_at'
+
+
+class SearchPagination(PostPageSizeMixin, BasePagination):
+    """
+    Numbered pages over ranked search results.
+
+    Rank is computed per query, so there is no stored column to seek on as
+    KeysetPagination does; readers rarely go past the first few pages.
+    Responses have the same shape as the feeds.
+    """
+    page_query_param = 'page'
+    invalid_page_message = 'Invalid page'
+
+    def paginate_search(self, query, queryset, request):
+        """The page of `queryset` posts matching `query` requested by `request`, in rank order."""
+        self.request = request
+        self.limit = self.get_page_size(request)
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        # Fetch one extra id to find out whether there is a next page
+        ids = search_post_ids(query, self.limit + 1, (self.number - 1) * self.limit)
+        self.has_next = len(ids) > self.limit
+        ids = ids[:self.limit]
+        posts = queryset.in_bulk(ids)
+        self.page = [posts[pk] for pk in ids if pk in posts]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+            ('results', data),
+        ]))
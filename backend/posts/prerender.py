@@ -0,0 +1,208 @@
+"""
+Static pre-rendering of public reads for nginx to serve directly.
+
+Every public GET that only depends on published posts is written to
+PRERENDER_ROOT at its own URL path:
+
+    /blog/api/posts/                               site index (first page)
+    /blog/api/posts/{slug}/                        post detail
+    /blog/api/users/{username}/posts/              author feed (first page)
+    /blog/api/users/{username}/posts/{slug}/       post detail
+
+as `{PRERENDER_ROOT}{path}index.json`. nginx answers plain GETs for those
+paths with try_files and falls back to Django for everything else
+(see nginx.conf). The JSON is produced by calling the API views
+themselves, so it is byte-for-byte what Django would have answered.
+
+`manage.py prerender_posts` writes everything and removes stale files.
+After that, every invalidate_post() of a post that is or was published
+re-exports it, its author's feed and the index once the transaction
+commits, or removes the post's files when it is no longer published. Files are written to a temp
+file and renamed, so nginx never serves a partial response.
+
+With PRERENDER_HTML, each post also gets a standalone HTML page at its
+frontend route (/blog/{username}/post/{slug}/index.html), which nginx
+serves to crawlers instead of the app.
+"""
+import logging
+import os
+import tempfile
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+logger = logging.getLogger(__name__)
+
+JSON_FILE = 'index.json'
+HTML_FILE = 'index.html'
+
+
+def schedule_post_export(post):
+    """Re-export `post` and the feeds it appears in once the current transaction commits."""
+    # Read these now; the post may have changed again by the time the callback runs
+    slug, username = post.slug, post.author.username
+
+    def run():
+        try:
+            export_post(slug, username)
+        except Exception:
+            # A failed export leaves the old files; nginx keeps serving them until the next run
+            logger.exception('Pre-rendering post %s by %s failed', slug, username)
+
+    transaction.on_commit(run)
+
+
+def export_post(slug, username):
+    """Write (or remove, if it's no longer public) one post, plus its author's feed and the index."""
+    written = set()
+    if slug not in reserved_slugs():
+        for path in post_paths(slug, username):
+            _export_path(path, written)
+        if settings.PRERENDER_HTML:
+            _export_html(slug, username, written)
+    for path in [reverse('user-posts', kwargs={'username': username}), reverse('post-list')]:
+        _export_path(path, written)
+    return written
+
+
+def export_all(html=None):
+    """Write every pre-rendered file and delete the ones that are no longer public."""
+    from .models import Post
+
+    if html is None:
+        html = settings.PRERENDER_HTML
+    written = set()
+    _export_path(reverse('post-list'), written)
+
+    reserved = reserved_slugs()
+    authors = set()
+    posts = (
+        Post.objects.filter(status=Post.Status.PUBLISHED)
+        .values_list('slug', 'author__username')
+        .iterator(chunk_size=2000)
+    )
+    for slug, username in posts:
+        if username not in authors:
+            authors.add(username)
+            _export_path(reverse('user-posts', kwargs={'username': username}), written)
+        if slug in reserved:
+            continue
+        for path in post_paths(slug, username):
+            _export_path(path, written)
+        if html:
+            _export_html(slug, username, written)
+
+    removed = _remove_stale(written)
+    return written, removed
+
+
+def post_paths(slug, username):
+    return [
+        reverse('post-detail', kwargs={'slug': slug}),
+        reverse('user-post-detail', kwargs={'username': username, 'slug': slug}),
+    ]
+
+
+def reserved_slugs():
+    """Slugs that the API routes to a list action (e.g. /posts/drafts/) rather than a post."""
+    from .views import PostViewSet
+    return {action.url_path for action in PostViewSet.get_extra_actions() if not action.detail}
+
+
+def _request(path):
+    base = urlsplit(settings.PRERENDER_BASE_URL)
+    return RequestFactory().get(path, secure=base.scheme == 'https', HTTP_HOST=base.netloc)
+
+
+def _export_path(path, written):
+    match = resolve(path)
+    # Under ASYNC_READS the route resolves to a coroutine view; export through the sync one
+    view = getattr(match.func, 'sync_view', match.func)
+    response = view(_request(path), **match.kwargs)
+    target = _target(path, JSON_FILE)
+    if response.status_code == 200:
+        response.render()
+        _write_atomic(target, response.content)
+        written.add(target)
+    elif response.status_code == 404:
+        _remove(target)
+    else:
+        raise RuntimeError(f'{path} answered {response.status_code}')
+
+
+def _export_html(slug, username, written):
+    from .models import Post
+
+    target = _target(f'/blog/{username}/post/{slug}/', HTML_FILE)
+    post = (
+        Post.objects.filter(slug=slug, author__username=username, status=Post.Status.PUBLISHED)
+        .select_related('author').first()
+    )
+    if post is None:
+        _remove(target)
+        return
+    _write_atomic(target, post_page(post).encode())
+    written.add(target)
+
+
+def post_page(post):
+    """A standalone page with the post's stored rendering (see posts/rendering.py)."""
+    canonical = settings.PRERENDER_BASE_URL.rstrip('/') + f'/blog/{post.author.username}/post/{post.slug}'
+    return format_html(
+        '<!doctype html>\n<html lang="en"><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        '<title>{}</title><meta name="description" content="{}"><link rel="canonical" href="{}"></head>'
+        '<body><article><h1>{}</h1><p class="byline">{} &middot; {} min read</p>{}</article></body></html>\n',
+        post.title, post.description, canonical, post.title, post.author.username, post.reading_time,
+        mark_safe(post.rendered_html),
+    )
+
+
+def _target(path, filename):
+    return os.path.join(settings.PRERENDER_ROOT, path.strip('/'), filename)
+
+
+def _write_atomic(target, content):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        # mkstemp creates 0600 files; nginx runs as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove(target):
+    try:
+        os.remove(target)
+    except FileNotFoundError:
+        return
+    # Drop the now-empty directories up to the root
+    directory = os.path.dirname(target)
+    root = os.path.abspath(settings.PRERENDER_ROOT)
+    while os.path.abspath(directory) != root:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def _remove_stale(written):
+    removed = 0
+    for directory, _, files in os.walk(settings.PRERENDER_ROOT, topdown=False):
+        for name in files:
+            path = os.path.join(directory, name)
+            if name in (JSON_FILE, HTML_FILE) and path not in written:
+                _remove(path)
+                removed += 1
+    return removed
@@ -0,0 +1,170 @@
+"""
+Opt-in per-request profiling.
+
+ProfilingMiddleware profiles a PROFILING_SAMPLE_RATE share of requests and
+reports where their time went in a Server-Timing header, which browser dev
+tools show next to the request:
+
+    db        time in SQL, with the query count
+    serialize building response data in serializers (outside SQL)
+    files     file moves and writes: uploads, organize_media, deletes
+    auth      authenticating the request (outside SQL)
+    app       the whole request
+
+Profiled requests slower than PROFILING_SLOW_MS are also logged to
+`posts.profiling` as a JSON record with the most expensive SQL statements.
+
+Code marks the sections it wants measured with `span(name)`. With sampling
+off the middleware removes itself from the stack at startup and span() is a
+context variable lookup, so unprofiled requests pay next to nothing.
+"""
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+
+# Server-Timing metric names, in header order
+SPANS = ('serialize', 'files', 'auth')
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.span_ms = defaultdict(float)
+        self.db_ms = 0.0
+        self.queries = []
+        self.open_spans = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.db_ms += elapsed
+            self.queries.append((sql, elapsed))
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def top_queries(self, count):
+        """The `count` statements with the most total time, identical SQL grouped."""
+        grouped = defaultdict(lambda: [0, 0.0])
+        for sql, elapsed in self.queries:
+            grouped[sql][0] += 1
+            grouped[sql][1] += elapsed
+        ranked = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:count]
+        return [{'sql': sql, 'count': calls, 'ms': round(total, 2)} for sql, (calls, total) in ranked]
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block, minus SQL time, to `name` in the current profile."""
+    profile = _current.get()
+    # Nested spans of the same name (e.g. nested serializers) count once
+    if profile is None or name in profile.open_spans:
+        yield
+        return
+    profile.open_spans.add(name)
+    start, db_before = time.perf_counter(), profile.db_ms
+    try:
+        yield
+    finally:
+        profile.open_spans.discard(name)
+        profile.span_ms[name] += (time.perf_counter() - start) * 1000 - (profile.db_ms - db_before)
+
+
+class ProfiledSerializerMixin:
+    """Count a serializer's to_representation() as 'serialize' time."""
+    def to_representation(self, instance):
+        with span('serialize'):
+            return super().to_representation(instance)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Time queries on every connection (connection_created, see apps.py); async views query from other threads."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.PROFILING_SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        profile = Profile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        total_ms = profile.elapsed_ms()
+        response['Server-Timing'] = server_timing(profile, total_ms)
+        if total_ms >= settings.PROFILING_SLOW_MS:
+            logger.warning('Slow request %s', json.dumps(slow_request_record(request, response, profile, total_ms)))
+        return response
+
+
+def server_timing(profile, total_ms):
+    metrics = [f'db;dur={profile.db_ms:.1f};desc="{len(profile.queries)} queries"']
+    metrics += [f'{name};dur={profile.span_ms[name]:.1f}' for name in SPANS if name in profile.span_ms]
+    metrics.append(f'app;dur={total_ms:.1f}')
+    return ', '.join(metrics)
+
+
+def slow_request_record(request, response, profile, total_ms):
+    return {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(total_ms, 2),
+        'db_ms': round(profile.db_ms, 2),
+        'queries': len(profile.queries),
+        **{f'{name}_ms': round(profile.span_ms[name], 2) for name in SPANS},
+        'top_queries': profile.top_queries(settings.PROFILING_TOP_QUERIES),
+    }
@@ -0,0 +1,135 @@
+"""
+Server-side rendering of post blocks.
+
+Post.save renders the blocks once and stores the HTML, plain text, word
+count and reading time on the post, so readers, feeds and previews never
+have to interpret the block JSON themselves. The markup mirrors the
+frontend's BlockRenderer.
+
+Rendering is skipped when the blocks hash to the stored `render_hash`.
+Bump RENDER_VERSION when the markup changes to render every post again.
+"""
+import hashlib
+import html
+import json
+import math
+
+from django.utils.html import escape, format_html, strip_tags
+from django.utils.safestring import mark_safe
+
+RENDER_VERSION = '1'
+WORDS_PER_MINUTE = 200
+
+# Code blocks in these languages are applied to the page rather than shown
+PAGE_CODE_LANGUAGES = ('css', 'javascript', 'html')
+
+RENDERERS = {}
+
+
+def renderer(block_type):
+    """Register the function that renders blocks of `block_type` to (html, text)."""
+    def register(func):
+        RENDERERS[block_type] = func
+        return func
+    return register
+
+
+class Rendered:
+    def __init__(self, html, text, render_hash):
+        self.html = html
+        self.text = text
+        self.render_hash = render_hash
+        self.word_count = len(text.split())
+        self.reading_time = math.ceil(self.word_count / WORDS_PER_MINUTE)
+
+
+def blocks_hash(blocks):
+    canonical = json.dumps(blocks, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{RENDER_VERSION}:{canonical}'.encode()).hexdigest()
+
+
+def render_blocks(blocks):
+    """Render a post's blocks to HTML and plain text."""
+    fragments = [render_block(block) for block in blocks]
+    body = ''.join(fragment_html for fragment_html, _ in fragments)
+    text = '\n\n'.join(fragment_text for _, fragment_text in fragments if fragment_text)
+    return Rendered(f'<div class="blocks">{body}</div>', text, blocks_hash(blocks))
+
+
+def render_block(block):
+    render = RENDERERS.get(block.get('type'))
+    if render is None:
+        return '', ''
+    markup, text = render(block)
+    return str(markup), text
+
+
+def html_to_text(markup):
+    return html.unescape(strip_tags(markup)).strip()
+
+
+@renderer('text')
+def render_text(block):
+    # Rich text from the author's editor, inserted as-is like the frontend does
+    content = block.get('content', '')
+    return format_html('<div class="block-text">{}</div>', mark_safe(content)), html_to_text(content)
+
+
+@renderer('heading')
+def render_heading(block):
+    try:
+        level = min(max(int(block.get('level') or 2), 1), 6)
+    except (TypeError, ValueError):
+        level = 2
+    content = block.get('content', '')
+    return f'<h{level}>{escape(content)}</h{level}>', content
+
+
+@renderer('image')
+def render_image(block):
+    classes = f"block-image position-{block.get('position') or 'center'} size-{block.get('size') or 'medium'}"
+    figure, caption = _figure(block)
+    return format_html('<figure class="{}">{}</figure>', classes, mark_safe(figure)), caption
+
+
+@renderer('image-row')
+def render_image_row(block):
+    figures, captions = [], []
+    for image in block.get('images') or []:
+        figure, caption = _figure(image)
+        figures.append(format_html('<figure class="image-row-item">{}</figure>', mark_safe(figure)))
+        captions.append(caption)
+    markup = format_html(
+        '<div class="block-image-row columns-{}">{}</div>', block.get('columns') or 2, mark_safe(''.join(figures)),
+    )
+    return markup, '\n'.join(caption for caption in captions if caption)
+
+
+@renderer('video')
+def render_video(block):
+    return format_html('<div class="block-video"><video src="{}" controls></video></div>', block.get('src', '')), ''
+
+
+@renderer('code')
+def render_code(block):
+    if block.get('language') in PAGE_CODE_LANGUAGES:
+        return '', ''
+    return render_code_display(block)
+
+
+@renderer('code-display')
+def render_code_display(block):
+    content = block.get('content', '')
+    language = block.get('language') or 'javascript'
+    markup = format_html(
+        '<div class="collapsible-code-block"><pre><code class="language-{}">{}</code></pre></div>', language, content,
+    )
+    return markup, content
+
+
+def _figure(image):
+    caption = image.get('caption') or ''
+    markup = format_html('<img src="{}" alt="{}" loading="lazy">', image.get('src', ''), caption)
+    if caption:
+        markup += format_html('<figcaption>{}</figcaption>', caption)
+    return markup, caption
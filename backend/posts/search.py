@@ -0,0 +1,128 @@
+"""
+Full-text search over published posts.
+
+Post.save keeps `search_document` (description plus the text of text,
+heading and code blocks) up to date; the title is indexed alongside it
+with a higher weight. The index itself depends on the database:
+
+  PostgreSQL  a generated `search_vector` tsvector column on posts_post
+              with a GIN index, queried with websearch_to_tsquery and
+              ranked with ts_rank_cd.
+  SQLite      an FTS5 table (posts_post_search) holding the same columns,
+              written by Post.save/delete and ranked with bm25. Its rowid
+              is derived from the post's UUID rather than shared with
+              posts_post, so it survives the table rebuilds SQLite
+              migrations do and a post's row is found without a scan.
+
+Both are created by migration 0009, outside the ORM, so the model looks the
+same on either backend. Searches return one page of post ids in rank order.
+"""
+import re
+
+from django.db import connection
+
+from .rendering import html_to_text
+
+SEARCHABLE_BLOCKS = ('text', 'heading', 'code', 'code-display')
+
+FTS_TABLE = 'posts_post_search'
+
+# Title matches count this much more than body matches
+TITLE_WEIGHT = 10.0
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_search_document(post):
+    """Plain text of everything in `post` worth searching, apart from the title."""
+    parts = [post.description]
+    for block in post.blocks:
+        if block.get('type') in SEARCHABLE_BLOCKS and block.get('content'):
+            content = block['content']
+            if block['type'] == 'text':
+                # Text blocks hold rich-text HTML
+                content = html_to_text(content)
+            parts.append(content)
+    return '\n'.join(part for part in parts if part)
+
+
+def search_post_ids(query, limit, offset=0):
+    """Ids of published posts matching `query`, best match first."""
+    if connection.vendor == 'postgresql':
+        sql = """
+            SELECT p.id
+            FROM posts_post p, websearch_to_tsquery('english', %s) query
+            WHERE p.search_vector @@ query AND p.status = 'published'
+            ORDER BY ts_rank_cd(p.search_vector, query) DESC, p.published_at DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [query, limit, offset]
+    else:
+        match = fts5_query(query)
+        if not match:
+            return []
+        sql = f"""
+            SELECT p.id
+            FROM {FTS_TABLE} s JOIN posts_post p ON p.id = s.post_id
+            WHERE {FTS_TABLE} MATCH %s AND p.status = 'published'
+            ORDER BY bm25({FTS_TABLE}, 0.0, {TITLE_WEIGHT}, 1.0), p.published_at DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [match, limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    id_field = _id_field()
+    return [id_field.to_python(pk) for pk, in rows]
+
+
+def index_posts(posts):
+    """
+    Refresh the SQLite search rows for `posts`. PostgreSQL computes its
+    search column itself, so this is a no-op there.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    id_field = _id_field()
+    rows = [
+        (fts_rowid(post.pk), id_field.get_db_prep_value(post.pk, connection), post.title, post.search_document)
+        for post in posts
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, post_id, title, search_document) VALUES (%s, %s, %s, %s)',
+            rows,
+        )
+
+
+def unindex_post(post):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [fts_rowid(post.pk)])
+
+
+def fts_rowid(pk):
+    """Positive 63-bit integer id for a post's FTS5 row, taken from its UUID."""
+    return pk.int >> 65
+
+
+def fts5_query(query):
+    """
+    Turn free text into an FTS5 expression that can't be a syntax error:
+    every word quoted and all of them required, the last one as a prefix
+    so results show up while the reader is still typing.
+    """
+    words = WORD_RE.findall(query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _id_field():
+    from .models import Post
+    return Post._meta.pk
@@ -0,0 +1,180 @@
+"""
+Realistic sample data for development, load tests and benchmarks.
+
+seed_blog() creates authors with a mix of published posts and drafts whose
+blocks use every block type, plus image files on disk for their image
+blocks. Rows are bulk inserted with the fields Post.save would derive
+(rendering, search document), image files go through the blob store like
+uploads do, and the sitemap and response caches are refreshed afterwards,
+so the result behaves like data created through the API.
+
+Used by `python manage.py seed_blog` and the 'api' benchmark scenario.
+"""
+import io
+import os
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import slugify
+from PIL import Image
+
+from . import blobs, search, sitemaps
+from .cache import bump_version, feed_scope
+from .models import Media, Post
+
+WORDS = (
+    'the a of and to in is it that for on with as was at by this from an be or are have not but had his they '
+    'you we one all there their what so up out if about who get which go me when make can like time no just '
+    'him know take people into year your good some could them see other than then now look only come its '
+    'over think also back after use two how our work first well way even new want because any these give '
+    'day most us river mountain morning kitchen garden train station window letter coffee winter summer '
+    'project release server database query cache latency deploy branch commit review test build script'
+).split()
+
+HEADINGS = ['Getting started', 'What went wrong', 'The fix', 'Lessons learned', 'Next steps', 'Notes', 'Day two']
+
+CODE_SNIPPETS = [
+    ('python', 'def total(items):\n    return sum(item.price for item in items)\n'),
+    ('javascript', 'const total = items.reduce((sum, item) => sum + item.price, 0);\n'),
+    ('bash', 'git log --oneline | head -n 20\n'),
+    ('sql', 'SELECT author_id, count(*) FROM posts_post GROUP BY author_id;\n'),
+]
+
+# Reused pixels, so some uploads are byte-identical and share a blob like real reposts do
+IMAGE_COLOURS = [(n * 37 % 256, n * 91 % 256, n * 53 % 256) for n in range(24)]
+IMAGE_SIZE = (320, 240)
+
+
+class SeedResult:
+    def __init__(self):
+        self.users = 0
+        self.posts = 0
+        self.drafts = 0
+        self.media = 0
+        self.media_bytes = 0
+        self.usernames = []
+
+
+def seed_blog(users=10, posts_per_user=50, media_per_post=2, draft_ratio=0.2, seed=0,
+              password='password', prefix='writer'):
+    """Create `users` authors with `posts_per_user` posts each; returns a SeedResult."""
+    rng = random.Random(seed)
+    result = SeedResult()
+    tag = uuid.uuid4().hex[:6]
+    hashed_password = make_password(password)
+    authors = User.objects.bulk_create([
+        User(username=f'{prefix}-{tag}-{n}', email=f'{prefix}-{tag}-{n}@example.com', password=hashed_password)
+        for n in range(users)
+    ])
+    result.users = len(authors)
+    result.usernames = [author.username for author in authors]
+
+    images = {}
+    now = timezone.now()
+    for author in authors:
+        posts, media = [], []
+        for n in range(posts_per_user):
+            post = _make_post(rng, author, now - timedelta(minutes=rng.randrange(365 * 24 * 60)))
+            if rng.random() < draft_ratio:
+                post.status, post.published_at = Post.Status.DRAFT, None
+                result.drafts += 1
+
+            uploads = [_write_image(rng, author, post, i, images) for i in range(media_per_post)]
+            media.extend(uploads)
+            post.blocks = _make_blocks(rng, [f'/blog/media/{upload.file.name}' for upload in uploads])
+            post.render_blocks()
+            post.search_document = search.build_search_document(post)
+            posts.append(post)
+
+        Post.objects.bulk_create(posts, batch_size=500)
+        Media.objects.bulk_create(media, batch_size=500)
+        search.index_posts(posts)
+        bump_version(feed_scope(author.username))
+
+        result.posts += len(posts)
+        result.media += len(media)
+        result.media_bytes += sum(upload.file_size for upload in media)
+
+    sitemaps.rebuild()
+    bump_version(feed_scope())
+    return result
+
+
+def _make_post(rng, author, published_at):
+    title = _sentence(rng, 3, 8).rstrip('.')
+    return Post(
+        id=uuid.uuid4(),
+        author=author,
+        title=title,
+        slug=f'{slugify(title)[:180]}-{uuid.uuid4().hex[:8]}',
+        description=_sentence(rng, 10, 25),
+        status=Post.Status.PUBLISHED,
+        published_at=published_at,
+    )
+
+
+def _make_blocks(rng, image_urls):
+    """A post body: paragraphs and headings around the images, with some code."""
+    blocks = [{'type': 'text', 'content': _paragraph(rng)}]
+    for _ in range(rng.randint(2, 6)):
+        kind = rng.choices(['text', 'heading', 'code', 'code-display', 'video'], [10, 3, 2, 1, 1])[0]
+        if kind == 'text':
+            blocks.append({'type': 'text', 'content': _paragraph(rng)})
+        elif kind == 'heading':
+            blocks.append({'type': 'heading', 'level': rng.choice([2, 3]), 'content': rng.choice(HEADINGS)})
+        elif kind == 'video':
+            blocks.append({'type': 'video', 'src': '/blog/media/samples/clip.mp4'})
+        else:
+            language, content = rng.choice(CODE_SNIPPETS)
+            blocks.append({'type': kind, 'language': language, 'content': content})
+
+    # The first image stands alone somewhere in the text; more than one other goes in a row
+    singles, row = (image_urls, []) if len(image_urls) < 3 else (image_urls[:1], image_urls[1:])
+    for url in singles:
+        blocks.insert(rng.randint(1, len(blocks)), {
+            'type': 'image', 'src': url, 'caption': _sentence(rng, 3, 8), 'size': 'large',
+        })
+    if row:
+        blocks.append({'type': 'image-row', 'columns': min(len(row), 4), 'images': [{'src': url} for url in row]})
+
+    for n, block in enumerate(blocks):
+        block['id'] = str(n)
+    return blocks
+
+
+def _write_image(rng, author, post, number, images):
+    colour = rng.choice(IMAGE_COLOURS)
+    if colour not in images:
+        buffer = io.BytesIO()
+        Image.new('RGB', IMAGE_SIZE, colour).save(buffer, 'PNG')
+        images[colour] = buffer.getvalue()
+    content = images[colour]
+
+    name = f'{author.username}/posts/{post.slug}/image-{number}.png'
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return Media(
+        post=post,
+        uploaded_by=author,
+        file=name,
+        content_hash=blobs.adopt(name),
+        media_type=Media.MediaType.IMAGE,
+        filename=os.path.basename(name),
+        file_size=len(content),
+    )
+
+
+def _sentence(rng, shortest, longest):
+    words = rng.choices(WORDS, k=rng.randint(shortest, longest))
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng):
+    return '<p>' + ' '.join(_sentence(rng, 6, 18) for _ in range(rng.randint(2, 6))) + '</p>'
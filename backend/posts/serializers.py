@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Post, Media
+from django.conf import settings
+from .models import Post, Media, UploadSession
+from .blobs import store_upload
+from .images import srcset
+from .profiling import ProfiledSerializerMixin
 import json
+import os
 
 
 class JSONStringField(serializers.JSONField):
@@ -22,19 +27,40 @@ class JSONStringField(serializers.JSONField):
         return super().to_internal_value(data)
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+def absolute_srcset(request, name):
+    """Derivative URLs for an image as {format: {width: absolute url}}."""
+    sizes = srcset(name)
+    if sizes is None or not request:
+        return None
+    return {
+        fmt: {width: request.build_absolute_uri(url) for width, url in urls.items()}
+        for fmt, urls in sizes.items()
+    }
+
+
+def detect_media_type(filename):
+    filename = filename.lower()
+    if filename.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+        return Media.MediaType.IMAGE
+    if filename.endswith(('.mp4', '.webm', '.mov')):
+        return Media.MediaType.VIDEO
+    return None
+
+
+class AuthorSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username']
 
 
-class MediaSerializer(serializers.ModelSerializer):
+class MediaSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Media
-        fields = ['id', 'url', 'media_type', 'filename', 'file_size', 'alt_text', 'created_at']
-        read_only_fields = ['id', 'url', 'file_size', 'created_at']
+        fields = ['id', 'url', 'srcset', 'media_type', 'filename', 'file_size', 'alt_text', 'created_at']
+        read_only_fields = ['id', 'url', 'srcset', 'file_size', 'created_at']
 
     def get_url(self, obj):
         request = self.context.get('request')
@@ -42,8 +68,13 @@ class MediaSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.file.url)
         return None
 
+    def get_srcset(self, obj):
+        if obj.media_type != Media.MediaType.IMAGE:
+            return None
+        return absolute_srcset(self.context.get('request'), obj.file.name)
+
 
-class MediaUploadSerializer(serializers.ModelSerializer):
+class MediaUploadSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     post_slug = serializers.SlugField(write_only=True, required=False)
 
     class Meta:
@@ -53,26 +84,21 @@ class MediaUploadSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         post_slug = validated_data.pop('post_slug', None)
         file = validated_data['file']
-        filename = file.name.lower()
         user = self.context['request'].user
 
-        if filename.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-            media_type = Media.MediaType.IMAGE
-        elif filename.endswith(('.mp4', '.webm', '.mov')):
-            media_type = Media.MediaType.VIDEO
-        else:
+        media_type = detect_media_type(file.name)
+        if media_type is None:
             raise serializers.ValidationError("Unsupported file type")
 
         # Find the post if slug provided
         post = None
         if post_slug:
             try:
-                post = Post.objects.get(slug=post_slug, author=user)
+                post = Post.objects.select_related('author').get(slug=post_slug, author=user)
             except Post.DoesNotExist:
                 pass
 
-        return Media.objects.create(
-            file=file,
+        media = Media(
             filename=file.name,
             file_size=file.size,
             media_type=media_type,
@@ -80,16 +106,69 @@ class MediaUploadSerializer(serializers.ModelSerializer):
             uploaded_by=user,
             post=post
         )
+        # Identical files share one blob; the post path is a link to it
+        name = media.file.field.generate_filename(media, file.name)
+        media.file.name, media.content_hash = store_upload(file, name)
+        media.save()
+        return media
+
+
+class UploadSessionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    part_count = serializers.IntegerField(read_only=True)
 
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'media_type', 'total_size', 'chunk_size', 'part_count',
+            'received_parts', 'media_id', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    post_slug = serializers.SlugField(required=False)
+    alt_text = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+    def validate_filename(self, value):
+        value = os.path.basename(value)
+        if detect_media_type(value) is None:
+            raise serializers.ValidationError("Unsupported file type")
+        return value
 
-class PostListSerializer(serializers.ModelSerializer):
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes")
+        return value
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        post = None
+        post_slug = validated_data.get('post_slug')
+        if post_slug:
+            post = Post.objects.select_related('author').filter(slug=post_slug, author=user).first()
+
+        return UploadSession.objects.create(
+            uploaded_by=user,
+            post=post,
+            filename=validated_data['filename'],
+            media_type=detect_media_type(validated_data['filename']),
+            alt_text=validated_data.get('alt_text', ''),
+            total_size=validated_data['size'],
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        )
+
+
+class PostListSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     cover_image_url = serializers.SerializerMethodField()
+    cover_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'description', 'cover_image_url',
+            'id', 'title', 'slug', 'description', 'cover_image_url', 'cover_image_srcset',
             'author', 'status', 'created_at', 'updated_at', 'published_at'
         ]
 
@@ -99,20 +178,27 @@ class PostListSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.cover_image.url)
         return None
 
+    def get_cover_image_srcset(self, obj):
+        return absolute_srcset(self.context.get('request'), obj.cover_image.name)
 
-class PostDetailSerializer(serializers.ModelSerializer):
+
+class PostDetailSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     cover_image_url = serializers.SerializerMethodField()
+    cover_image_srcset = serializers.SerializerMethodField()
     media = MediaSerializer(many=True, read_only=True)
 
     class Meta:
         model = Post
         fields = [
             'id', 'title', 'slug', 'description', 'cover_image', 'cover_image_url',
-            'blocks', 'author', 'status', 'created_at', 'updated_at',
-            'published_at', 'media'
+            'cover_image_srcset', 'blocks', 'rendered_html', 'word_count', 'reading_time', 'author',
+            'status', 'created_at', 'updated_at', 'published_at', 'media', 'media_status'
+        ]
+        read_only_fields = [
+            'id', 'slug', 'author', 'created_at', 'updated_at', 'media_status',
+            'rendered_html', 'word_count', 'reading_time',
         ]
-        read_only_fields = ['id', 'slug', 'author', 'created_at', 'updated_at']
 
     def get_cover_image_url(self, obj):
         request = self.context.get('request')
@@ -120,15 +206,18 @@ class PostDetailSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.cover_image.url)
         return None
 
+    def get_cover_image_srcset(self, obj):
+        return absolute_srcset(self.context.get('request'), obj.cover_image.name)
+
 
-class PostCreateUpdateSerializer(serializers.ModelSerializer):
+class PostCreateUpdateSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     # Use custom JSONStringField to handle JSON strings from multipart form data
     blocks = JSONStringField(required=False, allow_null=False)
 
     class Meta:
         model = Post
-        fields = ['title', 'description', 'cover_image', 'blocks', 'status', 'slug']
-        read_only_fields = ['slug']
+        fields = ['title', 'description', 'cover_image', 'blocks', 'status', 'slug', 'media_status']
+        read_only_fields = ['slug', 'media_status']
 
     def validate_blocks(self, value):
         if not isinstance(value, list):
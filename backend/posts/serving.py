@@ -0,0 +1,164 @@
+"""
+Media file serving.
+
+In production Django only decides *whether* a file may be served and hands
+the transfer back to the front proxy with an X-Accel-Redirect (nginx) or
+X-Sendfile (Apache/lighttpd) header, so no worker is tied up streaming
+bytes. Missing image derivatives are built on their first request. The
+'django' mode streams the file itself and is meant for local
+development; it still honours Range and conditional requests so video
+seeking works the same as behind nginx.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .images import build_derivative
+from .models import Media
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+UPLOAD_PATH_RE = re.compile(r'^(?P<username>[^/]+)/uploads/(?P<filename>[^/]+)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def serve_media(request, path):
+    # Dot folders under MEDIA_ROOT are internal stores (.blobs, .chunked), never media
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('Media not found')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Media not found')
+    if not os.path.isfile(fullpath) and not build_derivative(path):
+        moved_to = _settled_location(path)
+        if moved_to:
+            return HttpResponseRedirect(settings.MEDIA_URL + quote(moved_to))
+        raise Http404('Media not found')
+
+    stat = os.stat(fullpath)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+    else:
+        response = _file_response(request, fullpath, stat.st_size, content_type, etag, last_modified)
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _settled_location(path):
+    """
+    Where an upload went after the media worker moved it into a post folder.
+    Editors can still hold the old uploads/ URL until they reload the post.
+    """
+    match = UPLOAD_PATH_RE.match(path)
+    if not match:
+        return None
+    media = (
+        Media.objects.filter(
+            uploaded_by__username=match['username'],
+            file__startswith=f"{match['username']}/posts/",
+            file__endswith=f"/{match['filename']}",
+        )
+        .order_by('-created_at')
+        .first()
+    )
+    return media.file.name if media else None
+
+
+def _file_response(request, fullpath, size, content_type, etag, last_modified):
+    byte_range = _requested_range(request, size, etag, last_modified)
+    if byte_range is None:
+        return FileResponse(open(fullpath, 'rb'), content_type=content_type)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(fullpath, start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def _requested_range(request, size, etag, last_modified):
+    """
+    Return (start, end) for a satisfiable single range, False for an
+    unsatisfiable one and None when the whole file should be sent.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    if not header:
+        return None
+
+    # If-Range: only honour the range when the client's copy is still current
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    # Multiple ranges are rare for media; RFC 9110 allows answering with the full body
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        # Syntactically invalid, so the header is ignored
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _read_range(fullpath, start, length):
+    with open(fullpath, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
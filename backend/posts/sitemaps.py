@@ -0,0 +1,146 @@
+"""
+Sharded, incrementally maintained sitemap of published posts.
+
+Posts are split by publication time into SitemapShard rows of at most
+SITEMAP_SHARD_SIZE posts, and /blog/api/sitemap.xml is an index of them.
+Shard n holds the posts published from its `starts_at` up to shard n+1's,
+so a post stays in the same shard for as long as it keeps its publication
+time: publishing, unpublishing, editing, renaming or deleting a post
+rebuilds the one shard it falls in (two when republishing moves it), with a
+range query over that shard alone. New posts land in the last shard, which
+splits off a new one when it grows past the limit; earlier shards shrink on
+deletes but are never renumbered, so crawlers keep their URLs.
+
+Crawlers only ever read the stored shards, through the versioned response
+cache (posts/cache.py), so crawling never queries posts_post.
+`manage.py build_sitemaps` builds everything from scratch; the first update
+after that table is emptied does the same.
+"""
+import bisect
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from .cache import bump_version
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def sitemap_scope():
+    return ('sitemap',)
+
+
+def schedule_update(published_ats):
+    """Rebuild the shards holding posts published at `published_ats` once the transaction commits."""
+    published_ats = {published_at for published_at in published_ats if published_at}
+    if published_ats:
+        transaction.on_commit(lambda: update_shards(published_ats), robust=True)
+
+
+def update_shards(published_ats):
+    from .models import SitemapShard
+
+    shards = list(SitemapShard.objects.only('number', 'starts_at'))
+    if not shards:
+        rebuild()
+        return
+
+    # Shard 0 has no start and takes everything before shard 1
+    starts = [shard.starts_at for shard in shards[1:]]
+    for index in sorted({bisect.bisect_right(starts, published_at) for published_at in published_ats}):
+        _rebuild_shard(shards, index)
+    bump_version(sitemap_scope())
+
+
+def rebuild():
+    """Recreate every shard from the published posts."""
+    from .models import Post, SitemapShard
+
+    with transaction.atomic():
+        SitemapShard.objects.all().delete()
+        build_shards(Post.objects.filter(status=Post.Status.PUBLISHED), SitemapShard)
+    bump_version(sitemap_scope())
+
+
+def build_shards(published_posts, shard_model):
+    """Create shards for `published_posts`."""
+    rows = _post_rows(published_posts).iterator(chunk_size=2000)
+    shard_model.objects.bulk_create([
+        shard_model(number=number, starts_at=chunk[0][0] if number else None, **_contents(chunk))
+        for number, chunk in enumerate(_chunks(rows))
+    ])
+
+
+def _rebuild_shard(shards, index):
+    from .models import Post, SitemapShard
+
+    shard = shards[index]
+    posts = Post.objects.filter(status=Post.Status.PUBLISHED)
+    if shard.starts_at:
+        posts = posts.filter(published_at__gte=shard.starts_at)
+    is_last = index == len(shards) - 1
+    if not is_last:
+        posts = posts.filter(published_at__lt=shards[index + 1].starts_at)
+    rows = list(_post_rows(posts))
+
+    # Only the last shard splits; the others may shrink but keep their place
+    chunks = list(_chunks(rows)) if is_last else [rows]
+    with transaction.atomic():
+        SitemapShard.objects.filter(pk=shard.pk).update(**_contents(chunks[0] if chunks else []))
+        for offset, chunk in enumerate(chunks[1:], start=1):
+            SitemapShard.objects.create(number=shard.number + offset, starts_at=chunk[0][0], **_contents(chunk))
+
+
+def _post_rows(posts):
+    return posts.order_by('published_at', 'id').values_list('published_at', 'author__username', 'slug', 'updated_at')
+
+
+def _chunks(rows):
+    """Split rows into shards of at most SITEMAP_SHARD_SIZE, never between posts published at the same time."""
+    chunk = []
+    for row in rows:
+        if len(chunk) >= settings.SITEMAP_SHARD_SIZE and row[0] != chunk[-1][0]:
+            yield chunk
+            chunk = []
+        chunk.append(row)
+    if chunk:
+        yield chunk
+
+
+def _contents(rows):
+    return {
+        'entries': [[f'/blog/{username}/post/{slug}', updated_at.isoformat()] for _, username, slug, updated_at in rows],
+        'last_modified': max((row[3] for row in rows), default=None),
+    }
+
+
+def render_index(request):
+    """The sitemap index as (xml, last_modified)."""
+    from .models import SitemapShard
+
+    shards = list(SitemapShard.objects.filter(last_modified__isnull=False).values_list('number', 'last_modified'))
+    items = [
+        f'<sitemap><loc>{escape(request.build_absolute_uri(f"/blog/api/sitemap-{number}.xml"))}</loc>'
+        f'<lastmod>{last_modified.isoformat()}</lastmod></sitemap>'
+        for number, last_modified in shards
+    ]
+    return _document('sitemapindex', items), max((modified for _, modified in shards), default=None)
+
+
+def render_shard(request, number):
+    """Shard `number` as (xml, last_modified)."""
+    from .models import SitemapShard
+
+    shard = get_object_or_404(SitemapShard, number=number)
+    items = [
+        f'<url><loc>{escape(request.build_absolute_uri(path))}</loc><lastmod>{lastmod}</lastmod></url>'
+        for path, lastmod in shard.entries
+    ]
+    return _document('urlset', items), shard.last_modified
+
+
+def _document(root, items):
+    body = ''.join(items)
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{SITEMAP_NS}">{body}</{root}>\n'
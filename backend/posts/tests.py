@@ -1,3 +1,1183 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from types import ModuleType
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import audit, blobs, images, metrics, rendering, sitemaps, urls as post_urls
+from .async_views import async_read_patterns
+from .jobs import claim_next_job, run_job
+from .models import Post, Media, MediaJob, SitemapShard, UploadSession
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='blog-test-media-')
+
+# SQLite keeps its search index in a separate FTS5 table that saves write to;
+# PostgreSQL computes a generated column instead
+SEARCH_INDEX_QUERIES = 1 if connection.vendor == 'sqlite' else 0
+
+
+def make_image(name='photo.png'):
+    return SimpleUploadedFile(name, b'\x89PNG\r\n\x1a\n' + b'0' * 64, content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class BlogTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='secret-pass-123')
+        self.client = APIClient()
+
+    def make_posts(self, count, status=Post.Status.PUBLISHED, media_per_post=0, author=None):
+        author = author or self.author
+        posts = []
+        for _ in range(count):
+            post = Post.objects.create(author=author, title='Weekly update', status=status)
+            for _ in range(media_per_post):
+                Media.objects.create(
+                    post=post,
+                    uploaded_by=author,
+                    file=make_image(),
+                    media_type=Media.MediaType.IMAGE,
+                    filename='photo.png',
+                    file_size=72,
+                )
+            posts.append(post)
+        return posts
+
+
+class PaginationTests(BlogTestCase):
+    def walk(self, url):
+        """Slugs from every page of `url`, following `next` links."""
+        slugs = []
+        while url:
+            body = self.client.get(url).json()
+            slugs += [post['slug'] for post in body['results']]
+            url = body['next']
+        return slugs
+
+    def test_walk_covers_ties_in_order(self):
+        posts = self.make_posts(7)
+        # Five share a publication time, so the cursor has to fall back to the id
+        tied = timezone.now()
+        Post.objects.filter(pk__in=[post.pk for post in posts[:5]]).update(published_at=tied)
+
+        expected = list(
+            Post.objects.order_by('-published_at', '-id').values_list('slug', flat=True)
+        )
+        self.assertEqual(self.walk('/blog/api/posts/?page_size=2'), expected)
+
+    def test_posts_published_mid_walk_do_not_shift_later_pages(self):
+        self.make_posts(5)
+        first = self.client.get('/blog/api/posts/?page_size=2').json()
+        newer = self.make_posts(1)[0]
+
+        rest = self.walk(first['next'])
+        slugs = [post['slug'] for post in first['results']] + rest
+        self.assertNotIn(newer.slug, slugs)
+        self.assertEqual(len(slugs), len(set(slugs)))
+        self.assertEqual(len(slugs), 5)
+
+    def test_invalid_or_tampered_cursors_are_404(self):
+        self.make_posts(1)
+        post = Post.objects.get()
+        tampered = base64.urlsafe_b64encode(json.dumps(['not-a-date', str(post.pk)]).encode()).decode()
+        for cursor in ['garbage', tampered, base64.urlsafe_b64encode(b'[1]').decode()]:
+            response = self.client.get('/blog/api/posts/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    @override_settings(POSTS_PAGE_SIZE=2, POSTS_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        self.make_posts(5)
+        self.assertEqual(len(self.client.get('/blog/api/posts/').json()['results']), 2)
+        self.assertEqual(len(self.client.get('/blog/api/posts/?page_size=100').json()['results']), 3)
+        self.assertEqual(len(self.client.get('/blog/api/posts/?page_size=0').json()['results']), 2)
+
+    def test_drafts_are_ordered_by_creation(self):
+        drafts = self.make_posts(4, status=Post.Status.DRAFT)
+        # The oldest draft; publication time plays no part for drafts
+        Post.objects.filter(pk=drafts[0].pk).update(
+            created_at=timezone.now() - timedelta(days=1), published_at=timezone.now(),
+        )
+        self.client.force_authenticate(self.author)
+
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('slug', flat=True))
+        self.assertEqual(self.walk('/blog/api/posts/drafts/?page_size=3'), expected)
+        self.assertEqual(expected[-1], drafts[0].slug)
+
+
+class QueryBudgetTests(BlogTestCase):
+    """
+    Every endpoint in posts/urls.py runs a fixed number of queries no matter
+    how many posts or media rows it returns. If one of these fails after a
+    serializer change, eager-load the new relation rather than raising the budget.
+    """
+
+    def assertQueryBudget(self, budget, method, url, grow=None, **kwargs):
+        with self.assertNumQueries(budget):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        if grow:
+            grow()
+            with self.assertNumQueries(budget):
+                getattr(self.client, method)(url, **kwargs)
+        return response
+
+    def test_post_list(self):
+        self.make_posts(2, media_per_post=1)
+        self.assertQueryBudget(1, 'get', '/blog/api/posts/', grow=lambda: self.make_posts(10, media_per_post=2))
+
+    def test_post_detail(self):
+        post = self.make_posts(1, media_per_post=1)[0]
+
+        def grow():
+            for _ in range(5):
+                Media.objects.create(
+                    post=post, uploaded_by=self.author, file=make_image(),
+                    media_type=Media.MediaType.IMAGE, filename='photo.png', file_size=72,
+                )
+
+        self.assertQueryBudget(2, 'get', f'/blog/api/posts/{post.slug}/', grow=grow)
+
+    def test_drafts(self):
+        self.client.force_authenticate(self.author)
+        self.make_posts(2, status=Post.Status.DRAFT)
+        self.assertQueryBudget(
+            1, 'get', '/blog/api/posts/drafts/',
+            grow=lambda: self.make_posts(10, status=Post.Status.DRAFT, media_per_post=1),
+        )
+
+    def test_user_post_list(self):
+        self.make_posts(2)
+        self.assertQueryBudget(
+            2, 'get', f'/blog/api/users/{self.author.username}/posts/',
+            grow=lambda: self.make_posts(10, media_per_post=1),
+        )
+
+    def test_user_post_detail(self):
+        post = self.make_posts(1, media_per_post=3)[0]
+        self.assertQueryBudget(3, 'get', f'/blog/api/users/{self.author.username}/posts/{post.slug}/')
+
+    def test_create_post(self):
+        self.client.force_authenticate(self.author)
+        self.assertQueryBudget(
+            4 + SEARCH_INDEX_QUERIES, 'post', '/blog/api/posts/',
+            data={'title': 'Weekly update', 'blocks': [{'id': '1', 'type': 'text', 'content': 'Hi'}]},
+            format='json',
+            # Colliding slugs must not cost a query each
+            grow=lambda: self.make_posts(10),
+        )
+
+    def test_update_post(self):
+        self.client.force_authenticate(self.author)
+        post = self.make_posts(1, media_per_post=2)[0]
+        self.assertQueryBudget(
+            2 + SEARCH_INDEX_QUERIES, 'patch', f'/blog/api/posts/{post.slug}/',
+            data={'description': 'Updated'}, format='json',
+        )
+
+    def test_search(self):
+        self.make_posts(3)
+        self.assertQueryBudget(2, 'get', '/blog/api/posts/search/', grow=lambda: self.make_posts(10), data={'q': 'weekly'})
+
+    def test_publish_and_unpublish(self):
+        self.client.force_authenticate(self.author)
+        post = self.make_posts(1, status=Post.Status.DRAFT, media_per_post=2)[0]
+        self.assertQueryBudget(3, 'post', f'/blog/api/posts/{post.slug}/publish/')
+        self.assertQueryBudget(3, 'post', f'/blog/api/posts/{post.slug}/unpublish/')
+
+    def test_delete_post(self):
+        self.client.force_authenticate(self.author)
+        post = self.make_posts(1, media_per_post=3)[0]
+        self.assertQueryBudget(7 + SEARCH_INDEX_QUERIES, 'delete', f'/blog/api/posts/{post.slug}/')
+
+    def test_media_list(self):
+        self.client.force_authenticate(self.author)
+        self.make_posts(1, media_per_post=2)
+        self.assertQueryBudget(1, 'get', '/blog/api/media/', grow=lambda: self.make_posts(3, media_per_post=3))
+
+    def test_media_detail(self):
+        self.client.force_authenticate(self.author)
+        media = self.make_posts(1, media_per_post=1)[0].media.get()
+        self.assertQueryBudget(1, 'get', f'/blog/api/media/{media.pk}/')
+
+    def test_media_upload(self):
+        self.client.force_authenticate(self.author)
+        post = self.make_posts(1)[0]
+        self.assertQueryBudget(
+            2, 'post', '/blog/api/media/',
+            data={'file': make_image(), 'alt_text': 'A photo', 'post_slug': post.slug},
+            format='multipart',
+        )
+
+    def test_media_delete(self):
+        self.client.force_authenticate(self.author)
+        media = self.make_posts(1, media_per_post=1)[0].media.get()
+        self.assertQueryBudget(2, 'delete', f'/blog/api/media/{media.pk}/')
+
+
+class QueryPlanTests(BlogTestCase):
+    """
+    The feed queries must stay index range scans as the table grows. A
+    failure here means a query no longer matches the indexes in Post.Meta.
+    """
+    AUTHORS = 20
+    POSTS_PER_AUTHOR = 250
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = User.objects.bulk_create(
+            [User(username=f'writer{n}') for n in range(cls.AUTHORS)]
+        )
+        now = timezone.now()
+        Post.objects.bulk_create([
+            Post(
+                author=author, title='Post', slug=f'{author.username}-{n}',
+                # One post in five is a draft
+                status=Post.Status.DRAFT if n % 5 == 0 else Post.Status.PUBLISHED,
+                published_at=None if n % 5 == 0 else now - timezone.timedelta(minutes=n),
+            )
+            for author in authors
+            for n in range(cls.POSTS_PER_AUTHOR)
+        ], batch_size=1000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        super().setUp()
+        self.writer = User.objects.get(username='writer3')
+
+    def post_query(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return next(query['sql'] for query in queries if 'FROM "posts_post"' in query['sql'])
+
+    def assertIndexScan(self, sql, index):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                self.assertIn(f'USING INDEX {index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+            else:
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                self.assertIn(index, plan)
+                self.assertNotIn('Seq Scan on posts_post', plan)
+                self.assertNotIn('Sort', plan)
+
+    def test_post_list(self):
+        first = self.client.get('/blog/api/posts/').json()
+        self.assertIndexScan(self.post_query('/blog/api/posts/'), 'post_published_idx')
+        self.assertIndexScan(self.post_query(first['next']), 'post_published_idx')
+
+    def test_author_feed(self):
+        self.assertIndexScan(self.post_query('/blog/api/users/writer3/posts/'), 'post_author_published_idx')
+
+    def test_drafts(self):
+        self.client.force_authenticate(self.writer)
+        self.assertIndexScan(self.post_query('/blog/api/posts/drafts/'), 'post_author_draft_idx')
+
+
+class ResponseCacheTests(BlogTestCase):
+    def test_repeat_reads_are_served_from_cache(self):
+        post = self.make_posts(1)[0]
+        for url in ['/blog/api/posts/', f'/blog/api/posts/{post.slug}/',
+                    f'/blog/api/users/{self.author.username}/posts/',
+                    f'/blog/api/users/{self.author.username}/posts/{post.slug}/']:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.json(), second.json())
+            self.assertEqual(first['ETag'], second['ETag'])
+            self.assertIn('Last-Modified', second)
+
+    def test_conditional_get_returns_304(self):
+        post = self.make_posts(1)[0]
+        url = f'/blog/api/users/{self.author.username}/posts/{post.slug}/'
+        response = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_writes_invalidate_cached_reads(self):
+        post = self.make_posts(1)[0]
+        feed_url = f'/blog/api/users/{self.author.username}/posts/'
+        detail_url = f'/blog/api/posts/{post.slug}/'
+        etag = self.client.get(detail_url)['ETag']
+        self.assertEqual(len(self.client.get(feed_url).json()['results']), 1)
+
+        self.client.force_authenticate(self.author)
+        self.client.post(f'/blog/api/posts/{post.slug}/unpublish/')
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(feed_url).json()['results'], [])
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+        post.refresh_from_db()
+        post.status = Post.Status.PUBLISHED
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(self.client.get(detail_url).json()['title'], 'Renamed')
+
+        post.delete()
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+
+
+class MediaServingTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(256)) * 4
+        os.makedirs(os.path.join(TEST_MEDIA_ROOT, 'author'), exist_ok=True)
+        with open(os.path.join(TEST_MEDIA_ROOT, 'author', 'clip.bin'), 'wb') as f:
+            f.write(self.data)
+        self.url = '/blog/media/author/clip.bin'
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_single_and_suffix_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(self.body(response), self.data[1000:])
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+
+        response = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual(self.body(response), self.data[-24:])
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+
+    def test_unsatisfiable_range_is_416(self):
+        for header in ['bytes=1024-', 'bytes=-0']:
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        current = self.get()
+        etag, last_modified = current['ETag'], current['Last-Modified']
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=last_modified).status_code, 206)
+        # A stale validator gets the whole, current file
+        stale = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.body(stale), self.data)
+        stale = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Thu, 01 Jan 2015 00:00:00 GMT')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_conditional_get_returns_304(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(MEDIA_SERVE_MODE='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_nginx_mode_hands_off_the_transfer(self):
+        response = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/author/clip.bin')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_sendfile_mode_hands_off_the_transfer(self):
+        response = self.get()
+        self.assertEqual(response['X-Sendfile'], os.path.join(TEST_MEDIA_ROOT, 'author', 'clip.bin'))
+        self.assertEqual(response.content, b'')
+
+
+class ImageDerivativeTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(TEST_MEDIA_ROOT, 'author'), exist_ok=True)
+        Image.new('RGB', (800, 600), 'teal').save(os.path.join(TEST_MEDIA_ROOT, 'author', 'photo.png'))
+
+    def test_derivative_is_built_on_first_request_then_served(self):
+        url = '/blog/media/author/_sizes/photo.png.w640.webp'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (640, 480)))
+
+        with mock.patch('posts.serving.build_derivative') as build:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        build.assert_not_called()
+
+    def test_invalid_derivatives_are_404(self):
+        with open(os.path.join(TEST_MEDIA_ROOT, 'author', 'broken.png'), 'wb') as f:
+            f.write(b'not an image')
+        with open(os.path.join(TEST_MEDIA_ROOT, 'author', 'notes.txt'), 'w') as f:
+            f.write('text')
+        for name in ['photo.png.w123.webp', 'photo.png.w640.gif', 'notes.txt.w640.webp',
+                     'broken.png.w640.webp', 'missing.png.w640.webp']:
+            response = self.client.get(f'/blog/media/author/_sizes/{name}')
+            self.assertEqual(response.status_code, 404, name)
+
+    @override_settings(IMAGE_DERIVATIVE_WIDTHS=[320], IMAGE_DERIVATIVE_FORMATS=['avif', 'webp', 'gif'])
+    def test_srcset_lists_only_formats_pillow_can_encode(self):
+        with mock.patch('posts.images.features.check', side_effect=lambda fmt: fmt != 'avif'):
+            self.assertEqual(images.srcset('author/photo.png'), {
+                'webp': {'320': '/blog/media/author/_sizes/photo.png.w320.webp'},
+            })
+        self.assertIsNone(images.srcset('author/clip.mp4'))
+
+    def test_deleting_media_removes_its_derivatives(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(buffer, format='PNG')
+        media = Media.objects.create(
+            uploaded_by=self.author, file=SimpleUploadedFile('upload.png', buffer.getvalue()),
+            media_type=Media.MediaType.IMAGE, filename='upload.png', file_size=len(buffer.getvalue()),
+        )
+        derivative = images.derivative_name(media.file.name, 320, 'webp')
+        self.assertEqual(self.client.get(f'/blog/media/{derivative}').status_code, 200)
+
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.delete(f'/blog/api/media/{media.pk}/').status_code, 204)
+        self.assertFalse(os.path.exists(os.path.join(TEST_MEDIA_ROOT, derivative)))
+
+
+class MediaJobTests(BlogTestCase):
+    def upload(self, name='photo.png'):
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/blog/api/media/', {'file': make_image(name)}, format='multipart')
+        return response.json()['url']
+
+    def test_save_returns_before_media_is_moved(self):
+        url = self.upload()
+        response = self.client.post('/blog/api/posts/', {
+            'title': 'Trip', 'blocks': [{'id': '1', 'type': 'image', 'src': url}],
+        }, format='json')
+        self.assertEqual(response.json()['media_status'], Post.MediaStatus.SETTLING)
+        post = Post.objects.get(slug=response.json()['slug'])
+        self.assertIn('/uploads/', post.blocks[0]['src'])
+        self.assertEqual(MediaJob.objects.filter(post=post).count(), 1)
+
+        # Saves that leave the blocks alone don't queue anything
+        post.title = 'Road trip'
+        post.save()
+        self.assertEqual(MediaJob.objects.filter(post=post).count(), 1)
+
+        # Editing the blocks in place is noticed, and the queued job is reused
+        post.blocks[0]['caption'] = 'Day one'
+        self.assertEqual(post.changed_fields(), {'blocks'})
+        post.save()
+        self.assertEqual(MediaJob.objects.filter(post=post).count(), 1)
+        self.assertEqual(post.changed_fields(), set())
+
+        call_command('run_media_jobs', once=True, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.media_status, Post.MediaStatus.SETTLED)
+        self.assertIn(f'/posts/{post.slug}/photo.png', post.blocks[0]['src'])
+        self.assertEqual(post.media.get().file.name, f'author/posts/{post.slug}/photo.png')
+        self.assertFalse(MediaJob.objects.exists())
+
+        # A stale editor still holding the uploads URL is redirected and its next save is fixed up
+        stale = self.client.get(url)
+        self.assertEqual(stale.status_code, 302)
+        post.blocks = [{'id': '1', 'type': 'image', 'src': url}]
+        post.save()
+        call_command('run_media_jobs', once=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertIn(f'/posts/{post.slug}/photo.png', post.blocks[0]['src'])
+
+    def test_author_edits_made_while_the_job_runs_are_kept(self):
+        url = self.upload('edited.png')
+        slug = self.client.post('/blog/api/posts/', {
+            'title': 'Edited trip', 'blocks': [{'id': '1', 'type': 'image', 'src': url}],
+        }, format='json').json()['slug']
+
+        job = claim_next_job()
+        post = Post.objects.select_related('author').get(pk=job.post_id)
+        edited = [{'id': '1', 'type': 'image', 'src': url}, {'id': '2', 'type': 'text', 'content': 'Day one'}]
+        self.client.patch(f'/blog/api/posts/{slug}/', {'blocks': edited}, format='json')
+        post.organize_media()
+
+        post.refresh_from_db()
+        self.assertEqual(post.blocks[1]['content'], 'Day one')
+        self.assertIn('Day one', post.rendered_html)
+
+        # The job the edit queued settles the image in the edited blocks
+        job.delete()
+        call_command('run_media_jobs', once=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.blocks[1]['content'], 'Day one')
+        self.assertIn(f'/posts/{slug}/edited.png', post.blocks[0]['src'])
+        self.assertEqual(post.media_status, Post.MediaStatus.SETTLED)
+
+    def test_failed_jobs_are_retried_then_marked_failed(self):
+        post = self.make_posts(1)[0]
+        job = MediaJob.objects.create(post=post)
+
+        with override_settings(MEDIA_JOBS_MAX_ATTEMPTS=2), self.assertLogs('posts.jobs', 'WARNING'), \
+                mock.patch.object(Post, 'organize_media', side_effect=OSError('disk full')):
+            run_job(claim_next_job())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (MediaJob.Status.PENDING, 1))
+
+            MediaJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            run_job(claim_next_job())
+
+        job.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(job.status, MediaJob.Status.FAILED)
+        self.assertIn('disk full', job.last_error)
+        self.assertEqual(post.media_status, Post.MediaStatus.FAILED)
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=10)
+class ChunkedUploadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+
+    def put_part(self, session_id, number, data):
+        return self.client.generic(
+            'PUT', f'/blog/api/uploads/{session_id}/parts/{number}/', data,
+            content_type='application/octet-stream',
+        )
+
+    def test_parts_can_arrive_in_any_order_and_resume(self):
+        post = self.make_posts(1)[0]
+        payload = bytes(range(25))
+        session = self.client.post('/blog/api/uploads/', {
+            'filename': 'clip.mp4', 'size': len(payload), 'post_slug': post.slug,
+        }, format='json').json()
+        self.assertEqual(session['part_count'], 3)
+
+        self.put_part(session['id'], 2, payload[20:])
+        self.put_part(session['id'], 0, payload[:10])
+        self.assertEqual(self.put_part(session['id'], 1, payload[10:15]).status_code, 400)
+
+        resumed = self.client.get(f"/blog/api/uploads/{session['id']}/").json()
+        self.assertEqual(resumed['received_parts'], [0, 2])
+        self.assertEqual(self.client.post(f"/blog/api/uploads/{session['id']}/complete/").status_code, 400)
+
+        self.put_part(session['id'], 1, payload[10:20])
+        response = self.client.post(f"/blog/api/uploads/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 201)
+
+        media = Media.objects.get(pk=response.json()['id'])
+        self.assertEqual(media.post, post)
+        self.assertEqual(media.media_type, Media.MediaType.VIDEO)
+        self.assertEqual(media.file.name, f'author/posts/{post.slug}/clip.mp4')
+        with media.file.open('rb') as f:
+            self.assertEqual(f.read(), payload)
+        self.assertEqual(UploadSession.objects.get().media_id, media.pk)
+
+    def test_completing_twice_returns_the_same_media(self):
+        session = self.client.post('/blog/api/uploads/', {'filename': 'twice.mp4', 'size': 5}, format='json').json()
+        self.put_part(session['id'], 0, b'12345')
+
+        first = self.client.post(f"/blog/api/uploads/{session['id']}/complete/")
+        second = self.client.post(f"/blog/api/uploads/{session['id']}/complete/")
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(Media.objects.filter(filename='twice.mp4').count(), 1)
+        self.assertEqual(self.put_part(session['id'], 0, b'12345').status_code, 400)
+
+    def test_abandoned_sessions_are_cleaned_up(self):
+        session = self.client.post('/blog/api/uploads/', {'filename': 'clip.mov', 'size': 15}, format='json').json()
+        self.put_part(session['id'], 0, b'x' * 10)
+        temp_path = UploadSession.objects.get().temp_path
+        self.assertTrue(os.path.exists(temp_path))
+
+        with override_settings(UPLOAD_SESSION_TTL=-1):
+            call_command('clean_upload_sessions', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(temp_path))
+
+
+class ContentAddressedMediaTests(BlogTestCase):
+    def upload(self, post):
+        response = self.client.post('/blog/api/media/', {'file': make_image(), 'post_slug': post.slug}, format='multipart')
+        return Media.objects.get(pk=response.json()['id'])
+
+    def test_identical_uploads_share_one_blob(self):
+        self.client.force_authenticate(self.author)
+        first_post, second_post = self.make_posts(2)
+        first, second = self.upload(first_post), self.upload(second_post)
+
+        self.assertEqual(first.content_hash, second.content_hash)
+        blob = blobs.blob_path(first.content_hash)
+        self.assertTrue(os.path.samefile(first.file.path, blob))
+        self.assertTrue(os.path.samefile(second.file.path, blob))
+
+        # Removing one post's copy leaves the other intact
+        first_post.delete()
+        self.assertTrue(os.path.exists(blob))
+        with second.file.open('rb') as f:
+            self.assertEqual(f.read(), make_image().read())
+
+        # The blob goes away with its last reference
+        self.client.delete(f'/blog/api/media/{second.pk}/')
+        self.assertFalse(os.path.exists(blob))
+
+    def test_internal_stores_are_not_served(self):
+        self.client.force_authenticate(self.author)
+        media = self.upload(self.make_posts(1)[0])
+        self.assertEqual(self.client.get(f'/blog/media/{media.file.name}').status_code, 200)
+
+        blob = os.path.relpath(blobs.blob_path(media.content_hash), TEST_MEDIA_ROOT)
+        os.makedirs(os.path.join(TEST_MEDIA_ROOT, '.chunked'), exist_ok=True)
+        with open(os.path.join(TEST_MEDIA_ROOT, '.chunked', 'session.part'), 'wb') as f:
+            f.write(b'partial')
+        for path in [blob, '.chunked/session.part', f'author/../{blob}']:
+            self.assertEqual(self.client.get(f'/blog/media/{path}').status_code, 404, path)
+
+
+class SearchTests(BlogTestCase):
+    def search(self, query, **params):
+        response = self.client.get('/blog/api/posts/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def create(self, title, blocks=(), description='', status=Post.Status.PUBLISHED):
+        return Post.objects.create(
+            author=self.author, title=title, description=description, blocks=list(blocks), status=status,
+        )
+
+    def test_block_text_is_searchable_and_title_matches_rank_first(self):
+        body_match = self.create('Trip notes', blocks=[
+            {'id': '1', 'type': 'text', 'content': '<p>We finally saw the <b>glacier</b></p>'},
+            {'id': '2', 'type': 'image', 'src': '/blog/media/glacier.png'},
+        ])
+        title_match = self.create('Glacier hike')
+        self.create('Glacier draft', status=Post.Status.DRAFT)
+        code_match = self.create('Snippets', blocks=[{'id': '1', 'type': 'code', 'content': 'def parse_moraine():'}])
+
+        slugs = [post['slug'] for post in self.search('glacier')['results']]
+        self.assertEqual(slugs, [title_match.slug, body_match.slug])
+        self.assertEqual([p['slug'] for p in self.search('moraine')['results']], [code_match.slug])
+
+        # Edits are searchable straight away, and queries can't break the FTS syntax
+        body_match.blocks = [{'id': '1', 'type': 'heading', 'content': 'Fjords'}]
+        body_match.save()
+        self.assertEqual([p['slug'] for p in self.search('fjord')['results']], [body_match.slug])
+        self.assertEqual(self.search('"glacier (-')['results'][0]['slug'], title_match.slug)
+
+    def test_results_are_paginated(self):
+        self.make_posts(5)
+        first = self.search('weekly update', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+        self.assertEqual(len(third['results']), 1)
+        self.assertIsNone(third['next'])
+        slugs = {post['slug'] for page in [first, second, third] for post in page['results']}
+        self.assertEqual(len(slugs), 5)
+
+
+class RenderingTests(BlogTestCase):
+    def test_blocks_are_rendered_on_save_and_only_when_changed(self):
+        blocks = [
+            {'id': '1', 'type': 'heading', 'level': 3, 'content': 'Day <one>'},
+            {'id': '2', 'type': 'text', 'content': '<p>Walked &amp; swam ' + 'far ' * 300 + '</p>'},
+            {'id': '3', 'type': 'image', 'src': '/blog/media/a.png', 'caption': 'Beach'},
+            {'id': '4', 'type': 'code', 'language': 'css', 'content': 'body { color: red }'},
+        ]
+        with mock.patch.object(rendering, 'render_block', wraps=rendering.render_block) as render_block:
+            post = Post.objects.create(author=self.author, title='Trip', blocks=blocks, status=Post.Status.PUBLISHED)
+            self.assertEqual(render_block.call_count, 4)
+
+            # Saving without touching the blocks renders nothing
+            post.title = 'Road trip'
+            post.save()
+            self.assertEqual(render_block.call_count, 4)
+
+            post.blocks[2]['caption'] = 'Sunset'
+            post.save()
+            self.assertEqual(render_block.call_count, 8)
+
+        self.assertIn('<h3>Day &lt;one&gt;</h3>', post.rendered_html)
+        self.assertIn('<figcaption>Sunset</figcaption>', post.rendered_html)
+        self.assertNotIn('color: red', post.rendered_html)
+        self.assertTrue(post.plain_text.startswith('Day <one>\n\nWalked & swam far'))
+        self.assertEqual((post.word_count, post.reading_time), (306, 2))
+
+        detail = self.client.get(f'/blog/api/posts/{post.slug}/').json()
+        self.assertEqual(detail['rendered_html'], post.rendered_html)
+        self.assertEqual(detail['reading_time'], 2)
+
+
+class FeedTests(BlogTestCase):
+    def test_feeds_list_recent_posts_in_each_format(self):
+        post = Post.objects.create(
+            author=self.author, title='Trip', status=Post.Status.PUBLISHED,
+            blocks=[{'id': '1', 'type': 'image', 'src': '/blog/media/a.png'}],
+        )
+        other = User.objects.create_user(username='other', password='secret-pass-123')
+        self.make_posts(1, author=other)
+
+        rss = self.client.get('/blog/api/users/author/feed.rss')
+        self.assertEqual(rss['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertIn(f'http://testserver/blog/author/post/{post.slug}', rss.content.decode())
+        self.assertIn('src="http://testserver/blog/media/a.png"', rss.content.decode())
+        self.assertIn('<entry>', self.client.get('/blog/api/feed.atom').content.decode())
+
+        items = json.loads(self.client.get('/blog/api/feed.json').content)['items']
+        self.assertEqual([item['authors'][0]['name'] for item in items], ['other', 'author'])
+        self.assertEqual(self.client.get('/blog/api/users/nobody/feed.json').status_code, 404)
+
+    @override_settings(POSTS_FEED_SIZE=3)
+    def test_feed_is_bounded_and_revalidates_without_queries(self):
+        self.make_posts(5)
+        response = self.client.get('/blog/api/users/author/feed.json')
+        self.assertEqual(len(json.loads(response.content)['items']), 3)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/blog/api/users/author/feed.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.make_posts(1)
+        refreshed = self.client.get('/blog/api/users/author/feed.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(refreshed.status_code, 200)
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2)
+class SitemapTests(BlogTestCase):
+    def shard_slugs(self):
+        return [[path.rsplit('/', 1)[1] for path, _ in shard.entries] for shard in SitemapShard.objects.all()]
+
+    def test_shards_split_and_only_touched_shards_are_rebuilt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            posts = [Post.objects.create(author=self.author, title=f'Post {n}', status=Post.Status.PUBLISHED) for n in range(5)]
+        slugs = [post.slug for post in posts]
+        self.assertEqual(self.shard_slugs(), [slugs[0:2], slugs[2:4], slugs[4:5]])
+
+        with mock.patch.object(sitemaps, '_rebuild_shard', wraps=sitemaps._rebuild_shard) as rebuild_shard:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_authenticate(self.author)
+                self.client.post(f'/blog/api/posts/{slugs[1]}/unpublish/')
+        self.assertEqual([call.args[1] for call in rebuild_shard.call_args_list], [0])
+        self.assertEqual(self.shard_slugs(), [slugs[0:1], slugs[2:4], slugs[4:5]])
+
+        # Republishing moves the post to the end
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/api/posts/{slugs[1]}/publish/')
+        self.assertEqual(self.shard_slugs(), [slugs[0:1], slugs[2:4], [slugs[4], slugs[1]]])
+
+    def test_sitemap_is_served_from_the_shards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = self.make_posts(1)[0]
+
+        index = self.client.get('/blog/api/sitemap.xml')
+        self.assertEqual(index['Content-Type'], 'application/xml; charset=utf-8')
+        self.assertIn('<loc>http://testserver/blog/api/sitemap-0.xml</loc>', index.content.decode())
+        shard = self.client.get('/blog/api/sitemap-0.xml')
+        self.assertIn(f'<loc>http://testserver/blog/author/post/{post.slug}</loc>', shard.content.decode())
+        self.assertEqual(self.client.get('/blog/api/sitemap-1.xml').status_code, 404)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/blog/api/sitemap-0.xml').content, shard.content)
+
+
+class SeedBlogTests(BlogTestCase):
+    def test_seeded_posts_look_like_api_created_ones(self):
+        call_command('seed_blog', users=2, posts_per_user=5, media_per_post=3, draft_ratio=0, stdout=StringIO())
+
+        posts = Post.objects.exclude(author=self.author)
+        self.assertEqual(posts.count(), 10)
+        self.assertEqual(Media.objects.filter(post__in=posts).count(), 30)
+        post = posts.first()
+        self.assertEqual(post.render_hash, rendering.blocks_hash(post.blocks))
+        self.assertIn('block-image-row', post.rendered_html)
+        for media in post.media.all():
+            self.assertTrue(os.path.exists(blobs.blob_path(media.content_hash)))
+
+        self.assertEqual(len(self.client.get(f'/blog/api/users/{post.author.username}/posts/').json()['results']), 5)
+        self.assertEqual(sum(len(shard.entries) for shard in SitemapShard.objects.all()), 10)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=60_000)
+class ProfilingTests(BlogTestCase):
+    def timings(self, response):
+        return {metric.split(';')[0] for metric in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_breaks_down_the_request(self):
+        post = self.make_posts(1)[0]
+        response = self.client.get(f'/blog/api/posts/{post.slug}/')
+        self.assertEqual(self.timings(response), {'db', 'serialize', 'auth', 'app'})
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+        token = RefreshToken.for_user(self.author).access_token
+        response = self.client.post(
+            '/blog/api/media/', {'file': make_image(), 'post_slug': post.slug},
+            format='multipart', HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual(self.timings(response), {'db', 'serialize', 'files', 'auth', 'app'})
+
+    @override_settings(PROFILING_SLOW_MS=0)
+    def test_slow_requests_are_logged_with_their_top_queries(self):
+        self.make_posts(3)
+        with self.assertLogs('posts.profiling', 'WARNING') as logs:
+            self.client.get('/blog/api/posts/')
+        record = json.loads(logs.records[0].getMessage().split(' ', 2)[2])
+        self.assertEqual((record['path'], record['queries']), ('/blog/api/posts/', 1))
+        self.assertIn('FROM "posts_post"', record['top_queries'][0]['sql'])
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/blog/api/posts/'))
+
+
+# The API routes as an ASGI deployment (ASYNC_READS) serves them
+ASYNC_URLCONF = ModuleType('async_urls')
+ASYNC_URLCONF.urlpatterns = [
+    path('blog/api/', include(
+        async_read_patterns(post_urls.router_urls) + async_read_patterns(post_urls.user_posts_urls)
+    )),
+]
+
+
+class AsyncReadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.posts = self.make_posts(3, media_per_post=1)
+        self.draft = self.make_posts(1, status=Post.Status.DRAFT)[0]
+        self.async_client = AsyncClient()
+
+    def read_both_ways(self, url):
+        """The sync view's response, then the async view's rendered from scratch."""
+        sync_response = self.client.get(url)
+        cache.clear()
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            async_response = async_to_sync(self.async_client.get)(url)
+        return sync_response, async_response
+
+    def test_responses_match_the_sync_views(self):
+        slug = self.posts[0].slug
+        for url in [
+            '/blog/api/posts/',
+            f'/blog/api/posts/{slug}/',
+            '/blog/api/users/author/posts/',
+            f'/blog/api/users/author/posts/{slug}/',
+            '/blog/api/posts/?page_size=1',
+        ]:
+            sync_response, async_response = self.read_both_ways(url)
+            self.assertEqual(async_response.status_code, 200, url)
+            self.assertEqual(async_response.content, sync_response.content, url)
+            self.assertEqual(async_response['Content-Type'], 'application/json')
+            # Both share cache entries, so the sync view now serves what the async one stored
+            self.assertEqual(self.client.get(url)['ETag'], async_response['ETag'], url)
+
+    def test_missing_posts_get_the_same_404(self):
+        for url in [f'/blog/api/posts/{self.draft.slug}/', '/blog/api/users/nobody/posts/']:
+            sync_response, async_response = self.read_both_ways(url)
+            self.assertEqual(async_response.status_code, 404)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    def test_cached_reads_run_no_queries(self):
+        async_to_sync(self.async_client.get)('/blog/api/posts/')
+        with self.assertNumQueries(0):
+            response = async_to_sync(self.async_client.get)('/blog/api/posts/')
+        self.assertEqual(len(response.json()['results']), 3)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    def test_signed_in_reads_and_writes_use_the_sync_views(self):
+        token = RefreshToken.for_user(self.author).access_token
+        auth = {'headers': {'Authorization': f'Bearer {token}'}}
+        response = async_to_sync(self.async_client.get)(f'/blog/api/posts/{self.draft.slug}/', **auth)
+        self.assertEqual(response.json()['status'], Post.Status.DRAFT)
+
+        response = async_to_sync(self.async_client.post)(
+            '/blog/api/posts/', {'title': 'Written over ASGI'}, content_type='application/json', **auth,
+        )
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    def test_jwt_writes_pass_csrf_checks(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        auth = {'headers': {'Authorization': f'Bearer {RefreshToken.for_user(self.author).access_token}'}}
+        slug = self.posts[0].slug
+
+        response = async_to_sync(client.post)(
+            '/blog/api/posts/', {'title': 'Written over ASGI'}, content_type='application/json', **auth,
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        response = async_to_sync(client.patch)(
+            f'/blog/api/posts/{slug}/', {'description': 'Edited'}, content_type='application/json', **auth,
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        response = async_to_sync(client.delete)(f'/blog/api/posts/{slug}/', **auth)
+        self.assertEqual(response.status_code, 204)
+
+
+class MetricsTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='scrape-secret')
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def scrape(self, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', 'Bearer scrape-secret')
+        response = self.client.get('/blog/api/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    def test_requests_are_counted_by_route(self):
+        self.make_posts(2)
+        self.client.get('/blog/api/posts/')
+        self.client.get('/blog/api/posts/')
+        lines = self.scrape()
+
+        self.assertIn('blog_http_requests_total{method="GET",route="post-list",status="200"} 2', lines)
+        self.assertIn('blog_http_request_queries_bucket{le="1",route="post-list"} 2', lines)
+        self.assertIn('blog_http_request_duration_seconds_count{method="GET",route="post-list"} 2', lines)
+        self.assertIn('blog_response_cache_total{result="miss",scope="feed"} 1', lines)
+        self.assertIn('blog_response_cache_total{result="hit",scope="feed"} 1', lines)
+        # Buckets are cumulative and end at the count
+        self.assertIn('blog_http_request_duration_seconds_bucket{le="+Inf",method="GET",route="post-list"} 2', lines)
+
+    def test_values_from_every_worker_are_summed(self):
+        self.client.get('/blog/api/posts/')
+        # e.g. the media worker, in another container sharing METRICS_DIR
+        other_worker = metrics.MmapValues(os.path.join(self.directory, 'metrics-media-worker-1.db'))
+        other_worker.inc(metrics._key(metrics.REQUESTS.name, {'route': 'post-list', 'method': 'GET', 'status': '200'}), 3)
+        self.assertIn('blog_http_requests_total{method="GET",route="post-list",status="200"} 4', self.scrape())
+
+    def test_uploads_are_recorded(self):
+        post = self.make_posts(1)[0]
+        self.client.force_authenticate(self.author)
+        self.client.post('/blog/api/media/', {'file': make_image(), 'post_slug': post.slug}, format='multipart')
+        lines = self.scrape()
+        self.assertIn('blog_upload_duration_seconds_count{kind="media"} 1', lines)
+        self.assertTrue(any(line.startswith('blog_upload_bytes_total{kind="media"} ') for line in lines))
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/blog/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/blog/api/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.scrape()
+
+    def test_no_token_only_serves_under_debug(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/blog/api/metrics').status_code, 404)
+            with override_settings(DEBUG=True):
+                self.scrape(HTTP_AUTHORIZATION='')
+
+
+class PrerenderTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(PRERENDER_ROOT=self.root, PRERENDER_HTML=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_authenticate(self.author)
+
+    def read(self, path):
+        with open(os.path.join(self.root, path.strip('/'), 'index.json')) as f:
+            return json.load(f)
+
+    def test_publishing_and_unpublishing_update_the_files(self):
+        post = self.make_posts(1, status=Post.Status.DRAFT)[0]
+        detail_file = os.path.join(self.root, 'blog/api/posts', post.slug, 'index.json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/api/posts/{post.slug}/publish/')
+        self.assertEqual(self.read(f'/blog/api/posts/{post.slug}/'), self.client.get(f'/blog/api/posts/{post.slug}/').json())
+        self.assertEqual(self.read('/blog/api/users/author/posts/')['results'][0]['slug'], post.slug)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'blog/author/post', post.slug, 'index.html')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/api/posts/{post.slug}/unpublish/')
+        self.assertFalse(os.path.exists(detail_file))
+        self.assertEqual(self.read('/blog/api/posts/')['results'], [])
+
+    def test_drafts_are_not_exported(self):
+        post = self.make_posts(1, status=Post.Status.DRAFT)[0]
+        with mock.patch('posts.prerender.export_post') as export, self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/blog/api/posts/{post.slug}/', {'description': 'Autosaved'}, format='json')
+            self.client.post('/blog/api/media/', {'file': make_image(), 'post_slug': post.slug}, format='multipart')
+        export.assert_not_called()
+
+    def test_command_writes_everything_and_removes_stale_files(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            posts = self.make_posts(2)
+        stale = os.path.join(self.root, 'blog/api/posts/gone/index.json')
+        os.makedirs(os.path.dirname(stale))
+        open(stale, 'w').close()
+
+        call_command('prerender_posts', stdout=StringIO())
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(len(self.read('/blog/api/posts/')['results']), 2)
+        for post in posts:
+            self.assertEqual(self.read(f'/blog/api/users/author/posts/{post.slug}/')['id'], str(post.id))
+
+    def test_export_works_with_async_reads(self):
+        # posts.urls as config/asgi.py loads it
+        with override_settings(ASYNC_READS=True):
+            importlib.reload(post_urls)
+        self.addCleanup(importlib.reload, post_urls)
+        urlconf = ModuleType('asgi_urls')
+        urlconf.urlpatterns = [path('blog/api/', include(post_urls))]
+        override = override_settings(ROOT_URLCONF=urlconf)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.assertTrue(hasattr(resolve('/blog/api/posts/').func, 'sync_view'))
+
+        with self.captureOnCommitCallbacks(execute=False):
+            post = self.make_posts(1)[0]
+        call_command('prerender_posts', stdout=StringIO())
+        self.assertEqual(self.read(f'/blog/api/posts/{post.slug}/')['id'], str(post.id))
+
+
+class MediaAuditTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir, ignore_errors=True)
+        override = override_settings(MEDIA_AUDIT_MANIFEST=os.path.join(manifest_dir, 'manifest.json'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_audit(self, *args):
+        out = StringIO()
+        # Trust directories modified just now, so the second run can reuse the manifest
+        with mock.patch.object(audit, 'RACY_WINDOW_NS', 0):
+            call_command('clean_orphaned_media', '--json', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_orphans_are_found_and_unchanged_directories_reused(self):
+        post = self.make_posts(1, media_per_post=1)[0]
+        folder = os.path.join(TEST_MEDIA_ROOT, 'author', 'posts', post.slug)
+        with open(os.path.join(folder, 'stray.jpg'), 'wb') as f:
+            f.write(b'0' * 10)
+
+        first = self.run_audit()
+        self.assertEqual(first['orphans'], [{'path': f'author/posts/{post.slug}/stray.jpg', 'size': 10}])
+        self.assertEqual(first['scan']['dirs_reused'], 0)
+
+        second = self.run_audit('--delete', '--no-input')
+        self.assertEqual(second['deleted'], [f'author/posts/{post.slug}/stray.jpg'])
+        self.assertEqual(second['scan']['dirs_scanned'], 0)
+        self.assertFalse(os.path.exists(os.path.join(folder, 'stray.jpg')))
+
+        # Only the directory the delete touched is listed again
+        third = self.run_audit()
+        self.assertEqual(third['orphans'], [])
+        self.assertEqual(third['scan']['dirs_scanned'], 1)
+
+    def test_blobs_only_linked_from_orphans_are_deleted(self):
+        post = self.make_posts(1)[0]
+        name = f'author/posts/{post.slug}/dropped.png'
+        os.makedirs(os.path.dirname(os.path.join(TEST_MEDIA_ROOT, name)), exist_ok=True)
+        with open(os.path.join(TEST_MEDIA_ROOT, name), 'wb') as f:
+            f.write(b'dropped media')
+        digest = blobs.adopt(name)
+
+        report = self.run_audit()
+        # Other tests may leave blobs behind in the shared media root
+        self.assertIn({'hash': digest, 'size': 13}, report['orphaned_blobs'])
+
+        report = self.run_audit('--delete', '--no-input')
+        self.assertIn(name, report['deleted'])
+        self.assertIn(digest, report['deleted_blobs'])
+        self.assertFalse(os.path.exists(blobs.blob_path(digest)))
+
+
+class SlugAllocationTests(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='secret-pass-123')
+
+    def test_picks_first_free_suffix(self):
+        for slug in ['weekly-update', 'weekly-update-1', 'weekly-update-3', 'weekly-update-plan']:
+            Post.objects.create(author=self.author, title='Other', slug=slug)
+        post = Post.objects.create(author=self.author, title='Weekly update')
+        self.assertEqual(post.slug, 'weekly-update-2')
+
+    def test_losing_a_race_for_a_slug_retries(self):
+        allocate_slug = Post.allocate_slug
+        calls = []
+
+        def allocate_then_lose_race(post, spread=1):
+            slug = allocate_slug(post)
+            if not calls:
+                # Another request inserts the same slug before this one does
+                Post.objects.create(author=self.author, title='Other', slug=slug)
+            calls.append(slug)
+            return slug
+
+        with mock.patch.object(Post, 'allocate_slug', allocate_then_lose_race):
+            post = Post.objects.create(author=self.author, title='Weekly update')
+        self.assertEqual(calls, ['weekly-update', 'weekly-update-1'])
+        self.assertEqual(post.slug, 'weekly-update-1')
+
+    def test_concurrent_creates_with_same_title(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite serialises writers with table locks instead of waiting')
+        workers, per_worker = 8, 5
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def create_posts():
+            try:
+                barrier.wait()
+                for _ in range(per_worker):
+                    Post.objects.create(author=self.author, title='Weekly update')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create_posts) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        slugs = list(Post.objects.values_list('slug', flat=True))
+        self.assertEqual(len(slugs), workers * per_worker)
+        self.assertEqual(len(set(slugs)), len(slugs))
@@ -0,0 +1,77 @@
+"""
+Snapshot-on-load change tracking for models.
+
+Instances loaded from the database remember the values of their concrete
+fields, so save() can tell what changed without re-reading the row and can
+limit the UPDATE to those columns:
+
+    class Post(ChangeTrackingMixin, models.Model):
+        def save(self, *args, **kwargs):
+            if 'blocks' in self.changed_fields():
+                ...
+            super().save(*args, **self.update_fields_kwargs(kwargs))
+
+Deferred fields are never read to take a snapshot; assigning one marks it
+changed. File fields are compared by name and JSON values by deep copy, so
+editing `post.blocks` in place is noticed too.
+"""
+import copy
+
+from django.db import models
+
+
+class ChangeTrackingMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.take_snapshot(fields)
+
+    def take_snapshot(self, fields=None):
+        """Record the current values of `fields` (all loaded fields by default) as unchanged."""
+        snapshot = self.__dict__.setdefault('_loaded_values', {})
+        for field in self._tracked_fields():
+            if fields is None or field.name in fields or field.attname in fields:
+                if field.attname in self.__dict__:
+                    snapshot[field.name] = self._tracked_value(field)
+
+    def changed_fields(self):
+        """Names of fields whose value differs from the last snapshot (every set field when new)."""
+        snapshot = self.__dict__.get('_loaded_values', {})
+        return {
+            field.name
+            for field in self._tracked_fields()
+            if field.attname in self.__dict__
+            and (field.name not in snapshot or snapshot[field.name] != self._tracked_value(field))
+        }
+
+    def loaded_value(self, name, default=None):
+        """Value of field `name` as of the last snapshot, e.g. to see what a changed field was."""
+        return self.__dict__.get('_loaded_values', {}).get(name, default)
+
+    def update_fields_kwargs(self, kwargs):
+        """
+        save() kwargs that only write changed columns (plus auto_now fields)
+        when updating a loaded row. Inserts and explicit update_fields are
+        passed through untouched.
+        """
+        if (self._state.adding or kwargs.get('force_insert')
+                or kwargs.get('update_fields') is not None or '_loaded_values' not in self.__dict__):
+            return kwargs
+        auto_now = {field.name for field in self._tracked_fields() if getattr(field, 'auto_now', False)}
+        return {**kwargs, 'update_fields': self.changed_fields() | auto_now}
+
+    def _tracked_fields(self):
+        return [field for field in self._meta.concrete_fields if not field.primary_key]
+
+    def _tracked_value(self, field):
+        value = self.__dict__[field.attname]
+        if isinstance(field, models.FileField):
+            return getattr(value, 'name', value) or ''
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
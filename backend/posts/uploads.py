@@ -0,0 +1,150 @@
+"""
+Resumable chunked uploads for large media.
+
+    POST   /uploads/                  start a session (filename, size, post_slug, alt_text)
+    GET    /uploads/{id}/             which parts have arrived, for resuming
+    PUT    /uploads/{id}/parts/{n}/   raw bytes of part n (application/octet-stream)
+    POST   /uploads/{id}/complete/    create the Media row (repeats return it again)
+    DELETE /uploads/{id}/             abort
+
+Each part is streamed from the request straight to its offset in one temp
+file, and completing the upload hashes it and links it into the blob store
+and the post folder (posts/blobs.py) - the bytes are written once and never
+copied. Sessions idle for UPLOAD_SESSION_TTL seconds, finished or not, are
+removed by `manage.py clean_upload_sessions`.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs
+from .models import Media, UploadSession
+from .metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from .profiling import span
+
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def write_part(session, number, stream, length):
+    """Stream `length` bytes of part `number` from `stream` into the session's temp file."""
+    if session.media_id:
+        raise UploadError('Upload is already complete')
+    if not 0 <= number < session.part_count:
+        raise UploadError(f'Part number must be between 0 and {session.part_count - 1}')
+    expected = session.part_size(number)
+    if length != expected:
+        raise UploadError(f'Part {number} must be exactly {expected} bytes, got {length}')
+
+    os.makedirs(os.path.dirname(session.temp_path), exist_ok=True)
+    with span('files'), UPLOAD_DURATION.time(kind='part'):
+        fd = os.open(session.temp_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            offset = number * session.chunk_size
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                remaining -= len(chunk)
+        finally:
+            os.close(fd)
+
+    UPLOAD_BYTES.inc(length - remaining, kind='part')
+    if remaining:
+        raise UploadError(f'Part {number} ended early; {remaining} bytes missing')
+
+    # Lock the row so parts arriving in parallel don't overwrite each other's bookkeeping
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if number not in locked.received_parts:
+            locked.received_parts = sorted(locked.received_parts + [number])
+            locked.save(update_fields=['received_parts', 'updated_at'])
+    session.received_parts = locked.received_parts
+
+
+def complete(session):
+    """
+    Turn a fully received session into a Media row.
+
+    The session row stays locked until the Media is saved, so a retried or
+    concurrent complete waits for the first and then gets the same Media
+    back instead of linking the file a second time.
+    """
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if locked.media_id:
+            media = Media.objects.filter(pk=locked.media_id).first()
+            if media is None:
+                raise UploadError('Upload was completed and its media has since been deleted')
+            return media
+
+        missing = sorted(set(range(locked.part_count)) - set(locked.received_parts))
+        if missing:
+            raise UploadError(f'Missing parts: {missing[:20]}')
+        if locked.total_size and os.path.getsize(locked.temp_path) != locked.total_size:
+            raise UploadError('Uploaded data does not match the declared size')
+
+        media = Media(
+            post=locked.post,
+            uploaded_by=locked.uploaded_by,
+            media_type=locked.media_type,
+            filename=locked.filename,
+            file_size=locked.total_size,
+            alt_text=locked.alt_text,
+        )
+        name = media.file.field.generate_filename(media, locked.filename)
+        media.file.name, media.content_hash = _link_into_place(locked, name)
+        media.save()
+
+        locked.media_id = media.pk
+        locked.save(update_fields=['media_id', 'updated_at'])
+    session.media_id = media.pk
+    return media
+
+
+def _link_into_place(session, name):
+    """Move the temp file into the blob store and link it at a free variant of `name`."""
+    if not os.path.exists(session.temp_path):
+        # Zero-byte uploads never receive data
+        open(session.temp_path, 'wb').close()
+
+    digest = blobs.hash_file(session.temp_path)
+    name = blobs.place(session.temp_path, digest, name)
+    os.unlink(session.temp_path)
+    return name, digest
+
+
+def discard(session):
+    if os.path.exists(session.temp_path):
+        os.unlink(session.temp_path)
+    session.delete()
+
+
+def clean_expired_sessions():
+    """Delete sessions idle for longer than UPLOAD_SESSION_TTL, plus stray temp files.
+
+    Completed sessions go too; their Media rows are kept.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    removed = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard(session)
+        removed += 1
+
+    chunk_dir = os.path.join(settings.MEDIA_ROOT, '.chunked')
+    if os.path.isdir(chunk_dir):
+        live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(chunk_dir):
+            if entry.name not in live and entry.stat().st_mtime < cutoff.timestamp():
+                os.unlink(entry.path)
+                removed += 1
+    return removed
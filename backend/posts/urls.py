@@ -1,13 +1,31 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet, MediaViewSet, UserPostsView
+from . import async_views
+from .views import PostViewSet, MediaViewSet, UploadSessionViewSet, UserPostsView, feed, metrics, sitemap, sitemap_index
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')
 router.register(r'media', MediaViewSet, basename='media')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
-urlpatterns = [
-    path('', include(router.urls)),
+router_urls = router.urls
+user_posts_urls = [
     path('users/<str:username>/posts/', UserPostsView.as_view(), name='user-posts'),
     path('users/<str:username>/posts/<str:slug>/', UserPostsView.as_view(), name='user-post-detail'),
-]
\ No newline at end of file
+]
+
+# Public reads answered by async views under ASGI (posts/async_views.py)
+if settings.ASYNC_READS:
+    router_urls = async_views.async_read_patterns(router_urls)
+    user_posts_urls = async_views.async_read_patterns(user_posts_urls)
+
+urlpatterns = [
+    path('', include(router_urls)),
+    *user_posts_urls,
+    path('metrics', metrics, name='metrics'),
+    path('sitemap.xml', sitemap_index, name='sitemap-index'),
+    path('sitemap-<int:number>.xml', sitemap, name='sitemap'),
+    re_path(r'^feed\.(?P<fmt>rss|atom|json)$', feed, name='feed'),
+    re_path(r'^users/(?P<username>[^/]+)/feed\.(?P<fmt>rss|atom|json)$', feed, name='user-feed'),
+]
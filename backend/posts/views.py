@@ -1,4 +1,4 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import viewsets, mixins, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -6,36 +6,100 @@ from django.utils import timezone
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+from django.http import HttpResponse
+from django.conf import settings
+import hmac
+from io import BytesIO
 
-from .models import Post, Media
+from .models import Post, Media, UploadSession
 from .serializers import (
     PostListSerializer,
     PostDetailSerializer,
     PostCreateUpdateSerializer,
     MediaSerializer,
-    MediaUploadSerializer
+    MediaUploadSerializer,
+    UploadSessionSerializer,
+    UploadSessionCreateSerializer
 )
+from . import uploads
+from .pagination import PublishedPostPagination, DraftPostPagination, SearchPagination
+from .images import delete_derivatives
+from .cache import cached_response, post_scope, feed_scope, newest_update
+from .feeds import CONTENT_TYPES as FEED_CONTENT_TYPES, render_feed
+from . import metrics as metrics_registry
+from .sitemaps import render_index as render_sitemap_index, render_shard as render_sitemap_shard, sitemap_scope
 
 
 class UserPostsView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request, username, slug=None):
-        user = get_object_or_404(User, username=username)
-        
         if slug:
-            post = get_object_or_404(
-                Post, 
-                author=user, 
-                slug=slug, 
-                status=Post.Status.PUBLISHED
-            )
-            serializer = PostDetailSerializer(post, context={'request': request})
-        else:
-            posts = Post.objects.filter(author=user, status=Post.Status.PUBLISHED)
-            serializer = PostListSerializer(posts, many=True, context={'request': request})
-        
-        return Response(serializer.data)
+            return cached_response(request, post_scope(slug), lambda: self.render_post(request, username, slug))
+        return cached_response(request, feed_scope(username), lambda: self.render_feed(request, username))
+
+    def render_post(self, request, username, slug):
+        user = get_object_or_404(User, username=username)
+        post = get_object_or_404(
+            Post.objects.select_related('author').prefetch_related('media'),
+            author=user,
+            slug=slug,
+            status=Post.Status.PUBLISHED
+        )
+        serializer = PostDetailSerializer(post, context={'request': request})
+        return serializer.data, post.updated_at
+
+    def render_feed(self, request, username):
+        user = get_object_or_404(User, username=username)
+        posts = Post.objects.filter(author=user, status=Post.Status.PUBLISHED).select_related('author')
+        paginator = PublishedPostPagination()
+        page = paginator.paginate_queryset(posts, request, view=self)
+        serializer = PostListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data).data, newest_update(page)
+
+
+SITEMAP_CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+
+@require_safe
+def feed(request, fmt, username=None):
+    """RSS, Atom or JSON Feed of recent posts, site-wide or for one author."""
+    def render():
+        author = get_object_or_404(User, username=username) if username else None
+        return render_feed(request, fmt, author)
+
+    scope = feed_scope(username) if username else feed_scope()
+    return cached_response(request, scope, render, content_type=FEED_CONTENT_TYPES[fmt])
+
+
+@require_safe
+def sitemap_index(request):
+    return cached_response(
+        request, sitemap_scope(), lambda: render_sitemap_index(request), content_type=SITEMAP_CONTENT_TYPE,
+    )
+
+
+@require_safe
+def sitemap(request, number):
+    return cached_response(
+        request, sitemap_scope(), lambda: render_sitemap_shard(request, number), content_type=SITEMAP_CONTENT_TYPE,
+    )
+
+
+@require_safe
+def metrics(request):
+    """
+    Prometheus metrics from every worker process (posts/metrics.py). Scrapes
+    need METRICS_TOKEN; without one the endpoint only answers under DEBUG.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        return HttpResponse(status=404)
+    return HttpResponse(metrics_registry.exposition(), content_type=metrics_registry.CONTENT_TYPE)
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -48,32 +112,71 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
 class PostViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     parser_classes = [JSONParser, MultiPartParser, FormParser]
+    pagination_class = PublishedPostPagination
     lookup_field = 'slug'
     
     def get_queryset(self):
         if self.action == 'drafts':
-            return Post.objects.filter(author=self.request.user, status=Post.Status.DRAFT)
-       
-        if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'publish', 'unpublish']:
+            queryset = Post.objects.filter(author=self.request.user, status=Post.Status.DRAFT)
+        elif self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'publish', 'unpublish']:
             if self.request.user.is_authenticated:
-                return Post.objects.filter(author=self.request.user) | Post.objects.filter(status=Post.Status.PUBLISHED)
-            return Post.objects.filter(status=Post.Status.PUBLISHED)
-        
-        return Post.objects.filter(status=Post.Status.PUBLISHED)
+                queryset = Post.objects.filter(author=self.request.user) | Post.objects.filter(status=Post.Status.PUBLISHED)
+            else:
+                queryset = Post.objects.filter(status=Post.Status.PUBLISHED)
+        else:
+            queryset = Post.objects.filter(status=Post.Status.PUBLISHED)
+
+        # Eager-load everything the serializers and permission checks touch
+        queryset = queryset.select_related('author')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('media')
+        return queryset
     
     def get_serializer_class(self):
-        if self.action == 'list' or self.action == 'drafts':
+        if self.action in ['list', 'drafts', 'search']:
             return PostListSerializer
         if self.action in ['create', 'update', 'partial_update']:
             return PostCreateUpdateSerializer
         return PostDetailSerializer
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, feed_scope(), lambda: self.render_list(request, *args, **kwargs))
+
+    def render_list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        return response.data, newest_update(self.paginator.page)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Signed-in authors can see their own drafts here, so only anonymous reads are shared
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return cached_response(request, post_scope(kwargs['slug']), lambda: self.render_retrieve(request, *args, **kwargs))
+
+    def render_retrieve(self, request, *args, **kwargs):
+        post = self.get_object()
+        return self.get_serializer(post).data, post.updated_at
     
-    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated],
+            pagination_class=DraftPostPagination)
     def drafts(self, request):
         queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
+    @action(detail=False, methods=['get'], pagination_class=SearchPagination)
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'Provide a search query with ?q='}, status=status.HTTP_400_BAD_REQUEST)
+        # Results only contain published posts, so they live and die with the site feed
+        return cached_response(request, feed_scope(), lambda: self.render_search(request, query))
+
+    def render_search(self, request, query):
+        page = self.paginator.paginate_search(query, self.get_queryset(), request)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data, newest_update(page)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsAuthorOrReadOnly])
     def publish(self, request, slug=None):
         post = self.get_object()
@@ -107,7 +210,7 @@ class MediaViewSet(viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
     
     def get_queryset(self):
-        return Media.objects.filter(uploaded_by=self.request.user)
+        return Media.objects.filter(uploaded_by=self.request.user).select_related('post__author')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -122,5 +225,55 @@ class MediaViewSet(viewsets.ModelViewSet):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     def perform_destroy(self, instance):
+        delete_derivatives(instance.file.name)
         instance.file.delete(save=False)
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Resumable chunked uploads; see posts/uploads.py for the protocol."""
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(uploaded_by=self.request.user).select_related('post__author')
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return UploadSessionCreateSerializer
+        return UploadSessionSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save()
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<number>\d+)')
+    def parts(self, request, pk=None, number=None):
+        session = self.get_object()
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = -1
+        # Read the raw body so the part goes to disk without being buffered by a parser
+        try:
+            uploads.write_part(session, int(number), request.stream or BytesIO(), length)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        try:
+            media = uploads.complete(session)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(MediaSerializer(media, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
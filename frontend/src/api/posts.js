@@ -15,6 +15,12 @@ export const getDrafts = async () => {
   return response.data;
 };
 
+// Follow a paginated listing's `next` link
+export const getPage = async (url) => {
+  const response = await client.get(url);
+  return response.data;
+};
+
 export const createPost = async (data, coverImageFile = null) => {
   if (coverImageFile) {
     const formData = new FormData();
@@ -1,20 +1,36 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { getDrafts } from '../api/posts';
+import { getDrafts, getPage } from '../api/posts';
 import { useAuth } from '../hooks/useAuth';
 
 function Drafts() {
   const { user } = useAuth();
   const [drafts, setDrafts] = useState([]);
+  const [next, setNext] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     getDrafts()
-      .then(setDrafts)
+      .then((data) => {
+        setDrafts(data.results);
+        setNext(data.next);
+      })
       .catch(console.error)
       .finally(() => setLoading(false));
   }, []);
 
+  const loadMore = () => {
+    setLoadingMore(true);
+    getPage(next)
+      .then((data) => {
+        setDrafts((previous) => [...previous, ...data.results]);
+        setNext(data.next);
+      })
+      .catch(console.error)
+      .finally(() => setLoadingMore(false));
+  };
+
   if (loading) return <div>Loading...</div>;
 
   return (
@@ -34,6 +50,11 @@ function Drafts() {
           ))}
         </ul>
       )}
+      {next && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 }
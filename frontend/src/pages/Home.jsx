@@ -32,7 +32,17 @@ function Home() {
                 </div>
                 {post.cover_image_url && (
                   <div className="post-thumbnail">
-                    <img src={post.cover_image_url} alt={post.title} />
+                    <picture>
+                      {Object.entries(post.cover_image_srcset || {}).map(([format, urls]) => (
+                        <source
+                          key={format}
+                          type={`image/${format}`}
+                          sizes="200px"
+                          srcSet={Object.entries(urls).map(([width, url]) => `${url} ${width}w`).join(', ')}
+                        />
+                      ))}
+                      <img src={post.cover_image_url} alt={post.title} />
+                    </picture>
                   </div>
                 )}
               </Link>
@@ -5,16 +5,32 @@ import client from '../api/client';
 function UserBlog() {
   const { username } = useParams();
   const [posts, setPosts] = useState([]);
+  const [next, setNext] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
   useEffect(() => {
     client.get(`/users/${username}/posts/`)
-      .then((res) => setPosts(res.data))
+      .then((res) => {
+        setPosts(res.data.results);
+        setNext(res.data.next);
+      })
       .catch((err) => setError(err.response?.data?.detail || 'User not found'))
       .finally(() => setLoading(false));
   }, [username]);
 
+  const loadMore = () => {
+    setLoadingMore(true);
+    client.get(next)
+      .then((res) => {
+        setPosts((previous) => [...previous, ...res.data.results]);
+        setNext(res.data.next);
+      })
+      .catch(console.error)
+      .finally(() => setLoadingMore(false));
+  };
+
   if (loading) return <div>Loading...</div>;
   if (error) return <div className="error">{error}</div>;
 
@@ -35,6 +51,11 @@ function UserBlog() {
           ))}
         </ul>
       )}
+      {next && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 }